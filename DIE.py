@@ -16,6 +16,9 @@ from DIE.Lib.IDAConnector import *
 import DIE.Lib.DieConfig
 import DIE.Lib.DIEDb
 from DIE.Lib import DebugAPI
+from DIE.Lib.TraceReplay import TraceReplayer
+from DIE.Lib.AnalysisSnapshot import hook_analysis_changes, unhook_analysis_changes
+from DIE.Lib.CallSiteIndex import get_call_site_index
 
 import DIE.UI.BPView
 import DIE.UI.FunctionViewEx
@@ -135,6 +138,9 @@ class DieManager():
         # Save DieDB
         if self.add_menu_item_helper("Help/About program..", "DIE: Save DieDB", "", 1, self.save_db, None):  return 1
         idaapi.set_menu_item_icon("Help/DIE: Save DieDB", self.icon_list["save"])
+
+        if self.add_menu_item_helper("Help/About program..", "DIE: Replay trace", "", 1, self.replay_trace, None):  return 1
+        idaapi.set_menu_item_icon("Help/DIE: Replay trace", self.icon_list["load"])
         # Debug Here
         if self.add_menu_item_helper("Help/About program..", "DIE: Go from current location", "Alt+f", 1, self.go_here, None):  return 1
         idaapi.set_menu_item_icon("Help/DIE: Go from current location", self.icon_list["debug"])
@@ -229,6 +235,22 @@ class DieManager():
             logging.exception("Error while loading DB: %s", ex)
             return False
 
+    def replay_trace(self):
+        try:
+            trace_file = idc.AskFile(0, "*.dtr", "Replay DIE Trace File")
+            if trace_file is None:
+                return
+
+            if TraceReplayer().replay(trace_file):
+                self.show_db_details()
+
+        except DbFileMismatch as mismatch:
+            print "Error while replaying DIE trace: %s" %mismatch
+
+        except Exception as ex:
+            logging.exception("Error while replaying trace: %s", ex)
+            return False
+
 
     ###########################################################################
     # Function View
@@ -278,6 +300,15 @@ class DieManager():
         print "Functions: %d, Threads: %d" % (num_of_functions, num_of_threads)
         print "Parsed Values: %d" % numof_parsed_val
 
+        phase_stats = self.die_db.get_phase_stats()
+        for phase in sorted(phase_stats):
+            stats = phase_stats[phase]
+            print "Phase %s: count %d, p50 %.1fus, p95 %.1fus, max %.1fus" % (phase,
+                                                                              stats["count"],
+                                                                              stats["p50"] * 1e6,
+                                                                              stats["p95"] * 1e6,
+                                                                              stats["max"] * 1e6)
+
 
     def show_logo(self):
         """
@@ -326,6 +357,9 @@ class die_plugin_t(plugin_t):
             else:
                 die_manager.show_logo()
 
+            # Analysis changes are tracked for the plugin lifetime, so the call-site index is kept up to date
+            hook_analysis_changes()
+
         return idaapi.PLUGIN_KEEP
 
     def run(self, arg):
@@ -340,6 +374,14 @@ class die_plugin_t(plugin_t):
                 if response == 1:
                     die_manager.save_db()
 
+            die_manager.die_db.close_store()
+
+        unhook_analysis_changes()
+
+        # The index belongs to the closed IDB, another IDB may be opened in the same IDA process
+        get_call_site_index().save()
+        get_call_site_index().reset()
+
 
 def PLUGIN_ENTRY():
 
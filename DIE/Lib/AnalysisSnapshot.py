@@ -0,0 +1,298 @@
+__author__ = 'yanivb'
+
+import logging
+import bisect
+
+import idc
+import idaapi
+import idautils
+
+from DIE.Lib.IDAConnector import get_function_name, get_func_start_adr, get_function_end_adr, invalidate_insn_range
+from DIE.Lib.CallSiteIndex import get_call_site_index
+
+################################################################
+#
+# AnalysisSnapshot caches static analysis data queried on every
+# captured call (function boundaries and names), so the capture
+# hot path does not query the IDA database over and over.
+# The snapshot is invalidated whenever IDA`s analysis changes.
+#
+################################################################
+
+
+class AnalysisSnapshot():
+    """
+    A session wide cache of static analysis data
+    """
+
+    def __init__(self):
+
+        self.logger = logging.getLogger(__name__)
+
+        self.is_built = False
+
+        self.function_starts = set()        # Function start addresses
+        self.starts = []                    # Sorted function start addresses
+        self.ends = []                      # Function end addresses (FUNCATTR_END), aligned with self.starts
+        self.end_adrs = {}                  # Function end address cache (Key: function start ea, Value: end ea)
+
+        self.initial_functions = None       # Function start addresses at debugging session start
+
+        self.names = {}                     # Function name cache (Key: ea, Value: demangled function name)
+        self.caller_names = {}              # Calling function name cache (Key: calling ea, Value: function name)
+
+        self.function_cache = {}            # Resolved function prototypes (Key: (ea, iatEA), Value: Function)
+
+    def build(self):
+        """
+        Build the function tables from the current IDA analysis
+        """
+        self.function_starts = set()
+        self.starts = []
+        self.ends = []
+        self.end_adrs = {}
+
+        for func_ea in idautils.Functions():
+            self.starts.append(func_ea)
+            self.ends.append(idc.GetFunctionAttr(func_ea, idc.FUNCATTR_END))
+
+        self.function_starts.update(self.starts)
+        self.is_built = True
+
+    def invalidate_functions(self):
+        """
+        Invalidate the function tables (functions were added, deleted or changed)
+        """
+        self.is_built = False
+        self.invalidate_names()
+
+    def invalidate_names(self):
+        """
+        Invalidate the name caches (an item was renamed)
+        """
+        self.names = {}
+        self.caller_names = {}
+        self.function_cache = {}
+
+    def invalidate_prototype(self, ea):
+        """
+        Invalidate the cached prototypes defined at an address (a type was changed)
+        @param ea: Address of the changed type (function ea or IAT entry ea)
+        """
+        for key in self.function_cache.keys():
+            if ea in key:
+                del self.function_cache[key]
+
+    def start_session(self):
+        """
+        Start a new debugging session. The current function list is kept as the session initial function list.
+        """
+        if not self.is_built:
+            self.build()
+
+        self.initial_functions = frozenset(self.function_starts)
+
+    def is_known_function(self, ea):
+        """
+        Check if a function exists in the current analysis
+        @param ea: Function start address
+        @return: True if a function starts at ea, otherwise False
+        """
+        if not self.is_built:
+            self.build()
+
+        return ea in self.function_starts
+
+    def is_initial_function(self, ea):
+        """
+        Check if a function was part of the analysis when the debugging session started
+        @param ea: Function start address
+        @return: True if the function existed at session start, otherwise False
+        """
+        if self.initial_functions is None:
+            self.start_session()
+
+        return ea in self.initial_functions
+
+    def get_func_start_adr(self, ea):
+        """
+        Get function start address
+        @param ea: ea from within the function boundaries.
+        @return: The function start ea. If no ea found returns None.
+        """
+        if ea is None:
+            return None
+
+        if not self.is_built:
+            self.build()
+
+        index = bisect.bisect_right(self.starts, ea) - 1
+        if index >= 0 and ea < self.ends[index]:
+            return self.starts[index]
+
+        # Function tail chunks are not covered by the tables
+        return get_func_start_adr(ea)
+
+    def get_function_end_adr(self, start_ea):
+        """
+        Get function end address
+        @param start_ea: function start_ea.
+        @return: The function end ea. If no ea found returns None.
+        """
+        if start_ea is None:
+            return None
+
+        if not self.is_built:
+            self.build()
+
+        if not start_ea in self.end_adrs:
+            self.end_adrs[start_ea] = get_function_end_adr(start_ea)
+
+        return self.end_adrs[start_ea]
+
+    def get_function_name(self, ea):
+        """
+        Get the (demangled) function name
+        @param ea: Function address
+        @return: The function name
+        """
+        if not ea in self.names:
+            self.names[ea] = get_function_name(ea)
+
+        return self.names[ea]
+
+    def get_caller_name(self, calling_ea):
+        """
+        Get the name of the function containing a CALL instruction
+        @param calling_ea: The CALL instruction address
+        @return: The calling function name
+        """
+        if not calling_ea in self.caller_names:
+            self.caller_names[calling_ea] = get_function_name(calling_ea)
+
+        return self.caller_names[calling_ea]
+
+
+class PrototypeHooks(idaapi.IDB_Hooks):
+    """
+    Invalidate cached function prototypes when a type is changed
+    """
+
+    def __init__(self, snapshot):
+
+        idaapi.IDB_Hooks.__init__(self)
+        self.snapshot = snapshot
+
+    def ti_changed(self, ea, type, fnames):
+        self.snapshot.invalidate_prototype(ea)
+        return 0
+
+
+class FunctionHooks(idaapi.IDB_Hooks):
+    """
+    Invalidate the analysis snapshot (and re-index call sites) when a function is updated or its chunks change
+    """
+
+    def __init__(self, snapshot, call_site_index):
+
+        idaapi.IDB_Hooks.__init__(self)
+        self.snapshot = snapshot
+        self.call_site_index = call_site_index
+
+    def func_updated(self, pfn):
+        self.snapshot.invalidate_functions()
+        self.call_site_index.invalidate_function(pfn.startEA)
+        invalidate_insn_range(pfn.startEA, pfn.endEA)
+        return 0
+
+    def func_tail_appended(self, pfn, tail):
+        self.call_site_index.invalidate_function(pfn.startEA)
+        invalidate_insn_range(tail.startEA, tail.endEA)
+        return 0
+
+    def func_tail_removed(self, pfn, tail_ea):
+        self.call_site_index.invalidate_function(pfn.startEA)
+        return 0
+
+
+class AnalysisHooks(idaapi.IDP_Hooks):
+    """
+    Invalidate the analysis snapshot (and re-index call sites) when IDA`s analysis changes
+    """
+
+    def __init__(self, snapshot, call_site_index):
+
+        idaapi.IDP_Hooks.__init__(self)
+        self.snapshot = snapshot
+        self.call_site_index = call_site_index
+
+    def add_func(self, func):
+        self.snapshot.invalidate_functions()
+        self.call_site_index.invalidate_function(func.startEA)
+        invalidate_insn_range(func.startEA, func.endEA)
+        return 0
+
+    def del_func(self, func):
+        self.snapshot.invalidate_functions()
+        self.call_site_index.remove_function(func.startEA)
+        invalidate_insn_range(func.startEA, func.endEA)
+        return 1
+
+    def rename(self, ea, new_name):
+        self.snapshot.invalidate_names()
+        return 1
+
+
+#############################################################################
+# Singleton
+#############################################################################
+
+_analysis_snapshot = AnalysisSnapshot()
+_analysis_hooks = None
+_prototype_hooks = None
+_function_hooks = None
+
+def get_analysis_snapshot():
+    """
+    Get the global analysis snapshot instance
+    """
+    return _analysis_snapshot
+
+def hook_analysis_changes():
+    """
+    Start invalidating the analysis snapshot upon analysis changes
+    """
+    global _analysis_hooks, _prototype_hooks, _function_hooks
+
+    if _analysis_hooks is None:
+        _analysis_hooks = AnalysisHooks(_analysis_snapshot, get_call_site_index())
+        _analysis_hooks.hook()
+
+    if _prototype_hooks is None:
+        _prototype_hooks = PrototypeHooks(_analysis_snapshot)
+        _prototype_hooks.hook()
+
+    if _function_hooks is None:
+        _function_hooks = FunctionHooks(_analysis_snapshot, get_call_site_index())
+        _function_hooks.hook()
+
+    # Changes made while unhooked were missed
+    _analysis_snapshot.invalidate_functions()
+
+def unhook_analysis_changes():
+    """
+    Stop invalidating the analysis snapshot upon analysis changes
+    """
+    global _analysis_hooks, _prototype_hooks, _function_hooks
+
+    if _analysis_hooks is not None:
+        _analysis_hooks.unhook()
+        _analysis_hooks = None
+
+    if _prototype_hooks is not None:
+        _prototype_hooks.unhook()
+        _prototype_hooks = None
+
+    if _function_hooks is not None:
+        _function_hooks.unhook()
+        _function_hooks = None
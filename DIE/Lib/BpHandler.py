@@ -2,6 +2,8 @@ __author__ = 'yanivb'
 import logging
 import pickle
 import os
+import re
+from collections import OrderedDict
 
 import idaapi
 import idc
@@ -9,17 +11,285 @@ import idautils
 
 from DIE.Lib.DbgImports import StaticImports
 from DIE.Lib.IDAConnector import *
+from DIE.Lib.AnalysisSnapshot import get_analysis_snapshot
+from DIE.Lib.CallSiteIndex import get_call_site_index
 import DIE.Lib.DIEDb
 
 
 # Was user breakpoint flag definition
 WAS_USER_BREAKPOINT = 0x1
+# Disarmed breakpoint flag definition (breakpoint is listed, but not currently set in the debugger)
+BP_DISARMED = 0x2
+# API breakpoint flag definition (breakpoint is set on an imported function entry, rather than on a call-site)
+API_BREAKPOINT = 0x4
 
 # Match type definition. used for partial function name matching.
 STARTS_WITH = 0
 ENDS_WITH = 1
 CONTAINS = 2
 
+# IDC array holding the breakpoint hit counters
+BP_HITS_ARRAY = "$ DIE bp hits"
+
+def thread_cond(thread_ids):
+    """
+    Build an IDC breakpoint condition matching a set of threads
+    @param thread_ids: Thread ids to match
+    @return: The IDC expression (an empty string if no thread ids were given)
+    """
+    return " || ".join(["GetCurrentThreadId() == %d" % tid for tid in sorted(thread_ids)])
+
+class ExclusionMatcher():
+    """
+    Compiled breakpoint exclusion matcher.
+    Exclusion lists are kept in the DIE DB. The matcher keeps hashed (and compiled) copies of them, which are
+    synchronized incrementally as exclusions are added.
+    """
+
+    def __init__(self, die_db, static_imports):
+        """
+        Ctor
+        @param die_db: The DIE DB holding the exclusion lists
+        @param static_imports: Static IAT data (type: StaticImports)
+        """
+        self.die_db = die_db
+        self.iat = static_imports
+
+        self.bp_eas = set()             # Excluded breakpoint addresses
+        self.func_names = set()         # Excluded function names
+        self.module_func_names = set()  # Names of the functions imported from excluded modules
+        self.module_func_eas = set()    # Addresses of the functions imported from excluded modules
+        self.modules = set()            # Excluded module names
+        self.name_parts = []            # Excluded partial function names (list of (name_part, match_type) tuples)
+        self.name_parts_regex = None    # Compiled partial function names regex (None if not compiled yet)
+
+        # Synchronization state (Key: DB exclusion list name, Value: (list id, number of synchronized items))
+        self.synced = {}
+
+    def sync(self):
+        """
+        Synchronize the matcher with the DB exclusion lists.
+        Newly added exclusions are added incrementally, replaced or shrunk lists are rebuilt.
+        """
+        self._sync_list("excluded_bp_ea", self.bp_eas.clear, self.bp_eas.add)
+        self._sync_list("excluded_funcNames", self.func_names.clear, self.func_names.add)
+        self._sync_list("excluded_modules", self._reset_modules, self._add_module)
+        self._sync_list("excluded_funcNames_part", self._reset_name_parts, self._add_name_part)
+
+    def is_excluded_ea(self, ea):
+        return ea in self.bp_eas
+
+    def is_excluded_name(self, func_name):
+        return func_name in self.func_names
+
+    def is_module_func(self, func_name, func_ea):
+        """
+        Check if a function is imported from an excluded module
+        @param func_name: Function name (lower case)
+        @param func_ea: Function address
+        """
+        if func_name is not None and func_name in self.module_func_names:
+            return True
+
+        return func_ea is not None and func_ea in self.module_func_eas
+
+    def is_excluded_module(self, module_name):
+        return module_name.lower() in self.modules
+
+    def is_name_part_match(self, func_name):
+        """
+        Check if a function name matches any of the excluded partial function names
+        @param func_name: Function name (lower case)
+        """
+        if len(self.name_parts) == 0:
+            return False
+
+        if self.name_parts_regex is None:
+            self.name_parts_regex = re.compile("|".join([self._name_part_pattern(func_part, match_type)
+                                                         for (func_part, match_type) in self.name_parts]))
+
+        return self.name_parts_regex.search(func_name) is not None
+
+    def _sync_list(self, list_name, reset, add):
+        cur_list = getattr(self.die_db, list_name)
+        (list_id, synced_num) = self.synced.get(list_name, (None, 0))
+
+        if list_id != id(cur_list) or synced_num > len(cur_list):
+            reset()
+            synced_num = 0
+
+        if synced_num < len(cur_list):
+            for item in cur_list[synced_num:]:
+                add(item)
+
+        self.synced[list_name] = (id(cur_list), len(cur_list))
+
+    def _reset_modules(self):
+        self.modules.clear()
+        self.module_func_names.clear()
+        self.module_func_eas.clear()
+
+    def _add_module(self, module_name):
+        self.modules.add(module_name.lower())
+        for (ea, name, ord) in self.iat.iat.get(module_name.lower(), []):
+            if name is not None:
+                self.module_func_names.add(name)
+            self.module_func_eas.add(ea)
+
+    def _reset_name_parts(self):
+        self.name_parts = []
+        self.name_parts_regex = None
+
+    def _add_name_part(self, match_tup):
+        self.name_parts.append(match_tup)
+        self.name_parts_regex = None  # Recompiled upon next match
+
+    def _name_part_pattern(self, func_part, match_type):
+        if match_type == STARTS_WITH:
+            return "^" + re.escape(func_part)
+
+        if match_type == ENDS_WITH:
+            return re.escape(func_part) + r"\Z"
+
+        return re.escape(func_part)
+
+
+class BpTargetIndex():
+    """
+    Reverse index of the call-site breakpoints by their (statically resolved) call destination.
+    Used to find the breakpoints affected by a newly added exclusion without re-checking the entire breakpoint list.
+    """
+
+    def __init__(self):
+
+        self.by_name = {}       # Key: called function name (lower case), Value: set of call-site breakpoint eas
+        self.by_callee = {}     # Key: called function ea, Value: set of call-site breakpoint eas
+        self.targets = {}       # Key: call-site breakpoint ea, Value: (called function ea, called function name)
+
+    def clear(self):
+        self.by_name.clear()
+        self.by_callee.clear()
+        self.targets.clear()
+
+    def add(self, bp_ea, func_ea, func_name):
+        """
+        Index a call-site breakpoint
+        @param bp_ea: Breakpoint (CALL instruction) address
+        @param func_ea: Called function ea (None if unknown)
+        @param func_name: Called function name (None if unknown)
+        """
+        self.targets[bp_ea] = (func_ea, func_name)
+
+        if func_name is not None:
+            self.by_name.setdefault(func_name, set()).add(bp_ea)
+
+        if func_ea is not None:
+            self.by_callee.setdefault(func_ea, set()).add(bp_ea)
+
+    def remove(self, bp_ea):
+        """
+        Remove a call-site breakpoint from the index
+        @param bp_ea: Breakpoint (CALL instruction) address
+        """
+        if not bp_ea in self.targets:
+            return
+
+        (func_ea, func_name) = self.targets.pop(bp_ea)
+        self._discard(self.by_name, func_name, bp_ea)
+        self._discard(self.by_callee, func_ea, bp_ea)
+
+    def get_by_name(self, func_name):
+        """
+        Get the breakpoints set on calls to a function name
+        @return: a list of breakpoint eas
+        """
+        return list(self.by_name.get(func_name, ()))
+
+    def get_by_module(self, module_funcs):
+        """
+        Get the breakpoints set on calls to a module`s functions
+        @param module_funcs: a list of the module`s IAT entries (ea, name, ord) tuples
+        @return: a list of breakpoint eas
+        """
+        bp_eas = set()
+        for (ea, name, ord) in module_funcs:
+            if name is not None:
+                bp_eas.update(self.by_name.get(name, ()))
+            bp_eas.update(self.by_callee.get(ea, ()))
+
+        return list(bp_eas)
+
+    def get_by_name_match(self, match_func):
+        """
+        Get the breakpoints set on calls to functions whose name matches
+        @param match_func: a function name predicate
+        @return: a list of breakpoint eas
+        """
+        bp_eas = []
+        for func_name in self.by_name:
+            if match_func(func_name):
+                bp_eas.extend(self.by_name[func_name])
+
+        return bp_eas
+
+    def _discard(self, index, key, bp_ea):
+        if key is None or not key in index:
+            return
+
+        index[key].discard(bp_ea)
+        if len(index[key]) == 0:
+            del index[key]
+
+
+class BpCondition():
+    """
+    A call-site breakpoint condition, compiled into an IDC expression.
+    The condition is evaluated by IDA upon breakpoint hit, so filtered out hits never reach the debugger hooks.
+    """
+
+    def __init__(self, thread_ids=None, max_hits=0, hit_slot=None):
+        """
+        Ctor
+        @param thread_ids: Ids of the threads to stop on (None - all threads)
+        @param max_hits: Maximal number of stops (0 - no limit)
+        @param hit_slot: Index of the breakpoint hit counter in the hits array (required if max_hits is set)
+        """
+        self.thread_ids = thread_ids
+        self.max_hits = max_hits
+        self.hit_slot = hit_slot
+
+        self.target_expr = None         # IDC expression of the call target (indirect calls only, e.g "EAX")
+        self.excluded_targets = set()   # Call target addresses that should not stop
+        self.predicates = []            # Additional IDC predicates (i.e register or argument values)
+
+    def compile(self, hits_array_id):
+        """
+        Compile the IDC condition expression
+        @param hits_array_id: Id of the IDC hits array
+        @return: The IDC expression (an empty string if the breakpoint should always stop)
+        """
+        terms = []
+
+        if self.thread_ids:
+            terms.append("(%s)" % thread_cond(self.thread_ids))
+
+        if self.target_expr is not None:
+            for target_ea in self.excluded_targets:
+                terms.append("%s != 0x%x" % (self.target_expr, target_ea))
+
+        for predicate in self.predicates:
+            terms.append("(%s)" % predicate)
+
+        # Hits are counted last, so only stops passing all other terms are counted. (65 is AR_LONG)
+        if self.max_hits > 0 and self.hit_slot is not None:
+            terms.append("SetArrayLong(%d, %d, GetArrayElement(65, %d, %d) + 1)" %
+                         (hits_array_id, self.hit_slot, hits_array_id, self.hit_slot))
+            terms.append("GetArrayElement(65, %d, %d) <= %d" %
+                         (hits_array_id, self.hit_slot, self.max_hits))
+
+        return " && ".join(terms)
+
+
 class BpHandler():
     """
     Main breakpoint handling class.
@@ -33,11 +303,33 @@ class BpHandler():
 
         self.iat = StaticImports()              # Static IAT
         self.die_db = DIE.Lib.DIEDb.get_db()    # DIE DB
+        self.analysis_snapshot = get_analysis_snapshot()  # Static analysis cache
+        self.call_site_index = get_call_site_index()      # Persistent CALL instruction index
+        self.exclusions = ExclusionMatcher(self.die_db, self.iat)  # Compiled exclusion lists
+        self.bp_targets = BpTargetIndex()       # Call-site breakpoints by call destination
 
         # Walked function list is used with dynamic (runtime) breakpointing
         # it keeps track of previously walked functions in order to avoid walking them again.
         self.walked_functions = {}
 
+        # Return address breakpoints used by the return breakpoint engine.
+        # Key: return address, Value: list of (thread_id, stack_pointer) tuples of the frames waiting for it.
+        self.ret_bps = {}
+        self.owned_ret_bps = []     # Return addresses on which a breakpoint was explicitly set for returns
+
+        # Breakpoint budget. when set, call-site breakpoints are armed once their containing function is entered
+        # and the least recently entered functions are disarmed to keep the number of armed breakpoints in budget.
+        self.bp_budget = 0
+        self.armed_functions = OrderedDict()    # Key: function start ea, Value: list of breakpoint eas armed for it
+        self.armed_count = 0                    # Number of breakpoints armed by the budget manager
+
+        # Breakpoint conditions (see BpCondition)
+        self.bp_conditions = {}     # Key: breakpoint ea, Value: BpCondition
+        self.thread_filter = None   # Thread ids to stop on (None - all threads)
+        self.max_bp_hits = 0        # Maximal number of stops per call-site breakpoint (0 - no limit)
+        self.hits_array_id = None   # Id of the IDC hit counters array
+        self.next_hit_slot = 0      # Next free hit counter index
+
     ###############################################################################################
     #   Public properties
 
@@ -66,14 +358,26 @@ class BpHandler():
 
     def setBPs(self):
         """
-        Set breakpoints on all CALL and RET instructions in all of the executable sections.
+        Set breakpoints on all CALL instructions in all of the executable sections.
+        If a breakpoint budget is set, breakpoints are only listed and the entry point functions are armed.
+        Other functions are armed once entered through an armed call site or as a thread start (see bp_budget in
+        DieConfig for the code this can not see).
         """
-        for seg_ea in idautils.Segments():
-            for head in idautils.Heads(seg_ea, idc.SegEnd(seg_ea)):
-                if idc.isCode(idc.GetFlags(head)):
-                    # Add BP if instruction is a CALL
-                    if is_call(head):
-                        self.addBP(head)
+        is_armed = (self.bp_budget == 0)
+
+        for call_ea in self.call_site_index.get_call_eas():
+            self.addBP(call_ea, is_armed=is_armed)
+
+        if not is_armed:
+            for (index, ordinal, ea, name) in idautils.Entries():
+                self.arm_function(ea)
+
+    def set_bp_budget(self, bp_budget):
+        """
+        Set the breakpoint budget
+        @param bp_budget: Maximal number of simultaneously armed call-site breakpoints (0 - no limit)
+        """
+        self.bp_budget = max(0, bp_budget)
 
     def unsetBPs(self):
         """
@@ -86,9 +390,26 @@ class BpHandler():
                 if bp_flags & WAS_USER_BREAKPOINT:
                     return
 
-                idc.DelBpt(ea)  # Remove breakpoint
+                if not bp_flags & BP_DISARMED:
+                    idc.DelBpt(ea)  # Remove breakpoint
 
             self.die_db.bp_list.clear()  # Clear the breakpoint list.
+            self.bp_targets.clear()
+            self.armed_functions.clear()
+            self.armed_count = 0
+
+            self.bp_conditions.clear()
+            if self.hits_array_id is not None:
+                idc.DeleteArray(self.hits_array_id)
+                self.hits_array_id = None
+                self.next_hit_slot = 0
+
+            # Remove any pending return address breakpoints
+            for ea in self.owned_ret_bps:
+                idc.DelBpt(ea)
+
+            self.ret_bps.clear()
+            del self.owned_ret_bps[:]
 
             # Clear walked function list if necessary.
             if self.walked_functions is not None:
@@ -97,11 +418,12 @@ class BpHandler():
         except Exception as ex:
             self.logger.error("Failed to remove breakpoints: %s", ex)
 
-    def addBP(self, ea, bp_description=None):
+    def addBP(self, ea, bp_description=None, is_armed=True):
         """
         Add a breakpoint
         @param ea: The location address to add the breakpoint
         @param bp_description: A breakpoint description
+        @param is_armed: if False, the breakpoint is only listed (to be armed later by arm_function)
         @return: True if breakpoint was added, otherwise False. Returns -1 if an error occurred.
         """
         try:
@@ -115,8 +437,14 @@ class BpHandler():
                 # Check if breakpoint is not excluded.
                 if self.is_exception_call(ea):
                     return False
+                self.bp_targets.add(ea, *self.get_called_func_data(ea))
+                if not is_armed:
+                    self.die_db.bp_list[ea] = (BP_DISARMED, bp_description)
+                    return True
+
                 self.die_db.bp_list[ea] = (0, bp_description)
                 idc.AddBpt(ea)
+                self._apply_condition(ea)
 
             return True
 
@@ -138,8 +466,11 @@ class BpHandler():
             if bp_flags & WAS_USER_BREAKPOINT:
                 return True
 
-            idc.DelBpt(ea)           # Remove breakpoint
+            if not bp_flags & BP_DISARMED:
+                idc.DelBpt(ea)           # Remove breakpoint
             self.die_db.bp_list.pop(ea)     # Remove from breakpoint list
+            self.bp_targets.remove(ea)
+            self.bp_conditions.pop(ea, None)
 
             return True
 
@@ -147,6 +478,392 @@ class BpHandler():
             self.logger.error("Could not remove breakpoint: %s", ex)
             return -1
 
+    def is_armed_bp(self, ea):
+        """
+        Check if a listed breakpoint is currently set in the debugger
+        @param ea: Breakpoint address
+        @return: True if the breakpoint is listed and armed, otherwise False
+        """
+        if not ea in self.die_db.bp_list:
+            return False
+
+        (bp_flags, bp_desc) = self.die_db.bp_list[ea]
+        return not bp_flags & BP_DISARMED
+
+    ###############################################################################################
+    #   Breakpoint budget
+
+    def arm_function(self, ea):
+        """
+        Arm the call-site breakpoints of a function being entered.
+        If the breakpoint budget is exceeded, the breakpoints of the least recently entered functions are disarmed.
+        @param ea: An address within the entered function
+        """
+        if self.bp_budget == 0:
+            return
+
+        try:
+            func_ea = self.analysis_snapshot.get_func_start_adr(ea)
+            if func_ea is None:
+                return
+
+            # Already armed, just mark as recently used
+            if func_ea in self.armed_functions:
+                self.armed_functions[func_ea] = self.armed_functions.pop(func_ea)
+                return
+
+            armed_eas = []
+            for call_ea in self.call_site_index.get_function_call_eas(func_ea):
+                if not call_ea in self.die_db.bp_list:
+                    continue    # Excluded call site
+
+                (bp_flags, bp_desc) = self.die_db.bp_list[call_ea]
+                if bp_flags & BP_DISARMED:
+                    if call_ea in self.owned_ret_bps:
+                        # A return breakpoint is already set here, take it over (and drop its thread condition)
+                        self.owned_ret_bps.remove(call_ea)
+                        idc.SetBptCnd(call_ea, "")
+                    else:
+                        idc.AddBpt(call_ea)
+
+                    self.die_db.bp_list[call_ea] = (bp_flags & ~BP_DISARMED, bp_desc)
+                    self._apply_condition(call_ea)
+                    armed_eas.append(call_ea)
+
+            self.armed_functions[func_ea] = armed_eas
+            self.armed_count += len(armed_eas)
+
+            # Evict cold functions (never the function being entered)
+            while self.armed_count > self.bp_budget and len(self.armed_functions) > 1:
+                (cold_func_ea, cold_eas) = self.armed_functions.popitem(last=False)
+                self._disarm(cold_eas)
+                self.armed_count -= len(cold_eas)
+
+        except Exception as ex:
+            self.logger.error("Failed to arm function breakpoints at %s: %s", hex(ea), ex)
+
+    def _disarm(self, bp_eas):
+        for bp_ea in bp_eas:
+            if not bp_ea in self.die_db.bp_list:
+                continue    # Removed since armed
+
+            (bp_flags, bp_desc) = self.die_db.bp_list[bp_ea]
+            if not bp_flags & (BP_DISARMED | WAS_USER_BREAKPOINT):
+                if bp_ea in self.ret_bps:
+                    # A return is still awaited here, the breakpoint is removed once it is reached
+                    self.owned_ret_bps.append(bp_ea)
+                    self._update_ret_bp_cond(bp_ea)
+                else:
+                    idc.DelBpt(bp_ea)
+
+                self.die_db.bp_list[bp_ea] = (bp_flags | BP_DISARMED, bp_desc)
+
+    ###############################################################################################
+    #   API breakpoints
+
+    def set_api_bps(self, rt_import_table, api_filter=None):
+        """
+        Set breakpoints on the runtime entry points of imported functions (API trace mode)
+        @param rt_import_table: Runtime import table (see DbgImports.rt_import_table)
+        @param api_filter: a comma separated list of selected imports. Each entry is either a module name
+                           (i.e "kernel32") or a module and function name (i.e "kernel32!createfilew", "*!send").
+                           If empty or None, all imports are selected.
+        @return: Number of API breakpoints set
+        """
+        selected_modules = set()
+        selected_funcs = set()  # (module_name, func_name) tuples, module_name may be "*"
+
+        for entry in (api_filter or "").lower().split(","):
+            entry = entry.strip()
+            if not entry:
+                continue
+
+            if "!" in entry:
+                (module_name, func_name) = entry.split("!", 1)
+                selected_funcs.add((module_name.strip(), func_name.strip()))
+            else:
+                selected_modules.add(entry)
+
+        is_select_all = len(selected_modules) == 0 and len(selected_funcs) == 0
+
+        bp_count = 0
+        for (func_ea, (module_name, iat_ea, func_name, ord)) in rt_import_table.items():
+            if func_name is not None:
+                func_name = func_name.lower()
+
+            if not is_select_all and not module_name in selected_modules and \
+               not (module_name, func_name) in selected_funcs and not ("*", func_name) in selected_funcs:
+                continue
+
+            if self.is_exception_func(func_ea, iat_ea):
+                continue
+
+            self.exclusions.sync()
+            if self.exclusions.is_module_func(func_name, iat_ea):
+                continue
+
+            if self.add_api_bp(func_ea, "%s!%s" % (module_name, func_name or "#%d" % ord)):
+                bp_count += 1
+
+        self.logger.info("%d API breakpoints were set", bp_count)
+        return bp_count
+
+    def add_api_bp(self, ea, bp_description=None):
+        """
+        Add a breakpoint on an imported function entry point
+        @param ea: The function runtime address
+        @param bp_description: A breakpoint description
+        @return: True if breakpoint was added, otherwise False. Returns -1 if an error occurred.
+        """
+        try:
+            if ea in self.die_db.bp_list:
+                return False
+
+            if idc.CheckBpt(ea) > 0:
+                self.die_db.bp_list[ea] = (WAS_USER_BREAKPOINT | API_BREAKPOINT, bp_description)
+            else:
+                self.die_db.bp_list[ea] = (API_BREAKPOINT, bp_description)
+                idc.AddBpt(ea)
+                self._apply_condition(ea)
+
+            return True
+
+        except Exception as ex:
+            self.logger.error("Could not add API breakpoint: %s", ex)
+            return -1
+
+    def is_api_bp(self, ea):
+        """
+        Check if an API breakpoint is set at an address
+        @param ea: The address to check
+        @return: True if an API breakpoint is set at ea, otherwise False
+        """
+        if not ea in self.die_db.bp_list:
+            return False
+
+        (bp_flags, bp_desc) = self.die_db.bp_list[ea]
+        return bp_flags & API_BREAKPOINT != 0
+
+    ###############################################################################################
+    #   Breakpoint conditions
+
+    def set_bp_filters(self, thread_ids=None, max_hits=0):
+        """
+        Set the filters applied to every call-site breakpoint added from now on.
+        Called once per debugging session, so the breakpoint hit counters are reset as well.
+        @param thread_ids: Ids of the threads to stop on (None - all threads)
+        @param max_hits: Maximal number of stops per call-site breakpoint (0 - no limit)
+        """
+        self.thread_filter = set(thread_ids) if thread_ids else None
+        self.max_bp_hits = max(0, max_hits)
+
+        self.reset_hit_counters()
+
+    def reset_hit_counters(self):
+        """
+        Reset the breakpoint hit counters.
+        The IDC hits array is kept in the IDB, so it is recreated rather than reused (otherwise counters of a
+        previous session would keep filtering out breakpoints).
+        @return: True if counters were reset, otherwise False
+        """
+        try:
+            array_id = idc.GetArrayId(BP_HITS_ARRAY)
+            if array_id != -1:
+                idc.DeleteArray(array_id)
+
+            self.hits_array_id = None
+
+            # Conditions of breakpoints left from a previous run refer to the deleted array
+            for ea in self.bp_conditions:
+                self._apply_condition(ea)
+
+            return True
+
+        except Exception as ex:
+            self.logger.error("Failed to reset breakpoint hit counters: %s", ex)
+            return False
+
+    def exclude_call_target(self, ea, target_ea):
+        """
+        Prevent a call-site breakpoint from stopping when calling a specific target.
+        Only possible for indirect calls through a register, where the target can be evaluated upon hit.
+        @param ea: The CALL instruction address
+        @param target_ea: The excluded call target
+        @return: True if the call target was excluded, otherwise False (breakpoint should be removed instead)
+        """
+        try:
+            if not self.is_armed_bp(ea) or not is_call(ea) or idc.GetOpType(ea, 0) != idc.o_reg:
+                return False
+
+            condition = self._get_condition(ea)
+            condition.target_expr = idc.GetOpnd(ea, 0).upper()
+            condition.excluded_targets.add(target_ea)
+
+            self._apply_condition(ea)
+            return True
+
+        except Exception as ex:
+            self.logger.error("Failed to exclude call target %s at %s: %s", hex(target_ea), hex(ea), ex)
+            return False
+
+    def add_bp_predicate(self, ea, predicate):
+        """
+        Add an IDC predicate to a call-site breakpoint condition (i.e "ECX != 0")
+        @param ea: Breakpoint address
+        @param predicate: An IDC expression, the breakpoint only stops if it evaluates to non zero
+        @return: True if the predicate was added, otherwise False
+        """
+        if not ea in self.die_db.bp_list:
+            return False
+
+        self._get_condition(ea).predicates.append(predicate)
+        self._apply_condition(ea)
+        return True
+
+    def _get_condition(self, ea):
+        if not ea in self.bp_conditions:
+            hit_slot = None
+            if self.max_bp_hits > 0:
+                hit_slot = self.next_hit_slot
+                self.next_hit_slot += 1
+
+            self.bp_conditions[ea] = BpCondition(self.thread_filter, self.max_bp_hits, hit_slot)
+
+        return self.bp_conditions[ea]
+
+    def _get_hits_array(self):
+        if self.hits_array_id is None:
+            self.hits_array_id = idc.GetArrayId(BP_HITS_ARRAY)
+            if self.hits_array_id == -1:
+                self.hits_array_id = idc.CreateArray(BP_HITS_ARRAY)
+
+        return self.hits_array_id
+
+    def _apply_condition(self, ea):
+        """
+        Set the IDC condition of an armed call-site breakpoint
+        @param ea: Breakpoint address
+        """
+        if not self.is_armed_bp(ea):
+            return
+
+        (bp_flags, bp_desc) = self.die_db.bp_list[ea]
+        if bp_flags & WAS_USER_BREAKPOINT:
+            return
+
+        if not ea in self.bp_conditions and self.thread_filter is None and self.max_bp_hits == 0:
+            return
+
+        cond = self._get_condition(ea).compile(self._get_hits_array())
+
+        # Awaited returns at this address must stop regardless of the call-site condition
+        if cond and ea in self.ret_bps:
+            ret_cond = thread_cond(set([frame[0] for frame in self.ret_bps[ea]]))
+            cond = "(%s) || (%s)" % (ret_cond, cond)
+
+        idc.SetBptCnd(ea, cond)
+
+    ###############################################################################################
+    #   Return address breakpoints
+
+    def add_ret_bp(self, ea, thread_id, sp, is_captured=True):
+        """
+        Add a temporary thread filtered breakpoint on a function return address
+        @param ea: The return address
+        @param thread_id: Id of the thread waiting for the return
+        @param sp: Stack pointer value upon function entry (used to match recursive calls)
+        @param is_captured: Should the return context be captured (False for skipped function calls)
+        @return: True if breakpoint was added, otherwise False. Returns -1 if an error occurred.
+        """
+        try:
+            if ea is None:
+                return False
+
+            if not ea in self.ret_bps:
+                self.ret_bps[ea] = []
+
+                # Only set a breakpoint if none exists at this address already (DIE call bp or user bp)
+                if idc.CheckBpt(ea) <= 0:
+                    idc.AddBpt(ea)
+                    self.owned_ret_bps.append(ea)
+
+            self.ret_bps[ea].append((thread_id, sp, is_captured))
+            self._update_ret_bp_cond(ea)
+
+            return True
+
+        except Exception as ex:
+            self.logger.error("Could not add return breakpoint: %s", ex)
+            return -1
+
+    def is_ret_bp(self, ea):
+        """
+        Check if a return address breakpoint is set at an address
+        @param ea: The address to check
+        @return: True if a return is awaited at this address, otherwise False
+        """
+        return ea in self.ret_bps
+
+    def pop_ret_bp(self, ea, thread_id, sp):
+        """
+        Match a hit return address breakpoint against the frames waiting for it, and remove the matched frame.
+        The breakpoint is removed once no more frames are waiting for it.
+        @param ea: The return address
+        @param thread_id: Current thread id
+        @param sp: Current stack pointer value
+        @return: If a waiting frame was matched (i.e function has returned), its is_captured flag (see add_ret_bp).
+                 Otherwise None.
+        """
+        try:
+            if not ea in self.ret_bps:
+                return None
+
+            waiting_frames = self.ret_bps[ea]
+
+            # The inner most frame of this thread returns first.
+            # A frame has returned only if the stack was unwound past its entry stack pointer.
+            for frame_index in xrange(len(waiting_frames) - 1, -1, -1):
+                (frame_tid, frame_sp, is_captured) = waiting_frames[frame_index]
+                if frame_tid == thread_id:
+                    if sp <= frame_sp:
+                        return None
+
+                    del waiting_frames[frame_index]
+                    break
+            else:
+                return None
+
+            if len(waiting_frames) == 0:
+                del self.ret_bps[ea]
+                if ea in self.owned_ret_bps:
+                    idc.DelBpt(ea)
+                    self.owned_ret_bps.remove(ea)
+                else:
+                    self._apply_condition(ea)
+            else:
+                self._update_ret_bp_cond(ea)
+
+            return is_captured
+
+        except Exception as ex:
+            self.logger.error("Could not remove return breakpoint: %s", ex)
+            return None
+
+    def _update_ret_bp_cond(self, ea):
+        """
+        Set the return breakpoint condition so it only breaks on threads that are waiting for it.
+        Return breakpoints that share an address with a conditioned call-site breakpoint extend its condition,
+        return breakpoints that share an address with any other breakpoint are left unconditioned.
+        @param ea: The return address
+        """
+        if not ea in self.owned_ret_bps:
+            self._apply_condition(ea)
+            return
+
+        cond = thread_cond(set([frame[0] for frame in self.ret_bps[ea]]))
+
+        idc.SetBptCnd(ea, cond)
+
     ###############################################################################################
     #   Breakpoint exception handling functions
 
@@ -158,8 +875,10 @@ class BpHandler():
         @return: True if the given address is to be excepted from breakpoint list, otherwise False
         """
         try:
+            self.exclusions.sync()
+
             # Check if in excluded breakpoint addresses list
-            if ea in self.die_db.excluded_bp_ea:
+            if self.exclusions.is_excluded_ea(ea):
                 return True
 
             # Try to extract function name. if extraction failed no further checks can be made.
@@ -168,31 +887,19 @@ class BpHandler():
                 return False
 
             # Check if called function name is part of an excluded module
-            for module_name in self.die_db.excluded_modules:
-                if self.iat.is_module_call(func_name, module_name, func_ea):
-                    return True
+            if self.exclusions.is_module_func(func_name, func_ea):
+                return True
 
             # Next checks check for function name matching. they are irrelevant if no function name is available.
             if func_name is None:
                 return False
 
             # Check if called function name is in excluded function name list.
-            if func_name in self.die_db.excluded_funcNames:
+            if self.exclusions.is_excluded_name(func_name):
                 return True
 
-            for func_part, match_type in self.die_db.excluded_funcNames_part:
-
-                if match_type == STARTS_WITH:
-                    if func_name.startswith(func_part):
-                        return True
-
-                if match_type == ENDS_WITH:
-                    if func_name.endswith(func_part):
-                        return True
-
-                if match_type == CONTAINS:
-                    if func_name.find(func_part) != -1:
-                        return True
+            if self.exclusions.is_name_part_match(func_name):
+                return True
 
             # Feeeew, Nothing matched..
             return False
@@ -201,11 +908,12 @@ class BpHandler():
             self.logger.error("Failed to check for breakpoint exception: %s", ex)
             return False
 
-    def is_exception_func(self, ea, iatEA):
+    def is_exception_func(self, ea, iatEA, library_name=None):
         """
         Check if the address is part of an excluded function.
         @param ea: An address from within the function boundaries
         @param iatEA: An address of the function in the IAT
+        @param library_name: Name of the containing library (for library functions)
         @return: True if the given address is excepted from breakpoint list, otherwise False
         """
         try:
@@ -214,9 +922,13 @@ class BpHandler():
             if iatEA is not None:
                 func_adr = iatEA
 
-            func_name = get_function_name(func_adr)
+            func_name = self.analysis_snapshot.get_function_name(func_adr)
 
-            if func_name in self.die_db.excluded_funcNames:
+            self.exclusions.sync()
+            if self.exclusions.is_excluded_name(func_name):
+                return True
+
+            if library_name is not None and self.exclusions.is_excluded_module(library_name):
                 return True
 
             return False
@@ -244,6 +956,24 @@ class BpHandler():
             self.logger.error("Failed while reloading exceptions: %s", ex)
             return False
 
+    def remove_excepted_bps(self, bp_eas):
+        """
+        Remove the breakpoints affected by a newly added exception.
+        Unlike reload_bps, only the given breakpoints are checked (see BpTargetIndex).
+        @param bp_eas: a list of breakpoint addresses
+        @return: True if bps were removed sucessfully, otherwise False.
+        """
+        try:
+            for bp_ea in bp_eas:
+                if self.removeBP(bp_ea):
+                    self.logger.debug("breakpoint exception removed from %s", hex(bp_ea))
+
+            return True
+
+        except Exception as ex:
+            self.logger.error("Failed while removing excepted breakpoints: %s", ex)
+            return False
+
     def add_module_exception(self, module_name, reload_bps=False):
         """
         Add a loaded module name (i.e "user32") to be excepted.
@@ -266,7 +996,7 @@ class BpHandler():
             self.die_db.excluded_modules.append(module_name)
 
             if reload_bps:
-                self.reload_bps()
+                self.remove_excepted_bps(self.bp_targets.get_by_module(self.iat.iat.get(module_name, [])))
 
             return True
 
@@ -293,7 +1023,7 @@ class BpHandler():
             self.die_db.excluded_bp_ea.append(ea)
 
             if reload_bps:
-                self.reload_bps()
+                self.remove_excepted_bps([ea])
 
         except Exception as ex:
             self.logger.error("Could not add address %s to excluded address list: %s", hex(ea), ex)
@@ -322,7 +1052,7 @@ class BpHandler():
             self.die_db.excluded_funcNames.append(funcName)
 
             if reload_bps:
-                self.reload_bps()
+                self.remove_excepted_bps(self.bp_targets.get_by_name(funcName))
 
         except Exception as ex:
             self.logger.error("Could not add function name %s to excluded function names list:", funcName, ex)
@@ -363,7 +1093,9 @@ class BpHandler():
             self.die_db.excluded_funcNames_part.append(match_tup)
 
             if reload_bps:
-                self.reload_bps()
+                name_part_regex = re.compile(self.exclusions._name_part_pattern(func_name_part, match_type))
+                self.remove_excepted_bps(self.bp_targets.get_by_name_match(
+                    lambda func_name: name_part_regex.search(func_name) is not None))
 
         except Exception as ex:
             self.logger.error("Could not add partial function name %s "
@@ -381,7 +1113,13 @@ class BpHandler():
             func_name = None
             call_dest = None
 
-            if idc.isCode(idc.GetFlags(ea)):
+            # Indexed CALL instructions have their call destination already resolved
+            if self.call_site_index.is_call_site(ea):
+                call_dest = self.call_site_index.get_callee(ea)
+                if call_dest is not None:
+                    func_name = self.analysis_snapshot.get_function_name(call_dest).lower()
+
+            elif idc.isCode(idc.GetFlags(ea)):
                 if is_call(ea):
                     operand_type = idc.GetOpType(ea, 0)
                     if operand_type == 5 or operand_type == 6 or operand_type == 7 or operand_type == 2:
@@ -404,7 +1142,7 @@ class BpHandler():
         @return: True if function walked succeeded or False otherwise
         """
         try:
-            function_name = get_function_name(ea)
+            function_name = self.analysis_snapshot.get_function_name(ea)
             if function_name in self.walked_functions:
                 self.logger.debug("No breakpoints will be set in function %s, "
                                   "since it was already walked before.", function_name)
@@ -413,15 +1151,11 @@ class BpHandler():
             # Add function to walked function list
             self.walked_functions[function_name] = ea
 
-            start_adrs = get_func_start_adr(ea)
-            end_adrs = get_function_end_adr(ea)
+            start_adrs = self.analysis_snapshot.get_func_start_adr(ea)
 
-            # Walk function and place breakpoints on every call instruction found.
-            for head in idautils.Heads(start_adrs, end_adrs):
-                if idc.isCode(idc.GetFlags(head)):
-                    # Add BP if instruction is a CALL
-                    if is_call(head):
-                        self.addBP(head)
+            # Place breakpoints on every call instruction found in the function.
+            for call_ea in self.call_site_index.get_function_call_eas(start_adrs):
+                self.addBP(call_ea)
 
             self.logger.debug("Function %s was successfully walked for breakpoints", function_name)
             return True
@@ -0,0 +1,302 @@
+__author__ = 'yanivb'
+
+import logging
+import pickle
+
+import idc
+import idaapi
+import idautils
+
+from DIE.Lib.IDAConnector import is_call
+
+################################################################
+#
+# CallSiteIndex holds every CALL instruction of the analyzed
+# file along with its statically resolved call destination.
+# The index is built once and persisted in the IDB (netnode),
+# so breakpoints can be set without walking the entire file.
+# Addresses are kept along with the image base they were indexed
+# at, and are shifted whenever the program is rebased.
+#
+################################################################
+
+INDEX_NETNODE = "$ DIE call-site index"
+INDEX_VERSION = 2
+
+# Call operand types with a statically known call destination (o_mem, o_far, o_near, o_displ)
+STATIC_CALL_OPTYPES = (2, 5, 6, 7)
+
+
+class CallSiteIndex():
+    """
+    Call-site index (function -> CALL instruction addresses -> statically resolved callee).
+    Functions are re-indexed incrementally when they are (re)analyzed.
+    """
+
+    def __init__(self):
+
+        self.logger = logging.getLogger(__name__)
+
+        self.is_loaded = False
+        self.is_changed = False         # Was the index changed since it was last saved
+
+        self.md5 = None
+        self.image_base = None          # Image base the addresses were indexed at
+        self.functions = {}             # Key: function start ea (None for code outside functions), Value: call eas
+        self.callees = {}               # Key: call ea, Value: statically resolved callee ea (or None)
+
+        self.dirty_functions = set()    # Functions waiting to be re-indexed
+
+    ###############################################################################################
+    #   Queries
+
+    def get_call_eas(self):
+        """
+        Get all indexed CALL instruction addresses
+        @return: a list of CALL instruction addresses
+        """
+        self.update()
+        return self.callees.keys()
+
+    def get_function_call_eas(self, func_ea):
+        """
+        Get the CALL instruction addresses of a function
+        @param func_ea: Function start address
+        @return: a list of CALL instruction addresses
+        """
+        self.update()
+
+        if not func_ea in self.functions:
+            self.index_function(func_ea)
+
+        return self.functions.get(func_ea, [])
+
+    def is_call_site(self, ea):
+        """
+        Check if an address is an indexed CALL instruction
+        """
+        self.update()
+        return ea in self.callees
+
+    def get_callee(self, call_ea):
+        """
+        Get the statically resolved call destination of an indexed CALL instruction
+        @param call_ea: CALL instruction address
+        @return: The call destination ea, or None if unknown.
+        """
+        self.update()
+        return self.callees.get(call_ea)
+
+    ###############################################################################################
+    #   Index maintenance
+
+    def invalidate_function(self, func_ea):
+        """
+        Mark a function for re-indexing (e.g when it was added or reanalyzed)
+        @param func_ea: Function start address
+        """
+        self.dirty_functions.add(func_ea)
+
+    def remove_function(self, func_ea):
+        """
+        Remove a (deleted) function from the index
+        @param func_ea: Function start address
+        """
+        for call_ea in self.functions.pop(func_ea, []):
+            self.callees.pop(call_ea, None)
+
+        self.dirty_functions.discard(func_ea)
+        self.is_changed = True
+
+    def reset(self):
+        """
+        Unload the index (e.g when the IDB is closed). It is loaded again from the current IDB upon the next query.
+        """
+        self.is_loaded = False
+        self.is_changed = False
+
+        self.md5 = None
+        self.image_base = None
+        self.functions = {}
+        self.callees = {}
+
+        self.dirty_functions.clear()
+
+    def update(self):
+        """
+        Make sure the index is loaded and up to date
+        """
+        if not self.is_loaded:
+            self.load()
+
+        # The program might have been rebased since it was indexed (e.g by the debugger, for ASLR)
+        image_base = idaapi.get_imagebase()
+        if image_base != self.image_base:
+            self.rebase(image_base - self.image_base)
+            self.image_base = image_base
+
+        while self.dirty_functions:
+            self.index_function(self.dirty_functions.pop())
+
+    def index_function(self, func_ea):
+        """
+        (Re)index the CALL instructions of a single function
+        @param func_ea: Function start address
+        """
+        for call_ea in self.functions.pop(func_ea, []):
+            self.callees.pop(call_ea, None)
+
+        call_eas = []
+        if idaapi.get_func(func_ea) is not None:
+            for head in idautils.FuncItems(func_ea):
+                if self._index_head(head):
+                    call_eas.append(head)
+
+        self.functions[func_ea] = call_eas
+        self.is_changed = True
+
+    def rebase(self, delta):
+        """
+        Shift all of the indexed addresses (the entire program was moved)
+        @param delta: The difference between the new and the old image base
+        """
+        self.logger.info("Rebasing call-site index by %s.", hex(delta))
+
+        def shift(ea):
+            return ea + delta if ea is not None else None
+
+        functions = {}
+        for func_ea in self.functions:
+            functions[shift(func_ea)] = [call_ea + delta for call_ea in self.functions[func_ea]]
+
+        callees = {}
+        for call_ea in self.callees:
+            callees[call_ea + delta] = shift(self.callees[call_ea])
+
+        self.functions = functions
+        self.callees = callees
+        self.dirty_functions = set([shift(func_ea) for func_ea in self.dirty_functions])
+        self.is_changed = True
+
+    def build(self):
+        """
+        Build the entire index by walking all of the code segments
+        """
+        self.logger.info("Building call-site index.")
+
+        self.functions = {}
+        self.callees = {}
+        self.dirty_functions.clear()
+
+        for seg_ea in idautils.Segments():
+            if idc.GetSegmentAttr(seg_ea, idc.SEGATTR_TYPE) != idc.SEG_CODE:
+                continue
+
+            for head in idautils.Heads(seg_ea, idc.SegEnd(seg_ea)):
+                if self._index_head(head):
+                    func = idaapi.get_func(head)
+                    func_ea = func.startEA if func is not None else None
+
+                    if not func_ea in self.functions:
+                        self.functions[func_ea] = []
+                    self.functions[func_ea].append(head)
+
+        self.md5 = idautils.GetInputFileMD5()
+        self.image_base = idaapi.get_imagebase()
+        self.is_loaded = True
+        self.is_changed = True
+
+        self.logger.info("Call-site index built, %d call sites found.", len(self.callees))
+
+    def _index_head(self, head):
+        """
+        Add a head to the callee map if it is a CALL instruction
+        @return: True if head is a CALL instruction, otherwise False
+        """
+        if not idc.isCode(idc.GetFlags(head)) or not is_call(head):
+            return False
+
+        callee_ea = None
+        if idc.GetOpType(head, 0) in STATIC_CALL_OPTYPES:
+            callee_ea = idc.GetOperandValue(head, 0)
+
+        self.callees[head] = callee_ea
+        return True
+
+    ###############################################################################################
+    #   Persistence
+
+    def load(self):
+        """
+        Load the index from the IDB. If no index exists (or it was built for a different input file) it is rebuilt.
+        An index saved at a different image base is rebased.
+        """
+        try:
+            node = idaapi.netnode(INDEX_NETNODE, 0, False)
+            blob = None
+            if node != idaapi.BADNODE:
+                blob = node.getblob(0, 'D')
+
+            if blob is not None:
+                index_data = pickle.loads(blob)
+                if index_data[0] == INDEX_VERSION and index_data[1] == idautils.GetInputFileMD5():
+                    (version, md5, image_base, functions) = index_data
+                    self.md5 = md5
+                    self.image_base = image_base
+                    self.functions = {}
+                    self.callees = {}
+                    for func_ea in functions:
+                        self.functions[func_ea] = [call_ea for (call_ea, callee_ea) in functions[func_ea]]
+                        self.callees.update(functions[func_ea])
+
+                    self.is_loaded = True
+                    self.is_changed = False
+
+                    if image_base != idaapi.get_imagebase():
+                        self.rebase(idaapi.get_imagebase() - image_base)
+                        self.image_base = idaapi.get_imagebase()
+
+                    return
+
+        except Exception as ex:
+            self.logger.error("Failed to load call-site index, index will be rebuilt: %s", ex)
+
+        self.build()
+        self.save()
+
+    def save(self):
+        """
+        Persist the index in the IDB
+        @return: True if saved, otherwise False
+        """
+        if not self.is_loaded or not self.is_changed:
+            return False
+
+        try:
+            functions = {}
+            for func_ea in self.functions:
+                functions[func_ea] = [(call_ea, self.callees.get(call_ea)) for call_ea in self.functions[func_ea]]
+
+            node = idaapi.netnode(INDEX_NETNODE, 0, True)
+            node.setblob(pickle.dumps((INDEX_VERSION, self.md5, self.image_base, functions),
+                                      pickle.HIGHEST_PROTOCOL), 0, 'D')
+
+            self.is_changed = False
+            return True
+
+        except Exception as ex:
+            self.logger.error("Failed to save call-site index: %s", ex)
+            return False
+
+
+#############################################################################
+# Singleton
+#############################################################################
+
+_call_site_index = CallSiteIndex()
+
+def get_call_site_index():
+    """
+    Get the global call-site index instance
+    """
+    return _call_site_index
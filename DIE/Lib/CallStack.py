@@ -3,38 +3,46 @@ __author__ = 'yanivb'
 from DIE.Lib.FunctionContext import *
 from DIE.Lib.IDAConnector import check_new_code_area
 from DIE.Lib.DIE_Exceptions import NewCodeSectionException
-import idautils
+from DIE.Lib.AnalysisSnapshot import get_analysis_snapshot
 
 class CallStack():
     """
     DIE Call stack Implementation
     """
 
-    def __init__(self):
+    def __init__(self, sampling_policy=None):
         """
         Ctor
+        @param sampling_policy: If set, function calls are sampled according to this policy (type: SamplingPolicy)
         """
         self.logger = logging.getLogger(__name__)
 
         self.callStack = []  # A basic call stack
         self.callTree = []   # A call tree listing the entire function CFG
 
-        self.function_list = list(idautils.Functions())
+        self.analysis_snapshot = get_analysis_snapshot()
 
         # Function counter counts the number of time a specific function have been called (pushed to the call-stack)
         self.function_counter = {}
 
-    def push(self, ea, iatEA = None, library_name=None):
+        # Capture counter counts the number of times a specific function context was captured
+        self.capture_counter = {}
+
+        self.sampling_policy = sampling_policy
+
+    def push(self, ea, iatEA = None, library_name=None, calling_ea=None, is_counted=False):
         """
         Push a function into the callsatck and get call context
         @param ea: The function start address
         @param iatEA: If the function is imported, the address of the function IAT entry.
         @param library_name: Name of containing library (for library functions)
+        @param calling_ea: If pushed at the call-site (before the CALL was executed), the CALL instruction address.
+        @param is_counted: Was this call already counted (by sample_call)
         @return: Total number of occurrences of this function in the call-stack, or -1 on failure
         """
 
         # Check if ea is in new code section.
-        if iatEA is None:
+        if iatEA is None and library_name is None:
             new_area_t = check_new_code_area(ea)
             if new_area_t is not None:
                 (area_start, area_end) = new_area_t  # New code section scope
@@ -42,13 +50,15 @@ class CallStack():
         try:
 
             is_new_func = self.check_if_new_func(ea, iatEA)
-            funcContext = FunctionContext(ea, iatEA, is_new_func, library_name=library_name)
+            funcContext = FunctionContext(ea, iatEA, is_new_func, library_name=library_name, calling_ea=calling_ea)
 
             if funcContext is None:
                 self.logger.error("Could not generate function context for ea: %s", hex(ea))
                 return -1
 
-            self.count_function(funcContext.function.funcName)
+            if not is_counted:
+                self.count_function(funcContext.function.funcName)
+            self.count_capture(funcContext.function.funcName)
             funcContext.get_arg_values_call()
 
             callTree_Indx = len(self.callTree)
@@ -98,8 +108,8 @@ class CallStack():
         if iatEA is not None:
             return False
 
-        # Check if function in original function_list
-        if ea in self.function_list:
+        # Check if function in original function list
+        if self.analysis_snapshot.is_initial_function(ea):
             return False
 
         # This must be a new function!
@@ -123,6 +133,29 @@ class CallStack():
             self.logger.exception("Failed while add function %s to function counter: %s", func_name, ex)
             return False
 
+    def count_capture(self, func_name):
+        """
+        Add function to capture counter
+        @param func_name: Function Name
+        """
+        if func_name in self.capture_counter:
+            self.capture_counter[func_name] += 1
+        else:
+            self.capture_counter[func_name] = 1
+
+    def sample_call(self, func_name):
+        """
+        Count a function call and check if its context should be captured according to the sampling policy
+        @param func_name: Function Name
+        @return: True if the call context should be captured, otherwise False
+        """
+        self.count_function(func_name)
+
+        if self.sampling_policy is None:
+            return True
+
+        return self.sampling_policy.should_capture(func_name, self.function_counter[func_name])
+
     def get_top_func_data(self):
         """
         Get the topmost call-stack item function name.
@@ -1,13 +1,17 @@
 __author__ = 'yanivb'
 import logging
-import pickle
 import os
+import shutil
 
 from DIE_Exceptions import DbFileMismatch
 
+from DIE.Lib.PhaseTimers import get_phase_timers, timer, PHASE_DB_INSERT
+from DIE.Lib.DIEDbSqlite import SqliteStore, is_sqlite_file, VALUE_CALL, VALUE_RET, VALUE_RET_ARG
+from DIE.Lib.DIEDbFile import write_db_file, read_db_file, read_legacy_db_file, is_db_file
 from DIE.Lib.db_DataTypes import dbDebug_Values, dbFuncArg, \
-    dbFunction, dbFunction_Context, dbParsed_Value, dbRun_Info, dbThread
+    dbFunction, dbFunction_Context, dbParsed_Value, dbRun_Info, dbThread, dbArray_Summary
 
+import idaapi
 import idautils
 
 
@@ -24,14 +28,22 @@ class DIE_DB():
 
         # Run info
         self.run_info = None
+        self.run_threads = {}               # Threads of the current run (Key: thread number, Value: thread id)
+        self.run_id = None                  # Store id of the current run
 
-        # Debug data
-        self.functions = {}
-        self.function_args = {}
-        self.function_contexts = {}
-        self.threads = {}
-        self.dbg_values = {}
-        self.parsed_values = {}
+        # SQLite store. If set, debug data is stored in (and retrieved from) the store instead of the tables below.
+        self.store = None
+
+        # Debug data (dense tables, records are indexed by their id)
+        self.functions = []
+        self.function_args = []
+        self.function_contexts = []
+        self.threads = []
+        self.dbg_values = []
+        self.parsed_values = []
+
+        self.function_ids = {}              # Function ids (Key: function key, Value: function id)
+        self.parsed_value_ids = {}          # Parsed value ids (Key: parsed value key, Value: parsed value id)
 
         # Breakpoints
         self.bp_list = {}                   # BreakPoint dictionary
@@ -50,12 +62,10 @@ class DIE_DB():
         Get a list of all functions in the db
         @return: A list of dbFunction objects
         """
-        function_list = []
-
-        for function_id in self.functions:
-            function_list.append(self.functions[function_id])
+        if self.store is not None:
+            return self.store.get_functions()
 
-        return function_list
+        return list(self.functions)
 
     def get_function_by_name(self, function_name):
         """
@@ -63,6 +73,8 @@ class DIE_DB():
         @param function_name: function name
         @return: if function was found, returns function object of type dbFunction, otherwise returns None
         """
+        if self.store is not None:
+            return self.store.get_function_by_name(function_name)
 
         functions = self.get_functions()
         for function in functions:
@@ -77,11 +89,14 @@ class DIE_DB():
         @param function: Get a list of function contexts for this function only.
         @return:
         """
+        if self.store is not None:
+            return self.store.get_function_context_list(function)
+
         function_context_list = []
 
         if function is None:
             # Global function context list (for the entire db)
-            cur_context_list = self.function_contexts
+            cur_context_list = xrange(len(self.function_contexts))
         else:
             # Local function context list (for a specific function)
             cur_context_list = function.function_contexts
@@ -102,11 +117,14 @@ class DIE_DB():
         @return: A dictionary of function contexts grouped by their calling ea`s.
                  each dictionary node is a list of function contexts for this ea.
         """
+        if self.store is not None:
+            return self.store.get_function_context_dict(function)
+
         function_context_dict = {}
 
         if function is None:
             # Global function context list (for the entire db)
-            cur_context_list = self.function_contexts
+            cur_context_list = xrange(len(self.function_contexts))
         else:
             # Local function context list (for a specific function)
             cur_context_list = function.function_contexts
@@ -131,8 +149,10 @@ class DIE_DB():
         @param func_context_id: Function context ID
         @return: function context object (type: dbFunction_Context) or None for invalid ID.
         """
+        if self.store is not None:
+            return self.store.get_function_context(func_context_id)
 
-        if func_context_id in self.function_contexts:
+        if func_context_id is not None and 0 <= func_context_id < len(self.function_contexts):
             return self.function_contexts[func_context_id]
 
         return None
@@ -148,6 +168,9 @@ class DIE_DB():
         if function_context is None:
             return call_value_list
 
+        if self.store is not None:
+            return self.store.get_context_values(function_context, VALUE_CALL)
+
         for call_value_id in function_context.call_values:
             call_value_list.append(self.dbg_values[call_value_id])
 
@@ -164,6 +187,9 @@ class DIE_DB():
         if function_context is None:
             return return_value_list
 
+        if self.store is not None:
+            return self.store.get_context_values(function_context, VALUE_RET)
+
         for ret_value_id in function_context.ret_values:
             return_value_list.append(self.dbg_values[ret_value_id])
 
@@ -180,6 +206,9 @@ class DIE_DB():
             return None
 
         if function_context.ret_arg_value is not None:
+            if self.store is not None:
+                return self.store.get_dbg_value(function_context.ret_arg_value)
+
             return self.dbg_values[function_context.ret_arg_value]
 
         return None
@@ -200,6 +229,9 @@ class DIE_DB():
             if arg_id is None:
                 return None
 
+        if self.store is not None:
+            return self.store.get_function_arg(arg_id)
+
         return self.function_args[arg_id]
 
     def get_parsed_values(self, dbg_value=None):
@@ -208,12 +240,15 @@ class DIE_DB():
         @param dbg_value: a debug value object to retrieve parsed values from. (type: dbDebug_Values)
         @return:
         """
+        if self.store is not None:
+            return self.store.get_parsed_values(dbg_value)
+
         parsed_val_list = []
 
         if dbg_value is not None:
             parsed_val_id_list = dbg_value.parsed_values
         else:
-            parsed_val_id_list = self.parsed_values
+            parsed_val_id_list = xrange(len(self.parsed_values))
 
         for parsed_val_id in parsed_val_id_list:
             parsed_val_list.append(self.parsed_values[parsed_val_id])
@@ -227,6 +262,9 @@ class DIE_DB():
         @return: a debug value object
         """
         if dbg_val_id is not None:
+            if self.store is not None:
+                return self.store.get_dbg_value(dbg_val_id)
+
             return self.dbg_values[dbg_val_id]
 
         return None
@@ -244,6 +282,9 @@ class DIE_DB():
         if not isinstance(function, dbFunction):
             raise ValueError("dbFunction type is expected. Got %s." % function.__class__)
 
+        if self.store is not None:
+            return self.store.count_function_occurs(function, thread_id)
+
         if thread_id is None:
             return len(function.function_contexts)
 
@@ -254,6 +295,21 @@ class DIE_DB():
 
         return count
 
+    def get_sampling_ratio(self, function):
+        """
+        Get the sampling ratio of a function
+        @param function: The function (type: dbFunction)
+        @return: The ratio of captured calls out of the total number of calls (1.0 if all calls were captured)
+        """
+        if function is None:
+            return 0
+
+        call_count = getattr(function, "call_count", 0)
+        if call_count == 0:
+            return 1.0
+
+        return float(getattr(function, "capture_count", call_count)) / call_count
+
     def get_best_parsed_val(self, parsed_vals):
         """
         Gets the best parsed value from a prased value list
@@ -282,12 +338,10 @@ class DIE_DB():
         Get all parsed values from the db
         @return: A list of parsed values (of type dbParsed_Value)
         """
-        value_list = []
-
-        for parsed_value_id in self.parsed_values:
-            value_list.append(self.parsed_values[parsed_value_id])
+        if self.store is not None:
+            return self.store.get_parsed_values()
 
-        return value_list
+        return list(self.parsed_values)
 
     def get_all_values_dict(self):
         """
@@ -297,9 +351,13 @@ class DIE_DB():
 
         value_dict = {}
 
-        for parsed_value_id in self.parsed_values:
-            cur_val = self.parsed_values[parsed_value_id]
+        if self.store is not None:
+            for value_type in self.store.get_all_value_types():
+                value_dict[value_type] = self.store.get_parsed_values_by_type(value_type)
+
+            return value_dict
 
+        for cur_val in self.parsed_values:
             if cur_val.type in value_dict:
                 value_dict[cur_val.type].append(cur_val)
             else:
@@ -312,9 +370,11 @@ class DIE_DB():
         Get all contained value types
         @return: a list of all of the contained value types
         """
+        if self.store is not None:
+            return self.store.get_all_value_types()
+
         type_list = []
-        for parsed_value_id in self.parsed_values:
-            cur_val = self.parsed_values[parsed_value_id]
+        for cur_val in self.parsed_values:
             if not cur_val.type in type_list:
                 type_list.append(cur_val.type)
 
@@ -329,6 +389,9 @@ class DIE_DB():
         if not isinstance(value, dbParsed_Value):
             raise TypeError("Expected type dbParsed_Value but got type: %s" % value.__class__)
 
+        if self.store is not None:
+            return self.store.get_parsed_value_contexts(value)
+
         func_context_list = []
 
         for dbg_val_id in value.dbgValues:
@@ -346,13 +409,22 @@ class DIE_DB():
         Get a list of threads from DB
         @return: a list of thread objects (of type dbThread)
         """
-        thread_list = []
+        if self.store is not None:
+            return self.store.get_thread_list()
 
-        for thread_id in self.threads:
-            thread_list.append(self.threads[thread_id])
+        return list(self.threads)
 
-        return thread_list
 
+    def get_phase_stats(self):
+        """
+        Get the per-phase timing statistics of the run
+        @return: a dictionary of phase statistics (Key: phase name, Value: a dictionary with count, total, p50,
+                 p95 and max values in seconds)
+        """
+        if self.run_info is None:
+            return {}
+
+        return getattr(self.run_info, "phase_stats", {})
 
     def get_run_info(self):
         """
@@ -361,6 +433,14 @@ class DIE_DB():
                              num_of_exec_function, num_of_threads, num_of_parsed_vals)
         """
 
+        if self.store is not None:
+            return (self.run_info.start_time,
+                    self.run_info.end_time,
+                    self.run_info.file,
+                    self.store.count_items("functions"),
+                    self.store.count_items("threads"),
+                    self.store.count_items("parsed_values"))
+
         num_of_exec_funcs = len(self.functions)
         num_of_threads = len(self.threads)
         num_of_parsed_vals = len(self.parsed_values)
@@ -388,18 +468,131 @@ class DIE_DB():
         @return:
         """
         try:
-            self.run_info = dbRun_Info(start_time, end_time, debugged_file, md5)
+            self.start_run(start_time, debugged_file, md5)
 
             for thread_id in call_stack:
-                thread_id = self.add_thread_data(thread_id, call_stack[thread_id].callTree)
-                self.run_info.threads.append(thread_id)
+                self.flush_thread_data(thread_id, call_stack[thread_id].callTree)
 
-            self.is_saved = False  # Un-check the saved flag
+            self.end_run(end_time)
             return True
 
         except Exception as ex:
             self.logger.error("Error while loading RunInfo data into DieDB: %s", ex)
 
+    def update_function_counts(self, call_counts, capture_counts):
+        """
+        Update the runtime call counts of the DB functions
+        @param call_counts: A dictionary of total call counts (Key: function name, Value: number of calls)
+        @param capture_counts: A dictionary of captured call counts (Key: function name, Value: number of calls)
+        """
+        if self.store is not None:
+            self.store.update_function_counts(call_counts, capture_counts)
+
+        for function in self.functions:
+            if function.function_name in call_counts:
+                function.call_count = call_counts[function.function_name]
+                function.capture_count = capture_counts.get(function.function_name, 0)
+
+        self.is_saved = False  # Un-check the saved flag
+
+    def start_run(self, start_time, debugged_file, md5):
+        """
+        Start a new run. Function contexts are added to the run while debugging using flush_thread_data()
+        @param start_time: Debugging start time
+        @param debugged_file: Analyzed file name
+        @param md5: Analyzed file MD5
+        """
+        self.run_info = dbRun_Info(start_time, start_time, debugged_file, md5)
+        self.run_threads = {}
+
+        if self.store is not None:
+            self.run_id = self.store.add_run(self.run_info)
+
+        get_phase_timers().reset()
+
+        self.is_saved = False  # Un-check the saved flag
+
+    def end_run(self, end_time):
+        """
+        End the current run
+        @param end_time: Debugging end time
+        """
+        if self.run_info is None:
+            return
+
+        self.run_info.end_time = end_time
+        self.run_info.phase_stats = get_phase_timers().get_stats()
+
+        if self.store is not None:
+            self.store.update_run(self.run_id, self.run_info)
+
+        self.is_saved = False  # Un-check the saved flag
+
+    def flush_thread_data(self, thread_num, call_tree):
+        """
+        Add function contexts of a thread to the current run.
+        May be called repeatedly for the same thread, each time with the function contexts completed since the
+        previous call. Contexts are appended to the thread CFG in call_tree order.
+        @param thread_num: Thread number
+        @param call_tree: call_tree (List of FunctionContext objects).
+        @return: The thread id
+        """
+        start_time = timer()
+        try:
+            if self.store is not None:
+                return self._flush_thread_store(thread_num, call_tree)
+
+            if thread_num in self.run_threads:
+                thread_id = self.run_threads[thread_num]
+                cur_thread = self.threads[thread_id]
+            else:
+                cur_thread = dbThread(thread_num)
+                thread_id = self._add_record(self.threads, cur_thread)
+
+                self.run_threads[thread_num] = thread_id
+                self.run_info.threads.append(thread_id)
+
+            for function_context in call_tree:
+                func_context_id = self.add_function_context(function_context, cur_thread.thread_num)
+                cur_thread.cfg.append(func_context_id)
+
+            self.is_saved = False  # Un-check the saved flag
+            return thread_id
+
+        except Exception as ex:
+            self.logger.error("Error while flushing thread-%d data to DieDB: %s", thread_num, ex)
+
+        finally:
+            get_phase_timers().add(PHASE_DB_INSERT, start_time)
+
+    def _flush_thread_store(self, thread_num, call_tree):
+        """
+        Stream function contexts of a thread into the SQLite store (committed once per flush)
+        @param thread_num: Thread number
+        @param call_tree: call_tree (List of FunctionContext objects).
+        @return: The thread id
+        """
+        if thread_num in self.run_threads:
+            thread_id = self.run_threads[thread_num]
+        else:
+            thread_id = self.store.add_thread(self.run_id, thread_num)
+
+            self.run_threads[thread_num] = thread_id
+            self.run_info.threads.append(thread_id)
+
+        for function_context in call_tree:
+            try:
+                self.store.add_function_context(function_context, thread_id, thread_num)
+
+            except Exception as ex:
+                self.logger.error("Error while adding function %s to DieDB: %s",
+                                  function_context.function.funcName, ex)
+
+        self.store.commit()
+
+        self.is_saved = False  # Un-check the saved flag
+        return thread_id
+
     def add_thread_data(self, thread_num, call_tree):
         """
         Add a new thread data to DIE database
@@ -410,14 +603,12 @@ class DIE_DB():
 
         try:
             cur_thread = dbThread(thread_num)
-            thread_id = id(cur_thread)
+            thread_id = self._add_record(self.threads, cur_thread)
 
             for function_context in call_tree:
                 func_context_id = self.add_function_context(function_context, cur_thread.thread_num)
                 cur_thread.cfg.append(func_context_id)
 
-            self.threads[thread_id] = cur_thread
-
             self.is_saved = False  # Un-check the saved flag
             return thread_id
 
@@ -440,7 +631,7 @@ class DIE_DB():
                                                   function_context.total_proc_time,
                                                   thread_id)
 
-            func_context_id = id(cur_func_context)
+            func_context_id = self._add_record(self.function_contexts, cur_func_context)
 
             cur_func_context.function = self.add_function(function_context.function, func_context_id)
 
@@ -457,8 +648,6 @@ class DIE_DB():
                 dbg_val_id = self.add_debug_value(function_context.retArgValue, func_context_id)
                 cur_func_context.ret_arg_value = dbg_val_id
 
-            self.function_contexts[func_context_id] = cur_func_context
-
             self.is_saved = False  # Un-check the saved flag
             return func_context_id
 
@@ -475,9 +664,10 @@ class DIE_DB():
 
         try:
             cur_function = dbFunction(function.funcName, function.func_start, function.func_end, function.proto_ea, function.argNum, function.isLibFunc, function.library_name)
-            func_id = cur_function.__hash__()
+            func_key = cur_function.__getkey__()
 
-            if func_id in self.functions:
+            func_id = self.function_ids.get(func_key)
+            if func_id is not None:
                 self.functions[func_id].function_contexts.append(func_context_id)
                 return func_id
 
@@ -492,7 +682,8 @@ class DIE_DB():
                 ret_arg_id = self.add_func_arg(function.retArg)
                 cur_function.ret_arg = ret_arg_id
 
-            self.functions[func_id] = cur_function
+            func_id = self._add_record(self.functions, cur_function)
+            self.function_ids[func_key] = func_id
 
             self.is_saved = False  # Un-check the saved flag
             return func_id
@@ -509,8 +700,7 @@ class DIE_DB():
 
         try:
             cur_arg = dbFuncArg(func_arg.argname, func_arg.type_str(), func_arg.argNum, func_arg.isStack())
-            arg_id = id(cur_arg)
-            self.function_args[arg_id] = cur_arg
+            arg_id = self._add_record(self.function_args, cur_arg)
 
             self.is_saved = False  # Un-check the saved flag
             return arg_id
@@ -532,7 +722,7 @@ class DIE_DB():
                                            debug_value.name,
                                            debug_value.is_definitely_parsed(),
                                            debug_value.derefrence_depth)
-            dbg_val_id = id(cur_dbg_value)
+            dbg_val_id = self._add_record(self.dbg_values, cur_dbg_value)
 
             cur_dbg_value.function_context = func_context_id
 
@@ -554,6 +744,18 @@ class DIE_DB():
                 ref_flink_id = self.add_debug_value(debug_value.reference_flink, func_context_id=func_context_id, ref_blink_id=dbg_val_id)
                 cur_dbg_value.reference_flink = ref_flink_id
 
+            array_summary = debug_value.array_summary
+            if array_summary is not None:
+                cur_dbg_value.array_summary = dbArray_Summary(array_summary.element_type_name,
+                                                              array_summary.element_num,
+                                                              array_summary.element_size,
+                                                              array_summary.fmt,
+                                                              array_summary.data,
+                                                              array_summary.min,
+                                                              array_summary.max,
+                                                              array_summary.mean,
+                                                              array_summary.zero_count)
+
             # Get the best parsed value (lowest score)
             best_score = 10
             for parsed_val_id in cur_dbg_value.parsed_values:
@@ -562,8 +764,6 @@ class DIE_DB():
                     cur_dbg_value.best_val_id = parsed_val_id
                     best_score = cur_parsed_val.score
 
-            self.dbg_values[dbg_val_id] = cur_dbg_value
-
             self.is_saved = False  # Un-check the saved flag
             return dbg_val_id
 
@@ -578,12 +778,12 @@ class DIE_DB():
         """
         try:
             cur_parsed_val = dbParsed_Value(parsed_val.data, parsed_val.description, parsed_val.raw, parsed_val.score, parsed_val.type)
-            parsed_val_id = cur_parsed_val.__hash__()
+            parsed_val_key = cur_parsed_val.__getkey__()
 
-            if not parsed_val_id in self.parsed_values:
-                self.parsed_values[parsed_val_id] = cur_parsed_val
-
-            self.is_saved = False
+            parsed_val_id = self.parsed_value_ids.get(parsed_val_key)
+            if parsed_val_id is None:
+                parsed_val_id = self._add_record(self.parsed_values, cur_parsed_val)
+                self.parsed_value_ids[parsed_val_key] = parsed_val_id
 
             self.is_saved = False  # Un-check the saved flag
             return parsed_val_id
@@ -591,6 +791,16 @@ class DIE_DB():
         except Exception as ex:
             self.logger.error("Error while loading parsed data into DieDB: %s", ex)
 
+    def _add_record(self, table, record):
+        """
+        Add a record to a DB table
+        @param table: The DB table
+        @param record: The record to add
+        @return: The allocated record id (the record index in the table)
+        """
+        table.append(record)
+        return len(table) - 1
+
 
 ####################################################################################
 # Serialization
@@ -602,6 +812,81 @@ class DIE_DB():
         filename, extension = os.path.splitext(idaapi.get_input_file_path())
         return filename + ".ddb"
 
+    def get_default_store_filename(self):
+        """
+        Get the default DIE DB SQLite store filename
+        """
+        return self.get_default_db_filename() + ".sqlite"
+
+    def open_store(self, file_name=None):
+        """
+        Open (or create) an SQLite store. The store replaces the in-memory DB tables, and following runs are
+        streamed into it.
+        @param file_name: Store filename
+        @return: True on success otherwise False
+        """
+        if file_name is None:
+            file_name = self.get_default_store_filename()
+
+        try:
+            store = SqliteStore(file_name)
+
+        except Exception as ex:
+            self.logger.error("Failed to open DIE DB store %s: %s", file_name, ex)
+            return False
+
+        # Validate db MD5
+        store_md5 = store.get_meta("md5")
+        if store_md5 is None:
+            store.set_meta("md5", idautils.GetInputFileMD5())
+            store.commit()
+
+        elif store_md5 != idautils.GetInputFileMD5():
+            store.close()
+            raise DbFileMismatch("Db File is different then currently analyzed file")
+
+        self.close_store()
+        self.store = store
+
+        self.functions = []
+        self.function_args = []
+        self.function_contexts = []
+        self.threads = []
+        self.dbg_values = []
+        self.parsed_values = []
+
+        self.function_ids = {}
+        self.parsed_value_ids = {}
+
+        self.run_threads = {}
+        self.run_id, self.run_info = store.get_last_run()
+
+        exclusions = store.get_meta("exclusions")
+        if exclusions is not None:
+            (self.excluded_bp_ea,
+             self.excluded_funcNames_part,
+             self.excluded_funcNames,
+             self.excluded_modules) = exclusions
+
+        self.logger.info("DIE DB store opened: %s", file_name)
+        return True
+
+    def close_store(self):
+        """
+        Close the SQLite store (if open)
+        """
+        if self.store is None:
+            return
+
+        try:
+            self.store.close()
+
+        except Exception as ex:
+            self.logger.error("Error while closing DIE DB store: %s", ex)
+
+        self.store = None
+        self.run_id = None
+
     def save_db(self, file_name=None):
         """
         Seralize DB and save to file
@@ -614,11 +899,12 @@ class DIE_DB():
                 self.logger.info("DB was not saved - no data to save")
                 return
 
+            if self.store is not None:
+                return self._save_store(file_name)
+
             if file_name is None:
                 file_name = self.get_default_db_filename()
 
-            out_file = open(file_name, 'wb')
-
             db_tables = [self.run_info,
                          self.functions,
                          self.function_args,
@@ -632,7 +918,7 @@ class DIE_DB():
                          self.excluded_modules
                         ]
 
-            pickle.dump(db_tables, out_file)
+            write_db_file(file_name, db_tables)
 
             self.is_saved = True  # Check the saved flag
             return True
@@ -642,6 +928,24 @@ class DIE_DB():
             logging.error("Error while saving DIE DB: %s", ex)
             return False
 
+    def _save_store(self, file_name=None):
+        """
+        Save the SQLite store. Run data is already committed while debugging, so only the exclusion lists are saved.
+        @param file_name: If set (and is not the store file), a copy of the store is saved to this file.
+        @return: True on success otherwise False
+        """
+        self.store.set_meta("exclusions", (self.excluded_bp_ea,
+                                           self.excluded_funcNames_part,
+                                           self.excluded_funcNames,
+                                           self.excluded_modules))
+        self.store.commit()
+
+        if file_name is not None and os.path.abspath(file_name) != os.path.abspath(self.store.file_name):
+            shutil.copyfile(self.store.file_name, file_name)
+
+        self.is_saved = True  # Check the saved flag
+        return True
+
     def load_db(self, file_name=None):
         """
         Load DB from file and DeSeralize
@@ -656,15 +960,23 @@ class DIE_DB():
             logging.error("DIE DB file was not found")
             return False
 
-        in_file = open(file_name, 'rb')
+        if is_sqlite_file(file_name):
+            return self.open_store(file_name)
 
-        db_tables = pickle.load(in_file)
+        is_legacy_db = not is_db_file(file_name)
+
+        if is_legacy_db:
+            db_tables = read_legacy_db_file(file_name)
+        else:
+            db_tables = read_db_file(file_name)
 
         # Validate db MD5
         db_md5 = db_tables[0].md5
         if db_md5 != idautils.GetInputFileMD5():
             raise DbFileMismatch("Db File is different then currently analyzed file")
 
+        self.close_store()
+
         self.run_info = db_tables[0]
         self.functions = db_tables[1]
         self.function_args = db_tables[2]
@@ -677,8 +989,26 @@ class DIE_DB():
         self.excluded_funcNames = db_tables[9]
         self.excluded_modules = db_tables[10]
 
+        self._index_tables()
+
+        # Un-check the saved flag of legacy (pickled) DBs, so they are saved in the DIE DB file format
+        if is_legacy_db:
+            self.is_saved = False
+
         return True
 
+    def _index_tables(self):
+        """
+        Rebuild the function and parsed value id maps of the DB tables
+        """
+        self.function_ids = {}
+        for func_id, function in enumerate(self.functions):
+            self.function_ids[function.__getkey__()] = func_id
+
+        self.parsed_value_ids = {}
+        for parsed_val_id, parsed_val in enumerate(self.parsed_values):
+            self.parsed_value_ids[parsed_val.__getkey__()] = parsed_val_id
+
 
 #############################################################################
 # Singleton
@@ -0,0 +1,683 @@
+__author__ = 'yanivb'
+
+import logging
+import pickle
+import struct
+import types
+
+from DIE.Lib.db_DataTypes import dbDebug_Values, dbFuncArg, \
+    dbFunction, dbFunction_Context, dbParsed_Value, dbRun_Info, dbThread, dbArray_Summary
+
+################################################################
+#
+# DIE DB file format.
+# Each DB table is written as a stream of fixed-layout records,
+# strings are interned into a single string table at the end
+# of the file. The file is written and read in chunks.
+#
+#   Header:  magic, version, string table offset
+#   Table:   table tag, record count, records
+#   Record:  record fields (in table layout order), record ids
+#            are the record indexes in their table
+#   Strings: string count, length prefixed strings
+#
+################################################################
+
+DB_MAGIC = "DIEDB"
+DB_VERSION = 2               # Version 1 - id keyed tables (each record is prefixed with its id)
+
+CHUNK_SIZE = 0x100000       # File read\write chunk size
+MAX_INTERN_LEN = 0x100      # Longer strings are stored inline rather than in the string table
+
+_HEADER = struct.Struct("<5sHQ")
+_TABLE = struct.Struct("<BQ")
+_TAG = struct.Struct("<B")
+_ID = struct.Struct("<q")
+_INT = struct.Struct("<q")
+_UINT = struct.Struct("<Q")
+_FLOAT = struct.Struct("<d")
+_LENGTH = struct.Struct("<I")
+
+NONE_ID = -2 ** 63          # Id list placeholder for a None id
+
+# Value tags
+T_NONE = 0
+T_TRUE = 1
+T_FALSE = 2
+T_INT = 3
+T_UINT = 4
+T_FLOAT = 5
+T_STR = 6           # Interned string (string table index)
+T_BYTES = 7         # Inline string
+T_UNICODE = 8
+T_LIST = 9
+T_TUPLE = 10
+T_DICT = 11
+T_PICKLE = 12       # Any other value
+
+# Field kinds
+F_VALUE = 0         # A tagged value
+F_ID_LIST = 1       # A list of record ids
+F_ARRAY_SUMMARY = 2 # An array summary (type: dbArray_Summary) or None
+
+# Table tags (the table index in the DB tables list, see DIE_DB.save_db())
+RUN_INFO_TAG = 0
+FUNCTIONS_TABLE = 1
+FUNC_ARGS_TABLE = 2
+CONTEXTS_TABLE = 3
+THREADS_TABLE = 4
+DBG_VALUES_TABLE = 5
+PARSED_VALUES_TABLE = 6
+EXCLUSIONS_TAG = 7
+
+# Record layouts (field name, field kind, referenced table for record id fields)
+RUN_INFO_LAYOUT = (("start_time", F_VALUE, None),
+                   ("end_time", F_VALUE, None),
+                   ("file", F_VALUE, None),
+                   ("md5", F_VALUE, None),
+                   ("threads", F_ID_LIST, THREADS_TABLE),
+                   ("phase_stats", F_VALUE, None))
+
+FUNCTION_LAYOUT = (("function_name", F_VALUE, None),
+                   ("function_start", F_VALUE, None),
+                   ("function_end", F_VALUE, None),
+                   ("proto_ea", F_VALUE, None),
+                   ("arg_num", F_VALUE, None),
+                   ("is_lib_func", F_VALUE, None),
+                   ("lib_name", F_VALUE, None),
+                   ("args", F_ID_LIST, FUNC_ARGS_TABLE),
+                   ("ret_arg", F_VALUE, FUNC_ARGS_TABLE),
+                   ("function_contexts", F_ID_LIST, CONTEXTS_TABLE),
+                   ("call_count", F_VALUE, None),
+                   ("capture_count", F_VALUE, None))
+
+FUNC_ARG_LAYOUT = (("name", F_VALUE, None),
+                   ("type", F_VALUE, None),
+                   ("arg_index", F_VALUE, None),
+                   ("is_stack", F_VALUE, None),
+                   ("is_register", F_VALUE, None))
+
+FUNCTION_CONTEXT_LAYOUT = (("function", F_VALUE, FUNCTIONS_TABLE),
+                           ("call_values", F_ID_LIST, DBG_VALUES_TABLE),
+                           ("ret_values", F_ID_LIST, DBG_VALUES_TABLE),
+                           ("ret_arg_value", F_VALUE, DBG_VALUES_TABLE),
+                           ("call_reg_state", F_VALUE, None),
+                           ("ret_reg_state", F_VALUE, None),
+                           ("calling_ea", F_VALUE, None),
+                           ("calling_func_name", F_VALUE, None),
+                           ("is_indirect", F_VALUE, None),
+                           ("is_new_func", F_VALUE, None),
+                           ("thread_id", F_VALUE, None),
+                           ("total_process_time", F_VALUE, None))
+
+THREAD_LAYOUT = (("thread_num", F_VALUE, None),
+                 ("cfg", F_ID_LIST, CONTEXTS_TABLE))
+
+DEBUG_VALUE_LAYOUT = (("raw_value", F_VALUE, None),
+                      ("type", F_VALUE, None),
+                      ("name", F_VALUE, None),
+                      ("parsed_values", F_ID_LIST, PARSED_VALUES_TABLE),
+                      ("nested_values", F_ID_LIST, DBG_VALUES_TABLE),
+                      ("reference_flink", F_VALUE, DBG_VALUES_TABLE),
+                      ("reference_blink", F_VALUE, DBG_VALUES_TABLE),
+                      ("function_context", F_VALUE, CONTEXTS_TABLE),
+                      ("derref_depth", F_VALUE, None),
+                      ("best_val_id", F_VALUE, PARSED_VALUES_TABLE),
+                      ("is_definitely_parsed", F_VALUE, None),
+                      ("array_summary", F_ARRAY_SUMMARY, None))
+
+PARSED_VALUE_LAYOUT = (("data", F_VALUE, None),
+                       ("description", F_VALUE, None),
+                       ("raw", F_VALUE, None),
+                       ("type", F_VALUE, None),
+                       ("score", F_VALUE, None),
+                       ("dbgValues", F_ID_LIST, DBG_VALUES_TABLE))
+
+ARRAY_SUMMARY_FIELDS = ("element_type", "element_num", "element_size", "fmt", "data", "min", "max", "mean",
+                        "zero_count")
+
+# Record tables, in file order (table tag, record class, record layout)
+DB_TABLES = ((FUNCTIONS_TABLE, dbFunction, FUNCTION_LAYOUT),
+             (FUNC_ARGS_TABLE, dbFuncArg, FUNC_ARG_LAYOUT),
+             (CONTEXTS_TABLE, dbFunction_Context, FUNCTION_CONTEXT_LAYOUT),
+             (THREADS_TABLE, dbThread, THREAD_LAYOUT),
+             (DBG_VALUES_TABLE, dbDebug_Values, DEBUG_VALUE_LAYOUT),
+             (PARSED_VALUES_TABLE, dbParsed_Value, PARSED_VALUE_LAYOUT))
+
+LEGACY_RECORDS_MODULE = "DIE.Lib.db_DataTypes"
+
+# Default values of record fields missing from legacy DB objects
+FIELD_DEFAULTS = {"call_count": 0,
+                  "capture_count": 0,
+                  "phase_stats": {}}
+
+
+def is_db_file(file_name):
+    """
+    Check if a file is a DIE DB file (rather than a legacy pickled DB file)
+    @param file_name: File name
+    @return: True if the file starts with the DIE DB magic, otherwise False
+    """
+    with open(file_name, "rb") as db_file:
+        return db_file.read(len(DB_MAGIC)) == DB_MAGIC
+
+
+def new_record(record_class, layout):
+    """
+    Create a DB record object without calling its constructor. Record fields which are not part of the record layout
+    are set to None.
+    """
+    record = record_class.__new__(record_class)
+
+    layout_fields = [field_name for (field_name, field_kind, ref_table) in layout]
+    for field_name in record_class.__slots__:
+        if not field_name in layout_fields:
+            setattr(record, field_name, None)
+
+    return record
+
+
+class DbFileWriter():
+    """
+    Writes DB tables to a DIE DB file
+    """
+
+    def __init__(self, file_name):
+        """
+        Ctor
+        @param file_name: DB file name
+        """
+        self.out_file = open(file_name, 'wb')
+
+        self.chunks = []
+        self.chunks_size = 0
+
+        self.strings = {}       # Interned strings (Key: string, Value: string table index)
+        self.string_list = []
+
+        self.out_file.write(_HEADER.pack(DB_MAGIC, DB_VERSION, 0))
+
+    def write_db(self, db_tables):
+        """
+        Write the DB tables
+        @param db_tables: A list of the DB tables, ordered as in DIE_DB.save_db()
+        """
+        self._write_run_info(db_tables[0])
+
+        for (table_tag, record_class, layout) in DB_TABLES:
+            table = db_tables[table_tag]
+            self.write(_TABLE.pack(table_tag, len(table)))
+
+            for record in table:
+                self._write_record(record, layout)
+
+        self.write(_TABLE.pack(EXCLUSIONS_TAG, 1))
+        self.write_value(list(db_tables[7:11]))
+
+        # String table
+        self.flush()
+        strings_offset = self.out_file.tell()
+
+        self.write(_LENGTH.pack(len(self.string_list)))
+        for value in self.string_list:
+            self.write(_LENGTH.pack(len(value)))
+            self.write(value)
+        self.flush()
+
+        self.out_file.seek(0)
+        self.out_file.write(_HEADER.pack(DB_MAGIC, DB_VERSION, strings_offset))
+
+    def close(self):
+        self.out_file.close()
+
+    def write(self, data):
+        """
+        Write data (data is written to the file in chunks)
+        """
+        self.chunks.append(data)
+        self.chunks_size += len(data)
+
+        if self.chunks_size >= CHUNK_SIZE:
+            self.flush()
+
+    def flush(self):
+        self.out_file.write("".join(self.chunks))
+        self.chunks = []
+        self.chunks_size = 0
+
+    def write_value(self, value):
+        """
+        Write a tagged value
+        """
+        value_type = type(value)
+
+        if value is None:
+            self.write(_TAG.pack(T_NONE))
+
+        elif value_type is bool:
+            self.write(_TAG.pack(T_TRUE if value else T_FALSE))
+
+        elif (value_type is int or value_type is long) and -2 ** 63 <= value < 2 ** 64:
+            if value < 2 ** 63:
+                self.write(_TAG.pack(T_INT) + _INT.pack(value))
+            else:
+                self.write(_TAG.pack(T_UINT) + _UINT.pack(value))
+
+        elif value_type is float:
+            self.write(_TAG.pack(T_FLOAT) + _FLOAT.pack(value))
+
+        elif value_type is str:
+            if len(value) > MAX_INTERN_LEN:
+                self.write(_TAG.pack(T_BYTES) + _LENGTH.pack(len(value)))
+                self.write(value)
+            else:
+                self.write(_TAG.pack(T_STR) + _LENGTH.pack(self._intern(value)))
+
+        elif value_type is unicode:
+            value = value.encode("utf-8")
+            self.write(_TAG.pack(T_UNICODE) + _LENGTH.pack(len(value)))
+            self.write(value)
+
+        elif value_type is list or value_type is tuple:
+            self.write(_TAG.pack(T_LIST if value_type is list else T_TUPLE) + _LENGTH.pack(len(value)))
+            for item in value:
+                self.write_value(item)
+
+        elif value_type is dict:
+            self.write(_TAG.pack(T_DICT) + _LENGTH.pack(len(value)))
+            for key, item in value.iteritems():
+                self.write_value(key)
+                self.write_value(item)
+
+        else:
+            value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            self.write(_TAG.pack(T_PICKLE) + _LENGTH.pack(len(value)))
+            self.write(value)
+
+    def _write_run_info(self, run_info):
+        if run_info is None:
+            self.write(_TABLE.pack(RUN_INFO_TAG, 0))
+            return
+
+        self.write(_TABLE.pack(RUN_INFO_TAG, 1))
+        self._write_record(run_info, RUN_INFO_LAYOUT)
+
+    def _write_record(self, record, layout):
+        for (field_name, field_kind, ref_table) in layout:
+            value = getattr(record, field_name, FIELD_DEFAULTS.get(field_name))
+
+            if field_kind == F_ID_LIST:
+                if value is None:
+                    value = []
+
+                ids = [NONE_ID if item_id is None else item_id for item_id in value]
+                self.write(_LENGTH.pack(len(ids)) + struct.pack("<%dq" % len(ids), *ids))
+
+            elif field_kind == F_ARRAY_SUMMARY:
+                if value is not None:
+                    value = tuple([getattr(value, summary_field) for summary_field in ARRAY_SUMMARY_FIELDS])
+                self.write_value(value)
+
+            else:
+                self.write_value(value)
+
+    def _intern(self, value):
+        """
+        Get the string table index of a string
+        """
+        index = self.strings.get(value)
+        if index is None:
+            index = len(self.string_list)
+            self.strings[value] = index
+            self.string_list.append(value)
+
+        return index
+
+
+class DbFileReader():
+    """
+    Reads DB tables from a DIE DB file
+    """
+
+    def __init__(self, file_name):
+        """
+        Ctor
+        @param file_name: DB file name
+        """
+        self.in_file = open(file_name, 'rb')
+
+        self.buffer = ""
+        self.pos = 0
+
+        header = self.in_file.read(_HEADER.size)
+        if len(header) != _HEADER.size:
+            raise ValueError("Invalid DIE DB file: %s" % file_name)
+
+        (magic, self.version, self.strings_offset) = _HEADER.unpack(header)
+        if magic != DB_MAGIC:
+            raise ValueError("Invalid DIE DB file: %s" % file_name)
+
+        if not 1 <= self.version <= DB_VERSION:
+            raise ValueError("Unsupported DIE DB file version: %d" % self.version)
+
+        self.strings = self._read_strings()
+
+    def read_db(self):
+        """
+        Read the DB tables
+        @return: A list of the DB tables, ordered as in DIE_DB.save_db()
+        """
+        db_tables = [None] * 11
+
+        (table_tag, record_count) = self.unpack(_TABLE)
+        self._check_table(table_tag, RUN_INFO_TAG)
+        if record_count > 0:
+            if self.version == 1:
+                self.unpack(_ID)
+            db_tables[0] = self._read_record(dbRun_Info, RUN_INFO_LAYOUT)
+
+        for (table_tag, record_class, layout) in DB_TABLES:
+            (cur_table_tag, record_count) = self.unpack(_TABLE)
+            self._check_table(cur_table_tag, table_tag)
+
+            if self.version == 1:
+                table = {}
+                for record_index in xrange(record_count):
+                    (record_id,) = self.unpack(_ID)
+                    table[record_id] = self._read_record(record_class, layout)
+            else:
+                table = [self._read_record(record_class, layout) for record_index in xrange(record_count)]
+
+            db_tables[table_tag] = table
+
+        (table_tag, record_count) = self.unpack(_TABLE)
+        self._check_table(table_tag, EXCLUSIONS_TAG)
+        db_tables[7:11] = self.read_value()
+
+        if self.version == 1:
+            return to_dense_tables(db_tables)
+
+        return db_tables
+
+    def close(self):
+        self.in_file.close()
+
+    def read(self, size):
+        """
+        Read exactly size bytes (data is read from the file in chunks)
+        """
+        self._fill(size)
+
+        data = self.buffer[self.pos:self.pos + size]
+        self.pos += size
+        return data
+
+    def unpack(self, record_struct):
+        self._fill(record_struct.size)
+
+        values = record_struct.unpack_from(self.buffer, self.pos)
+        self.pos += record_struct.size
+        return values
+
+    def read_value(self):
+        """
+        Read a tagged value
+        """
+        (tag,) = self.unpack(_TAG)
+
+        if tag == T_NONE:
+            return None
+
+        if tag == T_TRUE:
+            return True
+
+        if tag == T_FALSE:
+            return False
+
+        if tag == T_INT:
+            return self.unpack(_INT)[0]
+
+        if tag == T_UINT:
+            return self.unpack(_UINT)[0]
+
+        if tag == T_FLOAT:
+            return self.unpack(_FLOAT)[0]
+
+        (length,) = self.unpack(_LENGTH)
+
+        if tag == T_STR:
+            return self.strings[length]
+
+        if tag == T_BYTES:
+            return self.read(length)
+
+        if tag == T_UNICODE:
+            return self.read(length).decode("utf-8")
+
+        if tag == T_LIST:
+            return [self.read_value() for item_index in xrange(length)]
+
+        if tag == T_TUPLE:
+            return tuple([self.read_value() for item_index in xrange(length)])
+
+        if tag == T_DICT:
+            value = {}
+            for item_index in xrange(length):
+                key = self.read_value()
+                value[key] = self.read_value()
+            return value
+
+        if tag == T_PICKLE:
+            return pickle.loads(self.read(length))
+
+        raise ValueError("Invalid DIE DB value tag: %d" % tag)
+
+    def _fill(self, size):
+        """
+        Make sure at least size bytes are buffered
+        """
+        if self.pos + size <= len(self.buffer):
+            return
+
+        self.buffer = self.buffer[self.pos:] + self.in_file.read(max(CHUNK_SIZE, size))
+        self.pos = 0
+
+        if len(self.buffer) < size:
+            raise ValueError("DIE DB file is truncated")
+
+    def _check_table(self, table_tag, expected_tag):
+        if table_tag != expected_tag:
+            raise ValueError("Invalid DIE DB table tag: %d (expected %d)" % (table_tag, expected_tag))
+
+    def _read_record(self, record_class, layout):
+        record = new_record(record_class, layout)
+
+        for (field_name, field_kind, ref_table) in layout:
+            if field_kind == F_ID_LIST:
+                (length,) = self.unpack(_LENGTH)
+                ids = struct.unpack("<%dq" % length, self.read(length * _ID.size))
+                value = [None if item_id == NONE_ID else item_id for item_id in ids]
+
+            elif field_kind == F_ARRAY_SUMMARY:
+                value = self.read_value()
+                if value is not None:
+                    value = dbArray_Summary(*value)
+
+            else:
+                value = self.read_value()
+
+            setattr(record, field_name, value)
+
+        return record
+
+    def _read_strings(self):
+        """
+        Read the string table (and rewind to the first table)
+        """
+        self.in_file.seek(self.strings_offset)
+
+        (count,) = self.unpack(_LENGTH)
+        strings = []
+        for string_index in xrange(count):
+            (length,) = self.unpack(_LENGTH)
+            strings.append(self.read(length))
+
+        self.in_file.seek(_HEADER.size)
+        self.buffer = ""
+        self.pos = 0
+
+        return strings
+
+
+def write_db_file(file_name, db_tables):
+    """
+    Write DB tables to a DIE DB file
+    @param file_name: DB file name
+    @param db_tables: A list of the DB tables, ordered as in DIE_DB.save_db()
+    """
+    writer = DbFileWriter(file_name)
+    try:
+        writer.write_db(db_tables)
+    finally:
+        writer.close()
+
+
+def read_db_file(file_name):
+    """
+    Read DB tables from a DIE DB file
+    @param file_name: DB file name
+    @return: A list of the DB tables, ordered as in DIE_DB.save_db()
+    """
+    reader = DbFileReader(file_name)
+    try:
+        return reader.read_db()
+    finally:
+        reader.close()
+
+
+def to_dense_tables(db_tables):
+    """
+    Convert id keyed DB tables (dictionaries, as saved by older DIE versions) to dense DB tables.
+    Record ids are reallocated, and record id fields are updated accordingly.
+    @param db_tables: A list of the DB tables, ordered as in DIE_DB.save_db()
+    @return: The converted DB tables list
+    """
+    id_maps = {}    # Key: table tag, Value: a dictionary of (Key: legacy record id, Value: record id)
+
+    for (table_tag, record_class, layout) in DB_TABLES:
+        id_map = {}
+        records = []
+        for record_id, record in db_tables[table_tag].iteritems():
+            id_map[record_id] = len(records)
+            records.append(record)
+
+        id_maps[table_tag] = id_map
+        db_tables[table_tag] = records
+
+    if db_tables[0] is not None:
+        _remap_record_ids(db_tables[0], RUN_INFO_LAYOUT, id_maps)
+
+    for (table_tag, record_class, layout) in DB_TABLES:
+        for record in db_tables[table_tag]:
+            _remap_record_ids(record, layout, id_maps)
+
+    return db_tables
+
+
+def _remap_record_ids(record, layout, id_maps):
+    for (field_name, field_kind, ref_table) in layout:
+        if ref_table is None:
+            continue
+
+        id_map = id_maps[ref_table]
+        value = getattr(record, field_name)
+
+        if field_kind == F_ID_LIST:
+            setattr(record, field_name, [id_map.get(record_id) for record_id in value])
+        elif value is not None:
+            setattr(record, field_name, id_map.get(value))
+
+
+class LegacyUnpickler(pickle.Unpickler):
+    """
+    Unpickles legacy (pickled) DB files. Legacy DB records were pickled as old-style class instances, which can not
+    be unpickled into the current DB record classes, so they are unpickled into placeholder classes.
+    """
+
+    legacy_classes = {}
+
+    def find_class(self, module, name):
+        if module == LEGACY_RECORDS_MODULE:
+            if not name in self.legacy_classes:
+                self.legacy_classes[name] = types.ClassType(name, (), {})
+            return self.legacy_classes[name]
+
+        return pickle.Unpickler.find_class(self, module, name)
+
+
+def _from_legacy_record(legacy_record, record_class, layout):
+    """
+    Convert a legacy (unpickled) DB record to a DB record
+    """
+    record = new_record(record_class, layout)
+
+    for (field_name, field_kind, ref_table) in layout:
+        value = getattr(legacy_record, field_name, FIELD_DEFAULTS.get(field_name))
+
+        if field_kind == F_ARRAY_SUMMARY and value is not None:
+            value = dbArray_Summary(*[getattr(value, summary_field) for summary_field in ARRAY_SUMMARY_FIELDS])
+
+        setattr(record, field_name, value)
+
+    return record
+
+
+def read_legacy_db_file(file_name):
+    """
+    Read DB tables from a legacy (pickled) DB file
+    @param file_name: DB file name
+    @return: A list of the DB tables, ordered as in DIE_DB.save_db()
+    """
+    with open(file_name, 'rb') as in_file:
+        db_tables = LegacyUnpickler(in_file).load()
+
+    if db_tables[0] is not None:
+        db_tables[0] = _from_legacy_record(db_tables[0], dbRun_Info, RUN_INFO_LAYOUT)
+
+    for (table_tag, record_class, layout) in DB_TABLES:
+        legacy_table = db_tables[table_tag]
+
+        table = {}
+        for record_id, legacy_record in legacy_table.iteritems():
+            table[record_id] = _from_legacy_record(legacy_record, record_class, layout)
+
+        db_tables[table_tag] = table
+
+    return to_dense_tables(db_tables)
+
+
+def convert_legacy_db(file_name, out_file_name=None):
+    """
+    Convert a legacy (pickled) DIE DB file to the DIE DB file format
+    @param file_name: Legacy DB file name
+    @param out_file_name: Converted DB file name (default: overwrite the legacy DB file)
+    @return: True on success otherwise False
+    """
+    try:
+        if is_db_file(file_name):
+            logging.info("DIE DB file %s is already converted", file_name)
+            return True
+
+        db_tables = read_legacy_db_file(file_name)
+
+        if out_file_name is None:
+            out_file_name = file_name
+
+        write_db_file(out_file_name, db_tables)
+
+        logging.info("Legacy DIE DB file %s converted to %s", file_name, out_file_name)
+        return True
+
+    except Exception as ex:
+        logging.error("Failed to convert legacy DIE DB file %s: %s", file_name, ex)
+        return False
@@ -0,0 +1,615 @@
+__author__ = 'yanivb'
+
+import logging
+import pickle
+import sqlite3
+
+from DIE.Lib.db_DataTypes import dbDebug_Values, dbFuncArg, \
+    dbFunction, dbFunction_Context, dbParsed_Value, dbRun_Info, dbThread, dbArray_Summary
+
+################################################################
+#
+# SQLite storage backend of the DIE DB.
+# Run data is streamed into indexed tables while debugging, and
+# DB items are queried on demand, so the DIE DB does not have to
+# fit in memory.
+#
+################################################################
+
+SQLITE_HEADER = "SQLite format 3\x00"
+STORE_VERSION = 1
+
+# Debug value kinds
+VALUE_CALL = 0          # Function call value
+VALUE_RET = 1           # Function return value
+VALUE_RET_ARG = 2       # Function return argument value
+VALUE_NESTED = 3        # Nested value (i.e struct member, array element)
+VALUE_REFERENCE = 4     # Referenced (dereferenced pointer) value
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value BLOB);
+
+CREATE TABLE IF NOT EXISTS runs (id INTEGER PRIMARY KEY, start_time REAL, end_time REAL, file TEXT, md5 TEXT,
+                                 phase_stats BLOB);
+
+CREATE TABLE IF NOT EXISTS threads (id INTEGER PRIMARY KEY, run_id INTEGER, thread_num INTEGER);
+
+CREATE TABLE IF NOT EXISTS functions (id INTEGER PRIMARY KEY, func_key TEXT UNIQUE, function_name TEXT,
+                                      function_start INTEGER, function_end INTEGER, proto_ea INTEGER,
+                                      arg_num INTEGER, is_lib_func INTEGER, lib_name TEXT,
+                                      call_count INTEGER DEFAULT 0, capture_count INTEGER DEFAULT 0);
+
+CREATE TABLE IF NOT EXISTS args (id INTEGER PRIMARY KEY, function_id INTEGER, position INTEGER, name TEXT,
+                                 type TEXT, arg_index INTEGER, is_stack INTEGER);
+
+CREATE TABLE IF NOT EXISTS contexts (id INTEGER PRIMARY KEY, function_id INTEGER, thread_row INTEGER,
+                                     thread_id INTEGER, calling_ea INTEGER, calling_func_name TEXT,
+                                     is_indirect INTEGER, is_new_func INTEGER, total_process_time REAL,
+                                     call_reg_state BLOB, ret_reg_state BLOB);
+
+CREATE TABLE IF NOT EXISTS debug_values (id INTEGER PRIMARY KEY, context_id INTEGER, kind INTEGER,
+                                         parent_id INTEGER, raw_value INTEGER, type TEXT, name TEXT,
+                                         is_definitely_parsed INTEGER, deref_depth INTEGER, best_val_id INTEGER,
+                                         reference_flink INTEGER, reference_blink INTEGER, array_summary BLOB);
+
+CREATE TABLE IF NOT EXISTS parsed_values (id INTEGER PRIMARY KEY, value_key TEXT UNIQUE, data, description,
+                                          raw, score INTEGER, type TEXT);
+
+CREATE TABLE IF NOT EXISTS value_parsed (dbg_value_id INTEGER, parsed_value_id INTEGER);
+
+CREATE INDEX IF NOT EXISTS idx_functions_name ON functions (function_name);
+CREATE INDEX IF NOT EXISTS idx_args_function ON args (function_id, position);
+CREATE INDEX IF NOT EXISTS idx_contexts_function ON contexts (function_id);
+CREATE INDEX IF NOT EXISTS idx_contexts_calling_ea ON contexts (calling_ea);
+CREATE INDEX IF NOT EXISTS idx_contexts_thread_id ON contexts (thread_id);
+CREATE INDEX IF NOT EXISTS idx_contexts_thread_row ON contexts (thread_row);
+CREATE INDEX IF NOT EXISTS idx_values_context ON debug_values (context_id, kind);
+CREATE INDEX IF NOT EXISTS idx_values_parent ON debug_values (parent_id);
+CREATE INDEX IF NOT EXISTS idx_values_type ON debug_values (type);
+CREATE INDEX IF NOT EXISTS idx_parsed_type ON parsed_values (type);
+CREATE INDEX IF NOT EXISTS idx_value_parsed_value ON value_parsed (dbg_value_id);
+CREATE INDEX IF NOT EXISTS idx_value_parsed_parsed ON value_parsed (parsed_value_id);
+"""
+
+FUNCTION_COLUMNS = "id, function_name, function_start, function_end, proto_ea, arg_num, is_lib_func, lib_name, " \
+                   "call_count, capture_count"
+CONTEXT_COLUMNS = "id, function_id, thread_id, calling_ea, calling_func_name, is_indirect, is_new_func, " \
+                  "total_process_time, call_reg_state, ret_reg_state"
+VALUE_COLUMNS = "id, context_id, raw_value, type, name, is_definitely_parsed, deref_depth, best_val_id, " \
+                "reference_flink, reference_blink, array_summary"
+PARSED_COLUMNS = "id, data, description, raw, score, type"
+
+
+def is_sqlite_file(file_name):
+    """
+    Check if a file is an SQLite database file
+    @param file_name: File name
+    @return: True if the file starts with the SQLite header, otherwise False
+    """
+    with open(file_name, "rb") as db_file:
+        return db_file.read(len(SQLITE_HEADER)) == SQLITE_HEADER
+
+
+def to_db_int(value):
+    """
+    Convert an unsigned 64bit value (address, raw value) to an SQLite integer (signed 64bit)
+    """
+    if value is not None and value >= 2 ** 63:
+        return value - 2 ** 64
+
+    return value
+
+
+def from_db_int(value):
+    """
+    Convert an SQLite integer back to an unsigned 64bit value
+    """
+    if value is not None and value < 0:
+        return value + 2 ** 64
+
+    return value
+
+
+def to_db_value(value):
+    """
+    Convert a parsed value item (data, description, raw) to an SQLite value.
+    Integers out of the SQLite integer range are stored pickled.
+    """
+    if isinstance(value, (int, long)) and not -2 ** 63 <= value < 2 ** 63:
+        return to_blob(value)
+
+    return value
+
+
+def from_db_value(value):
+    if isinstance(value, buffer):
+        return from_blob(value)
+
+    return value
+
+
+def to_blob(obj):
+    if obj is None:
+        return None
+
+    return buffer(pickle.dumps(obj, pickle.HIGHEST_PROTOCOL))
+
+
+def from_blob(blob):
+    if blob is None:
+        return None
+
+    return pickle.loads(str(blob))
+
+
+class SqliteStore():
+    """
+    SQLite storage of the DIE DB run data (functions, args, contexts, debug values, parsed values, threads and runs).
+    Items are inserted directly from the runtime objects, and queried back as db_DataTypes objects.
+    Queried items have a db_id attribute holding their row id, which is used as the item id.
+    """
+
+    def __init__(self, file_name):
+        """
+        Ctor
+        @param file_name: SQLite DB file name (created if not exists)
+        """
+        self.logger = logging.getLogger(__name__)
+
+        self.file_name = file_name
+
+        self.conn = sqlite3.connect(file_name, check_same_thread=False)
+        self.conn.text_factory = str    # Values may hold non UTF-8 data
+        self.conn.execute("PRAGMA synchronous=OFF")
+        self.conn.executescript(SCHEMA)
+
+        self.function_ids = {}  # Function id cache (Key: function key, Value: function row id)
+
+        version = self.get_meta("version")
+        if version is None:
+            self.set_meta("version", STORE_VERSION)
+        elif version != STORE_VERSION:
+            raise ValueError("Unsupported DIE DB store version %s" % version)
+
+        self.conn.commit()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+    def commit(self):
+        self.conn.commit()
+
+    def get_meta(self, key, default=None):
+        """
+        Get a DB meta item (i.e DB version, MD5, exclusion lists)
+        """
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return default
+
+        return from_blob(row[0])
+
+    def set_meta(self, key, value):
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, to_blob(value)))
+
+    #############################################################################
+    # Add store items
+    #############################################################################
+
+    def add_run(self, run_info):
+        """
+        Add a run
+        @param run_info: Run info (type: dbRun_Info)
+        @return: The run id
+        """
+        cur = self.conn.execute("INSERT INTO runs (start_time, end_time, file, md5) VALUES (?, ?, ?, ?)",
+                                (run_info.start_time, run_info.end_time, run_info.file, run_info.md5))
+        self.conn.commit()
+
+        return cur.lastrowid
+
+    def update_run(self, run_id, run_info):
+        self.conn.execute("UPDATE runs SET end_time = ?, phase_stats = ? WHERE id = ?",
+                          (run_info.end_time, to_blob(run_info.phase_stats), run_id))
+        self.conn.commit()
+
+    def add_thread(self, run_id, thread_num):
+        """
+        Add a run thread
+        @return: The thread id
+        """
+        cur = self.conn.execute("INSERT INTO threads (run_id, thread_num) VALUES (?, ?)", (run_id, thread_num))
+        return cur.lastrowid
+
+    def add_function_context(self, function_context, thread_row, thread_id):
+        """
+        Add a function context
+        @param function_context: object of type FunctionContext
+        @param thread_row: The containing thread id
+        @param thread_id: The thread number
+        @return: The function context id
+        """
+        function_id = self.add_function(function_context.function)
+
+        cur = self.conn.execute("INSERT INTO contexts (function_id, thread_row, thread_id, calling_ea, "
+                                "calling_func_name, is_indirect, is_new_func, total_process_time, "
+                                "call_reg_state, ret_reg_state) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                (function_id,
+                                 thread_row,
+                                 thread_id,
+                                 to_db_int(function_context.callingEA),
+                                 function_context.calling_function_name,
+                                 function_context.is_indirect,
+                                 function_context.is_new_func,
+                                 function_context.total_proc_time,
+                                 to_blob(function_context.callRegState),
+                                 to_blob(function_context.retRegState)))
+        context_id = cur.lastrowid
+
+        for call_value in function_context.callValues:
+            self.add_debug_value(call_value, context_id, VALUE_CALL)
+
+        for ret_value in function_context.retValues:
+            self.add_debug_value(ret_value, context_id, VALUE_RET)
+
+        if function_context.retArgValue is not None:
+            self.add_debug_value(function_context.retArgValue, context_id, VALUE_RET_ARG)
+
+        return context_id
+
+    def add_function(self, function):
+        """
+        Add a function (functions are added once)
+        @param function: object of type Function
+        @return: The function id
+        """
+        cur_function = dbFunction(function.funcName, function.func_start, function.func_end, function.proto_ea,
+                                  function.argNum, function.isLibFunc, function.library_name)
+        func_key = cur_function.__getkey__()
+
+        if func_key in self.function_ids:
+            return self.function_ids[func_key]
+
+        row = self.conn.execute("SELECT id FROM functions WHERE func_key = ?", (func_key,)).fetchone()
+        if row is not None:
+            self.function_ids[func_key] = row[0]
+            return row[0]
+
+        cur = self.conn.execute("INSERT INTO functions (func_key, function_name, function_start, function_end, "
+                                "proto_ea, arg_num, is_lib_func, lib_name) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                (func_key,
+                                 function.funcName,
+                                 to_db_int(function.func_start),
+                                 to_db_int(function.func_end),
+                                 to_db_int(function.proto_ea),
+                                 function.argNum,
+                                 function.isLibFunc,
+                                 function.library_name))
+        function_id = cur.lastrowid
+
+        for position, func_arg in enumerate(function.args):
+            self.add_func_arg(func_arg, function_id, position)
+
+        if function.retArg is not None:
+            self.add_func_arg(function.retArg, function_id, -1)
+
+        self.function_ids[func_key] = function_id
+        return function_id
+
+    def add_func_arg(self, func_arg, function_id, position):
+        """
+        Add a function argument
+        @param func_arg: object of type FuncArg
+        @param function_id: The function id
+        @param position: Argument position (-1 for the return argument)
+        """
+        self.conn.execute("INSERT INTO args (function_id, position, name, type, arg_index, is_stack) "
+                          "VALUES (?, ?, ?, ?, ?, ?)",
+                          (function_id, position, func_arg.argname, func_arg.type_str(), func_arg.argNum,
+                           func_arg.isStack()))
+
+    def add_debug_value(self, debug_value, context_id, kind, parent_id=None, ref_blink_id=None):
+        """
+        Add a debug value
+        @param debug_value: object of type DebugValue
+        @param context_id: The containing function context id
+        @param kind: Debug value kind (VALUE_CALL, VALUE_RET...)
+        @param parent_id: id of the containing (or referring) debug value
+        @param ref_blink_id: id of the referring debug value
+        @return: The debug value id
+        """
+        parsed_val_ids = []
+        best_val_id = None
+        best_score = 10
+
+        if debug_value.parsedValues is not None:
+            for parsed_val in debug_value.parsedValues:
+                parsed_val_id = self.add_parsed_val(parsed_val)
+                parsed_val_ids.append(parsed_val_id)
+
+                if parsed_val.score <= best_score:
+                    best_val_id = parsed_val_id
+                    best_score = parsed_val.score
+
+        # Array summaries are stored as a tuple of the dbArray_Summary fields
+        array_summary = None
+        if debug_value.array_summary is not None:
+            summary = debug_value.array_summary
+            array_summary = (summary.element_type_name,
+                             summary.element_num,
+                             summary.element_size,
+                             summary.fmt,
+                             summary.data,
+                             summary.min,
+                             summary.max,
+                             summary.mean,
+                             summary.zero_count)
+
+        cur = self.conn.execute("INSERT INTO debug_values (context_id, kind, parent_id, raw_value, type, name, "
+                                "is_definitely_parsed, deref_depth, best_val_id, reference_blink, array_summary) "
+                                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                (context_id,
+                                 kind,
+                                 parent_id,
+                                 to_db_int(debug_value.rawValue),
+                                 debug_value.typeName(),
+                                 debug_value.name,
+                                 debug_value.is_definitely_parsed(),
+                                 debug_value.derefrence_depth,
+                                 best_val_id,
+                                 ref_blink_id,
+                                 to_blob(array_summary)))
+        dbg_val_id = cur.lastrowid
+
+        if len(parsed_val_ids) > 0:
+            self.conn.executemany("INSERT INTO value_parsed (dbg_value_id, parsed_value_id) VALUES (?, ?)",
+                                  [(dbg_val_id, parsed_val_id) for parsed_val_id in parsed_val_ids])
+
+        for nested_val in debug_value.nestedValues:
+            self.add_debug_value(nested_val, context_id, VALUE_NESTED, parent_id=dbg_val_id)
+
+        if debug_value.reference_flink is not None:
+            ref_flink_id = self.add_debug_value(debug_value.reference_flink, context_id, VALUE_REFERENCE,
+                                                parent_id=dbg_val_id, ref_blink_id=dbg_val_id)
+            self.conn.execute("UPDATE debug_values SET reference_flink = ? WHERE id = ?", (ref_flink_id, dbg_val_id))
+
+        return dbg_val_id
+
+    def add_parsed_val(self, parsed_val):
+        """
+        Add a parsed value (identical parsed values are added once)
+        @param parsed_val: object of type ParsedValue
+        @return: The parsed value id
+        """
+        cur_parsed_val = dbParsed_Value(parsed_val.data, parsed_val.description, parsed_val.raw, parsed_val.score,
+                                        parsed_val.type)
+        value_key = cur_parsed_val.__getkey__()
+
+        row = self.conn.execute("SELECT id FROM parsed_values WHERE value_key = ?", (value_key,)).fetchone()
+        if row is not None:
+            return row[0]
+
+        cur = self.conn.execute("INSERT INTO parsed_values (value_key, data, description, raw, score, type) "
+                                "VALUES (?, ?, ?, ?, ?, ?)",
+                                (value_key,
+                                 to_db_value(parsed_val.data),
+                                 to_db_value(parsed_val.description),
+                                 to_db_value(parsed_val.raw),
+                                 parsed_val.score,
+                                 parsed_val.type))
+        return cur.lastrowid
+
+    def update_function_counts(self, call_counts, capture_counts):
+        """
+        Update the runtime call counts of the functions
+        @param call_counts: A dictionary of total call counts (Key: function name, Value: number of calls)
+        @param capture_counts: A dictionary of captured call counts (Key: function name, Value: number of calls)
+        """
+        self.conn.executemany("UPDATE functions SET call_count = ?, capture_count = ? WHERE function_name = ?",
+                              [(call_counts[func_name], capture_counts.get(func_name, 0), func_name)
+                               for func_name in call_counts])
+        self.conn.commit()
+
+    #############################################################################
+    # Retrieve store items
+    #############################################################################
+
+    def get_last_run(self):
+        """
+        Get the last run
+        @return: a tuple of (run id, run info object of type dbRun_Info), or (None, None) if no run exists.
+        """
+        row = self.conn.execute("SELECT id, start_time, end_time, file, md5, phase_stats FROM runs "
+                                "ORDER BY id DESC LIMIT 1").fetchone()
+        if row is None:
+            return None, None
+
+        run_info = dbRun_Info(row[1], row[2], row[3], row[4])
+        run_info.phase_stats = from_blob(row[5]) or {}
+        run_info.threads = [thread_row for (thread_row,) in
+                            self.conn.execute("SELECT id FROM threads WHERE run_id = ?", (row[0],))]
+
+        return row[0], run_info
+
+    def get_functions(self):
+        return [self._function(row) for row in
+                self.conn.execute("SELECT %s FROM functions" % FUNCTION_COLUMNS)]
+
+    def get_function_by_name(self, function_name):
+        row = self.conn.execute("SELECT %s FROM functions WHERE function_name = ? LIMIT 1" % FUNCTION_COLUMNS,
+                                (function_name,)).fetchone()
+        if row is None:
+            return None
+
+        return self._function(row)
+
+    def get_function_context_list(self, function=None):
+        if function is None:
+            rows = self.conn.execute("SELECT %s FROM contexts" % CONTEXT_COLUMNS)
+        else:
+            rows = self.conn.execute("SELECT %s FROM contexts WHERE function_id = ?" % CONTEXT_COLUMNS,
+                                     (function.db_id,))
+
+        return [self._context(row) for row in rows.fetchall()]
+
+    def get_function_context_dict(self, function=None):
+        function_context_dict = {}
+
+        for function_context in self.get_function_context_list(function):
+            function_context_dict.setdefault(function_context.calling_ea, []).append(function_context)
+
+        return function_context_dict
+
+    def get_function_context(self, func_context_id):
+        row = self.conn.execute("SELECT %s FROM contexts WHERE id = ?" % CONTEXT_COLUMNS,
+                                (func_context_id,)).fetchone()
+        if row is None:
+            return None
+
+        return self._context(row)
+
+    def get_context_values(self, function_context, kind):
+        """
+        Get the debug values of a function context
+        @param function_context: The function context (type: dbFunction_Context)
+        @param kind: Debug value kind (VALUE_CALL, VALUE_RET or VALUE_RET_ARG)
+        @return: a list of debug values (type: dbDebug_Values)
+        """
+        rows = self.conn.execute("SELECT %s FROM debug_values WHERE context_id = ? AND kind = ? ORDER BY id"
+                                 % VALUE_COLUMNS, (function_context.db_id, kind))
+
+        return [self._value(row) for row in rows.fetchall()]
+
+    def get_function_arg(self, arg_id):
+        row = self.conn.execute("SELECT name, type, arg_index, is_stack FROM args WHERE id = ?",
+                                (arg_id,)).fetchone()
+        if row is None:
+            return None
+
+        return dbFuncArg(row[0], row[1], row[2], bool(row[3]))
+
+    def get_parsed_values(self, dbg_value=None):
+        if dbg_value is None:
+            rows = self.conn.execute("SELECT %s FROM parsed_values" % PARSED_COLUMNS)
+        else:
+            rows = self.conn.execute("SELECT %s FROM parsed_values WHERE id IN "
+                                     "(SELECT parsed_value_id FROM value_parsed WHERE dbg_value_id = ?)"
+                                     % PARSED_COLUMNS, (dbg_value.db_id,))
+
+        return [self._parsed_value(row) for row in rows.fetchall()]
+
+    def get_parsed_values_by_type(self, value_type):
+        rows = self.conn.execute("SELECT %s FROM parsed_values WHERE type = ?" % PARSED_COLUMNS, (value_type,))
+        return [self._parsed_value(row) for row in rows.fetchall()]
+
+    def get_all_value_types(self):
+        return [value_type for (value_type,) in self.conn.execute("SELECT DISTINCT type FROM parsed_values")]
+
+    def get_dbg_value(self, dbg_val_id):
+        row = self.conn.execute("SELECT %s FROM debug_values WHERE id = ?" % VALUE_COLUMNS,
+                                (dbg_val_id,)).fetchone()
+        if row is None:
+            return None
+
+        return self._value(row)
+
+    def get_parsed_value_contexts(self, value):
+        rows = self.conn.execute("SELECT %s FROM contexts WHERE id IN "
+                                 "(SELECT context_id FROM debug_values WHERE id IN "
+                                 "(SELECT dbg_value_id FROM value_parsed WHERE parsed_value_id = ?))"
+                                 % CONTEXT_COLUMNS, (value.db_id,))
+
+        return [self._context(row) for row in rows.fetchall()]
+
+    def count_function_occurs(self, function, thread_id=None):
+        if thread_id is None:
+            row = self.conn.execute("SELECT COUNT(*) FROM contexts WHERE function_id = ?",
+                                    (function.db_id,)).fetchone()
+        else:
+            row = self.conn.execute("SELECT COUNT(*) FROM contexts WHERE function_id = ? AND thread_id = ?",
+                                    (function.db_id, thread_id)).fetchone()
+        return row[0]
+
+    def get_thread_list(self):
+        thread_list = []
+
+        for (thread_row, thread_num) in self.conn.execute("SELECT id, thread_num FROM threads").fetchall():
+            cur_thread = dbThread(thread_num)
+            cur_thread.db_id = thread_row
+            cur_thread.cfg = [context_id for (context_id,) in
+                              self.conn.execute("SELECT id FROM contexts WHERE thread_row = ? ORDER BY id",
+                                                (thread_row,))]
+            thread_list.append(cur_thread)
+
+        return thread_list
+
+    def count_items(self, table_name):
+        """
+        Count the items of a store table
+        """
+        return self.conn.execute("SELECT COUNT(*) FROM %s" % table_name).fetchone()[0]
+
+    #############################################################################
+    # Row conversion
+
+    def _function(self, row):
+        cur_function = dbFunction(row[1], from_db_int(row[2]), from_db_int(row[3]), from_db_int(row[4]), row[5],
+                                  bool(row[6]), row[7])
+        cur_function.db_id = row[0]
+        cur_function.call_count = row[8]
+        cur_function.capture_count = row[9]
+
+        for (arg_id, position) in self.conn.execute("SELECT id, position FROM args WHERE function_id = ? "
+                                                    "ORDER BY position", (row[0],)):
+            if position == -1:
+                cur_function.ret_arg = arg_id
+            else:
+                cur_function.args.append(arg_id)
+
+        return cur_function
+
+    def _context(self, row):
+        cur_context = dbFunction_Context(from_blob(row[8]), from_blob(row[9]), from_db_int(row[3]), bool(row[5]),
+                                         bool(row[6]), row[4], row[7], row[2])
+        cur_context.db_id = row[0]
+        cur_context.function = row[1]
+
+        for (dbg_val_id, kind) in self.conn.execute("SELECT id, kind FROM debug_values WHERE context_id = ? "
+                                                    "AND kind <= ? ORDER BY id", (row[0], VALUE_RET_ARG)):
+            if kind == VALUE_CALL:
+                cur_context.call_values.append(dbg_val_id)
+            elif kind == VALUE_RET:
+                cur_context.ret_values.append(dbg_val_id)
+            else:
+                cur_context.ret_arg_value = dbg_val_id
+
+        return cur_context
+
+    def _value(self, row):
+        cur_value = dbDebug_Values(from_db_int(row[2]), row[3], row[4], bool(row[5]), row[6])
+        cur_value.db_id = row[0]
+        cur_value.function_context = row[1]
+        cur_value.best_val_id = row[7]
+        cur_value.reference_flink = row[8]
+        cur_value.reference_blink = row[9]
+        array_summary = from_blob(row[10])
+        if array_summary is not None:
+            cur_value.array_summary = dbArray_Summary(*array_summary)
+
+        cur_value.parsed_values = [parsed_val_id for (parsed_val_id,) in
+                                   self.conn.execute("SELECT parsed_value_id FROM value_parsed "
+                                                     "WHERE dbg_value_id = ?", (row[0],))]
+
+        cur_value.nested_values = [nested_val_id for (nested_val_id,) in
+                                   self.conn.execute("SELECT id FROM debug_values WHERE parent_id = ? AND kind = ? "
+                                                     "ORDER BY id", (row[0], VALUE_NESTED))]
+
+        return cur_value
+
+    def _parsed_value(self, row):
+        cur_parsed_val = dbParsed_Value(from_db_value(row[1]), from_db_value(row[2]), from_db_value(row[3]), row[4],
+                                        row[5])
+        cur_parsed_val.db_id = row[0]
+
+        return cur_parsed_val
@@ -5,6 +5,9 @@ import logging
 import idaapi
 import idc
 import sys
+import threading
+
+from DIE.Lib.PhaseTimers import get_phase_timers, timer, PHASE_PARSER
 
 try:
     # TODO: Is singleton really required here? python modules are basically singleton by design
@@ -28,6 +31,10 @@ class DataParser():
 
         self.pManager = PluginManagerSingleton.get()            # Plugin manager
 
+        # Parser plugins keep their state while parsing, so each plugin may only parse a single value at a time.
+        self.plugin_locks = {}
+        self.plugin_locks_lock = threading.Lock()
+
     def set_plugin_path(self, plugin_path):
         """
         Set the data parser plugin path
@@ -129,50 +136,103 @@ class DataParser():
             else:
                 self.type_parsers[stype] = [parser_plugin]
 
-    def ParseData(self, rawData, type=None, loc=None, custom_parser=None):
+    def ParseData(self, rawData, type=None, loc=None, custom_parser=None, type_name=None):
         """
         Parse Data
         @param rawData: The raw data to be parsed
         @param type: The data type (If unknown should be None)
         @param loc: raw value (memory) location
         @param custom_parser: A custom parser to use.
+        @param type_name: The data type name (as returned by print_tinfo). If None it will be resolved from type.
         @return: A list of ParsedValue objects (containing the guessed\exact parsed values)
         """
-        parsedValues = []
-
         try:
-            # If custom parser was defined
-            if custom_parser is not None:
-                custom_parser.run(rawData, type, match_override=True)
-                ret_vals = custom_parser.getParsedValues()
-                parsedValues.extend(ret_vals)
+            resolved_plugins = self.resolve_plugins(type, custom_parser, type_name)
+            return self.run_resolved_plugins(rawData, resolved_plugins)
 
-                return parsedValues
+        except Exception as ex:
+            self.logger.error("Error while parsing data: %s", ex)
+
+    def resolve_plugins(self, type=None, custom_parser=None, type_name=None):
+        """
+        Resolve the parser plugins handling a value, and how each of them should parse it.
+        Plugin type matching may query the IDA type, so this must be called from the main thread.
+        @param type: The data type (If unknown should be None)
+        @param custom_parser: A custom parser to use.
+        @param type_name: The data type name (as returned by print_tinfo). If None it will be resolved from type.
+        @return: A list of (parser plugin, parse mode, type parameters) tuples
+        """
+        if type is not None and type_name is None:
+            type_name = idaapi.print_tinfo('', 0, 0, idaapi.PRTYPE_1LINE, type, '', '')
 
-            # if type is known, try to look it up in the parser_type dict
-            if type is not None:
-                type_name = idaapi.print_tinfo('', 0, 0, idaapi.PRTYPE_1LINE, type, '', '')
-                type_name = self.typeName_norm(type_name)
+        # If custom parser was defined
+        if custom_parser is not None:
+            return self.resolve_plugin_list([custom_parser], type, type_name, match_override=True)
 
-                if type_name in self.type_parsers:
-                    for parser_plugin in self.type_parsers[type_name]:
-                        parser_plugin.run(rawData, type)
-                        ret_vals = parser_plugin.getParsedValues()
-                        parsedValues.extend(ret_vals)
+        # if type is known, try to look it up in the parser_type dict
+        if type is not None:
+            norm_type_name = self.typeName_norm(type_name)
 
-                    return parsedValues
+            if norm_type_name in self.type_parsers:
+                return self.resolve_plugin_list(self.type_parsers[norm_type_name], type, type_name)
 
-            # Otherwise, the entire plugin list has to be iterated
-            for pluginInfo in self.pManager.getAllPlugins():
-                if pluginInfo.is_activated:
-                    pluginInfo.plugin_object.run(rawData, type)
-                    ret_vals = pluginInfo.plugin_object.getParsedValues()
-                    parsedValues.extend(ret_vals)
+        # Otherwise, the entire plugin list has to be iterated
+        plugin_list = [pluginInfo.plugin_object for pluginInfo in self.pManager.getAllPlugins()
+                       if pluginInfo.is_activated]
 
-            return parsedValues
+        return self.resolve_plugin_list(plugin_list, type, type_name)
 
-        except Exception as ex:
-            self.logger.error("Error while parsing data: %s", ex)
+    def resolve_plugin_list(self, plugin_list, type, type_name, match_override=False):
+        """
+        Resolve the parse mode of each plugin in a plugin list
+        @param plugin_list: A list of parser plugin objects
+        @param type: The data type (If unknown should be None)
+        @param type_name: The data type name
+        @param match_override: Bypass the plugin type matching
+        @return: A list of (parser plugin, parse mode, type parameters) tuples for plugins handling the value
+        """
+        resolved_plugins = []
+
+        for parser_plugin in plugin_list:
+            with self.get_plugin_lock(parser_plugin):
+                (parse_mode, type_params) = parser_plugin.resolve(type, match_override, type_name)
+
+            if parse_mode is not None:
+                resolved_plugins.append((parser_plugin, parse_mode, type_params))
+
+        return resolved_plugins
+
+    def run_resolved_plugins(self, rawData, resolved_plugins):
+        """
+        Run resolved parser plugins (see resolve_plugins)
+        @param rawData: The raw data to be parsed
+        @param resolved_plugins: A list of (parser plugin, parse mode, type parameters) tuples
+        @return: A list of ParsedValue objects (containing the guessed\exact parsed values)
+        """
+        parsedValues = []
+
+        for (parser_plugin, parse_mode, type_params) in resolved_plugins:
+            with self.get_plugin_lock(parser_plugin):
+                start_time = timer()
+                try:
+                    parsedValues.extend(parser_plugin.run_resolved(rawData, parse_mode, type_params))
+
+                finally:
+                    get_phase_timers().add(PHASE_PARSER % parser_plugin.__class__.__name__, start_time)
+
+        return parsedValues
+
+    def get_plugin_lock(self, parser_plugin):
+        """
+        Get the lock object guarding a parser plugin
+        @param parser_plugin: The parser plugin object
+        @return: A lock object
+        """
+        with self.plugin_locks_lock:
+            if not parser_plugin in self.plugin_locks:
+                self.plugin_locks[parser_plugin] = threading.Lock()
+
+            return self.plugin_locks[parser_plugin]
 
 
     def typeName_norm(self, type_name):
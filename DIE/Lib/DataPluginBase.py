@@ -4,9 +4,15 @@ import logging
 
 from yapsy.PluginManager import IPlugin
 from DIE.Lib.ParsedValue import ParsedValue
+import DIE.Lib.DbgMemory
 from idaapi import *
 from idautils import *
 from idc import *
+import idc
+
+# Plugin parse modes (see DataPluginBase.resolve)
+PARSE_GUESS = 1     # Value type is unknown, guess possible values
+PARSE_VALUE = 2     # Value type is supported by the plugin, parse the value
 
 
 class DataPluginBase(IPlugin):
@@ -20,6 +26,11 @@ class DataPluginBase(IPlugin):
     author = ""
     is_activated = True
 
+    # Thread-safe plugins only use plain data while parsing (the raw value, type parameters and captured memory),
+    # so they may run on the parser workers after the debuggee has resumed.
+    # Plugins which query IDA or the live debuggee (e.g. by opening the debugged process) must leave this unset.
+    is_thread_safe = False
+
     supported_types = []       # supported_types hold tuples containing the supported type name and the type description
     type = None                # The value type (or None if unidentified).
     loc = None                 # The value (memory) location.
@@ -30,6 +41,7 @@ class DataPluginBase(IPlugin):
     def __init__(self):
         self.logger = logging.getLogger(__name__)
         self.type_params = None      # Currently parsed type parameters
+        self.type_name = None        # Currently parsed type name (as returned by print_tinfo)
 
     def initPlugin(self, type_norm_callback=None):
         """
@@ -76,31 +88,59 @@ class DataPluginBase(IPlugin):
         registration should be made using self.addSuportedType()
         """
 
-    def run(self, rawData, type, match_override=False):
+    def run(self, rawData, type, match_override=False, type_name=None):
         """
         Run Plugin
         @param rawData: the raw data to be parsed
         @param type: data type (None if unknown)
         @param match_override: set this flag in order to bypass the plugin type matching method.
+        @param type_name: data type name, if already known (saves resolving it from type)
         @return: DebugValue array with the parsed data
         """
 
-        self.parsedValues = []  # Initialize parsed value list
+        (parse_mode, type_params) = self.resolve(type, match_override, type_name)
+        return self.run_resolved(rawData, parse_mode, type_params)
+
+    def resolve(self, type, match_override=False, type_name=None):
+        """
+        Resolve how a value should be parsed by this plugin.
+        Type matching may query the IDA type, so this must be called from the main thread.
+        @param type: data type (None if unknown)
+        @param match_override: set this flag in order to bypass the plugin type matching method.
+        @param type_name: data type name, if already known (saves resolving it from type)
+        @return: A tuple of (parse mode, type parameters). parse mode is None if the plugin does not handle the value.
+        """
+        self.type_name = type_name
+        self.type_params = None
 
         # If type was not recognized, try to guess the value.
         if type is None:
+            return (PARSE_GUESS, None)
+
+        # If bypass match flag is set, or type matches the plugin parser type, parse the value.
+        if match_override or self.matchType(type):
+            return (PARSE_VALUE, self.type_params)
+
+        return (None, None)
+
+    def run_resolved(self, rawData, parse_mode, type_params):
+        """
+        Run the plugin parser logic for a resolved value (see resolve()). The IDA type is not used here.
+        @param rawData: the raw data to be parsed
+        @param parse_mode: The parse mode (PARSE_XXX)
+        @param type_params: The matched type parameters
+        @return: DebugValue array with the parsed data
+        """
+        self.parsedValues = []  # Initialize parsed value list
+        self.type_params = type_params
+
+        if parse_mode == PARSE_GUESS:
             self.guessValues(rawData)
-            return self.parsedValues
 
-        # If bypass match flag is set, force parsing.
-        if match_override:
+        elif parse_mode == PARSE_VALUE:
             self.parseValue(rawData)
-            return self.parsedValues
 
-        # Otherwise, if type matches the plugin parser type, run the parser logic.
-        if self.matchType(type):
-            self.parseValue(rawData)
-            return self.parsedValues
+        return self.parsedValues
 
     def setPluginType(self, type):
         """
@@ -137,7 +177,9 @@ class DataPluginBase(IPlugin):
         @param type: IDA type_into_t object
         @return: True if type name is supported or otherwise False
         """
-        tname = idaapi.print_tinfo('', 0, 0, idaapi.PRTYPE_1LINE, type, '', '')
+        tname = self.type_name
+        if tname is None:
+            tname = idaapi.print_tinfo('', 0, 0, idaapi.PRTYPE_1LINE, type, '', '')
 
         if self.typeName_norm_cb is not None:
             type_name = self.typeName_norm_cb(tname)
@@ -169,6 +211,23 @@ class DataPluginBase(IPlugin):
         parsed_val = ParsedValue(value, description, score, raw, self.type)
         self.parsedValues.append(parsed_val)
 
+    def get_string(self, ea, strtype=idc.ASCSTR_C):
+        """
+        Get a string from the debuggee memory.
+        Plugins should use this method (rather than idc.GetString) since values may be parsed after the debuggee
+        has resumed, in which case the string is read from the memory captured while it was suspended.
+        @param ea: String address
+        @param strtype: IDA string type (ASCSTR_XXX)
+        @return: The string value, or None if not found
+        """
+        return DIE.Lib.DbgMemory.get_string(ea, strtype)
+
+    def get_pid(self):
+        """
+        Get the debugged process id
+        """
+        return DIE.Lib.DbgMemory.get_event_pid()
+
     def getParsedValues(self):
         """
         Get the parsed values list
@@ -1,11 +1,15 @@
 __author__ = 'yanivb'
 
 import logging
+import os
+import bisect
+
+import idautils
 
 from idaapi import *
 from idc import *
 from idautils import *
-from DIE.Lib.IDAConnector import get_adrs_mem
+from DIE.Lib.IDAConnector import get_adrs_mem_block, unpack_native, get_native_size
 
 
 class StaticImports():
@@ -18,6 +22,12 @@ class StaticImports():
 
         self.iat = {}
         self.current_module = None
+        self.current_module_name = None
+
+        # Lookup indexes, built along with self.iat
+        self.name_modules = {}      # Key -> function name, Value -> set of module names importing it
+        self.ea_imports = {}        # Key -> IAT entry ea, Value -> (module name, function name, ordinal)
+        self.module_names = {}      # Key -> module name, Value -> set of imported function names
 
         self.get_iat_data()
 
@@ -27,8 +37,11 @@ class StaticImports():
         """
         if name is not None:
             name = name.lower()
+            self.name_modules.setdefault(name, set()).add(self.current_module_name)
+            self.module_names[self.current_module_name].add(name)
 
         self.current_module.append((ea, name, ord))
+        self.ea_imports[ea] = (self.current_module_name, name, ord)
 
         # (Continue enumeration)
         return True
@@ -47,37 +60,29 @@ class StaticImports():
 
             if not name in self.iat:
                 self.iat[name]= []
+                self.module_names[name] = set()
 
             self.current_module = self.iat[name]
+            self.current_module_name = name
             idaapi.enum_import_names(i, self.imp_cb)
 
     def is_funcname_in_module(self, func_name, module_name):
         """
         Check if function name is part of an imported module (For example: is SetTextColor part of GDI32)
         """
-        if module_name is not None:
-            module_name = module_name.lower()
+        if module_name is None or func_name is None:
+            return False
 
-        if func_name is not None:
-            func_name = func_name.lower()
-
-        if module_name.lower() in self.iat:
-            for ea, name, ord in self.iat[module_name.lower()]:
-                if name == func_name:
-                    return True
-
-        return False
+        return func_name.lower() in self.module_names.get(module_name.lower(), ())
 
     def is_funcea_in_module(self, func_ea, module_name):
         """
         Check if function address is part of an imported module (For example: is SetTextColor part of GDI32)
         """
-        if module_name.lower() in self.iat:
-            for ea, name, ord in self.iat[module_name.lower()]:
-                if ea == func_ea:
-                    return True
+        if module_name is None or not func_ea in self.ea_imports:
+            return False
 
-        return False
+        return self.ea_imports[func_ea][0] == module_name.lower()
 
     def get_func_module(self, func_ea):
         """
@@ -85,14 +90,22 @@ class StaticImports():
         @param func_ea: function`s effective address
         @return: Return the containing library name or None if not a library function
         """
-
-        for lib_name in self.iat:
-            (ea, name, ord) = self.iat[lib_name]
-            if ea == func_ea:
-                return lib_name
+        if func_ea in self.ea_imports:
+            return self.ea_imports[func_ea][0]
 
         return None
 
+    def get_funcname_modules(self, func_name):
+        """
+        Get the names of the modules importing a function name
+        @param func_name: function name
+        @return: a set of module names (empty if the function is not imported)
+        """
+        if func_name is None:
+            return set()
+
+        return self.name_modules.get(func_name.lower(), set())
+
     def is_module_call(self, func_name, module_name, ea=None):
         """
         Checks if a function name and\or ea is part of a loaded module
@@ -110,6 +123,92 @@ class StaticImports():
 
         return False
 
+def get_module_name(library_path):
+    """
+    Get the import module name of a library (i.e "C:\\Windows\\System32\\KERNEL32.DLL" -> "kernel32")
+    @param library_path: Library file path
+    @return: The lower case library file name, without extension
+    """
+    library_name = os.path.basename(library_path.replace("\\", "/")).lower()
+    return os.path.splitext(library_name)[0]
+
+
+class ModuleRanges():
+    """
+    Sorted interval index of the loaded library address ranges.
+    Used to classify any runtime address by its containing library, including functions reached without
+    passing through the IAT (GetProcAddress, delay-loading, jump thunks..)
+    """
+
+    def __init__(self):
+
+        self.starts = []    # Sorted module base addresses
+        self.ends = []      # Module end addresses, aligned with self.starts
+        self.names = []     # Module names, aligned with self.starts
+
+    def clear(self):
+        del self.starts[:]
+        del self.ends[:]
+        del self.names[:]
+
+    def load(self):
+        """
+        Rebuild the index from the modules currently loaded by the debuggee (the analyzed module is not indexed)
+        """
+        self.clear()
+
+        for module in idautils.Modules():
+            self.add_module(module.name, module.base, module.size)
+
+    def add_module(self, library_path, base, size):
+        """
+        Add a loaded library
+        @param library_path: Library file path
+        @param base: Library base address
+        @param size: Library image size
+        """
+        module_name = get_module_name(library_path)
+
+        # The analyzed module is native code
+        if module_name == get_module_name(idaapi.get_root_filename()):
+            return
+
+        index = bisect.bisect_left(self.starts, base)
+        if index < len(self.starts) and self.starts[index] == base:
+            self.ends[index] = base + size
+            self.names[index] = module_name
+            return
+
+        self.starts.insert(index, base)
+        self.ends.insert(index, base + size)
+        self.names.insert(index, module_name)
+
+    def remove_module(self, library_path):
+        """
+        Remove an unloaded library
+        @param library_path: Library file path
+        """
+        module_name = get_module_name(library_path)
+
+        if module_name in self.names:
+            index = self.names.index(module_name)
+            del self.starts[index]
+            del self.ends[index]
+            del self.names[index]
+
+    def find_module(self, ea):
+        """
+        Find the library containing an address
+        @param ea: Runtime address
+        @return: The containing library module name, or None if not within a loaded library
+        """
+        index = bisect.bisect_right(self.starts, ea) - 1
+        if index >= 0 and ea < self.ends[index]:
+            return self.names[index]
+
+        return None
+
+
 class DbgImports():
     """
     DbgImports contains the names, ordinals and addresses of all imported functions as allocated at runtime.
@@ -125,33 +224,116 @@ class DbgImports():
 
         self.rt_import_table = {}  # Real-Time import table (Key -> Real func adrs.  Value -> (ea, name, ord)}
 
+        self.static_imports = None  # Static import table data (Key -> module name, Value -> list of (ea, name, ord))
+        self.module_adrs = {}       # Resolved runtime addresses (Key -> module name, Value -> list of real func adrs)
 
-    def getImportTableData(self):
+        self.module_ranges = ModuleRanges()  # Loaded library address ranges
+
+    def get_static_imports(self):
         """
-        Update rt_import_table with current import table data.
+        Get the static import table data (w\o real function addresses). The data is enumerated once.
+        @return: a dictionary of (Key -> module name, Value -> list of (ea, name, ord) sorted by ea)
         """
-
         def imp_cb(ea, name, ord):
             """
             Import enumeration callback function. used by idaapi.enum_import_names .
             """
-            tmpImports.append([self.current_module_name, ea, name, ord])
+            self.static_imports[self.current_module_name].append((ea, name, ord))
             return True
 
-        tmpImports = []  # Contains static import table data (w\o real function addresses)
-        imp_num = idaapi.get_import_module_qty()  # Number of imported modules
+        if self.static_imports is None:
+            self.static_imports = {}
+            imp_num = idaapi.get_import_module_qty()  # Number of imported modules
+
+            for i in xrange(0, imp_num):
+                self.current_module_name = idaapi.get_import_module_name(i).lower()
+                self.static_imports.setdefault(self.current_module_name, [])
+                idaapi.enum_import_names(i, imp_cb)
 
-        for i in xrange(0, imp_num):
-            self.current_module_name = idaapi.get_import_module_name(i).lower()
-            idaapi.enum_import_names(i, imp_cb)
+            for module_name in self.static_imports:
+                self.static_imports[module_name].sort()
 
-        #  Get runtime function addresses and store in self.rt_import_table
+        return self.static_imports
+
+    def getImportTableData(self):
+        """
+        Update rt_import_table with current import table data.
+        """
         if not idaapi.is_debugger_on():
             raise RuntimeError("Debugger is not currently active.")
 
-        for module_name, ea, name, ord in tmpImports:
-            func_real_adrs = get_adrs_mem(ea)
-            self.rt_import_table[func_real_adrs] = (module_name, ea, name, ord)
+        self.module_ranges.load()
+
+        for module_name in self.get_static_imports():
+            self.refresh_module(module_name)
+
+    def refresh_module(self, module_name):
+        """
+        Update rt_import_table with the current IAT data of a single imported module.
+        The module IAT slots are read as contiguous memory blocks rather than one slot at a time.
+        @param module_name: Imported module name
+        @return: a tuple of (removed real func adrs list, added rt_import_table entries dictionary)
+        """
+        imports = self.get_static_imports().get(module_name, [])
+        slot_size = get_native_size() / 8
+
+        # Remove the previously resolved addresses of this module
+        removed_adrs = []
+        for func_real_adrs in self.module_adrs.pop(module_name, []):
+            if self.rt_import_table.get(func_real_adrs, (None,))[0] == module_name:
+                del self.rt_import_table[func_real_adrs]
+                removed_adrs.append(func_real_adrs)
+
+        added_entries = {}
+
+        # Split the IAT slots into runs of adjacent slots, and read each run with a single memory read
+        run_start = 0
+        while run_start < len(imports):
+            run_end = run_start + 1
+            while run_end < len(imports) and imports[run_end][0] - imports[run_end - 1][0] <= slot_size:
+                run_end += 1
+
+            block_ea = imports[run_start][0]
+            block = get_adrs_mem_block(block_ea, imports[run_end - 1][0] - block_ea + slot_size)
+
+            if block is not None:
+                for (ea, name, ord) in imports[run_start:run_end]:
+                    func_real_adrs = unpack_native(block, ea - block_ea)
+                    added_entries[func_real_adrs] = (module_name, ea, name, ord)
+
+            run_start = run_end
+
+        self.rt_import_table.update(added_entries)
+        self.module_adrs[module_name] = added_entries.keys()
+
+        # Addresses re-used by this module are no longer removed
+        removed_adrs = [func_real_adrs for func_real_adrs in removed_adrs if not func_real_adrs in added_entries]
+
+        return removed_adrs, added_entries
+
+    def refresh_library(self, library_path):
+        """
+        Update rt_import_table with the IAT data of the module matching a (newly loaded) library
+        @param library_path: Library file path (as reported by the debugger)
+        @return: a tuple of (removed real func adrs list, added rt_import_table entries dictionary).
+                 If the library is not imported, a tuple of ([], {}) is returned.
+        """
+        library_name = os.path.basename(library_path.replace("\\", "/")).lower()
+
+        static_imports = self.get_static_imports()
+        for module_name in (library_name, get_module_name(library_path)):
+            if module_name in static_imports:
+                return self.refresh_module(module_name)
+
+        return [], {}
+
+    def find_func_module(self, ea):
+        """
+        Find the library containing a function, by its runtime address range
+        @param ea: Runtime address of the function
+        @return: The library module name, or None if this is not a library function
+        """
+        return self.module_ranges.find_module(ea)
 
     def find_func_iat_adrs(self, ea):
         """
@@ -0,0 +1,317 @@
+__author__ = 'yanivb'
+
+import logging
+import struct
+
+import idc
+import idaapi
+
+from DIE.Lib.IDAConnector import get_adrs_mem_block, unpack_native, get_stack_element_size, get_sp, \
+    get_register_names, set_captured_memory, get_captured_memory, read_dbg_memory, PAGE_SIZE
+
+MAX_STRING_LEN = 0x400      # Maximal length of a string decoded from captured memory
+
+################################################################
+#
+# DbgMemory holds helpers for reading debuggee memory in bulk.
+# Reading memory through the debugger is expensive (especially
+# when using a remote debugger), so values are read in large
+# blocks and decoded locally whenever possible.
+#
+################################################################
+
+
+class StackSnapshot():
+    """
+    A snapshot of a stack memory area taken with a single debugger read.
+    Used to decode stack based values (return address, stack arguments) without issuing a debugger read per value.
+    """
+
+    def __init__(self, base_ea, size):
+        """
+        Ctor
+        @param base_ea: Snapshot start address (usually the current stack pointer)
+        @param size: Snapshot size (in bytes)
+        """
+        self.logger = logging.getLogger(__name__)
+
+        self.base_ea = base_ea      # Snapshot start address
+        self.size = size            # Snapshot size
+        self.data = None            # Raw snapshot data
+
+        self.take_snapshot()
+
+    def take_snapshot(self):
+        """
+        Read the stack area from the debuggee
+        @return: True if the snapshot was taken successfully, otherwise False
+        """
+        try:
+            self.data = get_adrs_mem_block(self.base_ea, self.size)
+            return self.data is not None
+
+        except Exception as ex:
+            self.logger.error("Failed to take stack snapshot at %s: %s", hex(self.base_ea), ex)
+            self.data = None
+            return False
+
+    def contains(self, ea, size=None):
+        """
+        Check if a memory range is covered by this snapshot
+        @param ea: Range start address
+        @param size: Range size (defaults to a single stack element)
+        @return: True if the entire range is covered by the snapshot, otherwise False
+        """
+        if self.data is None or ea is None:
+            return False
+
+        if size is None:
+            size = get_stack_element_size()
+
+        offset = ea - self.base_ea
+        return offset >= 0 and offset + size <= len(self.data)
+
+    def get_native_value(self, ea):
+        """
+        Get a native size value from the snapshot
+        @param ea: Value address
+        @return: The value at ea, or None if ea is not covered by the snapshot.
+        """
+        if not self.contains(ea):
+            return None
+
+        return unpack_native(self.data, ea - self.base_ea)
+
+
+class CapturedMemory():
+    """
+    Debuggee memory (and process data) captured during a debugger stop.
+    Used to parse values after the debuggee has resumed execution, when its live memory can no longer be trusted,
+    and to rebuild values from a recorded trace.
+    """
+
+    def __init__(self, pid=None):
+        """
+        Ctor
+        @param pid: Debugged process id
+        """
+        self.pid = pid          # Debugged process id
+        self.blocks = []        # Captured memory blocks (list of (block_ea, block_data) tuples)
+        self.registers = {}     # Captured register values (Key: upper case register name, Value: register value)
+
+    def get_reg_value(self, reg_name):
+        """
+        Get a captured register value
+        @param reg_name: Register name
+        @return: The register value, or None if the register was not captured.
+        """
+        return self.registers.get(reg_name.upper())
+
+    def add_block(self, ea, data):
+        """
+        Add a captured memory block
+        @param ea: Block start address
+        @param data: Block data
+        """
+        if ea is None or data is None:
+            return
+
+        self.blocks.append((ea, data))
+
+    def read(self, ea, size):
+        """
+        Read captured memory
+        @param ea: Start address
+        @param size: Number of bytes to read
+        @return: The data read, or None if the requested range was not captured.
+        """
+        if ea is None:
+            return None
+
+        for (block_ea, block_data) in self.blocks:
+            offset = ea - block_ea
+            if offset >= 0 and offset + size <= len(block_data):
+                return block_data[offset:offset + size]
+
+        return None
+
+    def read_native(self, ea):
+        """
+        Read a native size value from captured memory
+        @param ea: Value address
+        @return: The value at ea, or None if it was not captured.
+        """
+        if ea is None:
+            return None
+
+        for (block_ea, block_data) in self.blocks:
+            offset = ea - block_ea
+            if offset >= 0 and offset < len(block_data):
+                return unpack_native(block_data, offset)
+
+        return None
+
+    def get_string(self, ea, strtype=idc.ASCSTR_C):
+        """
+        Decode a string from captured memory
+        @param ea: String address
+        @param strtype: IDA string type (ASCSTR_XXX)
+        @return: The decoded string, or None if it was not captured.
+        """
+        if ea is None:
+            return None
+
+        for (block_ea, block_data) in self.blocks:
+            offset = ea - block_ea
+            if offset >= 0 and offset < len(block_data):
+                return decode_string(block_data[offset:], strtype)
+
+        return None
+
+
+def decode_string(data, strtype=idc.ASCSTR_C):
+    """
+    Decode a string from raw memory, the same way IDA`s GetString does
+    @param data: Raw memory starting at the string address
+    @param strtype: IDA string type (ASCSTR_XXX)
+    @return: The decoded string, or None if no string could be decoded
+    """
+    try:
+        is_unicode = strtype in (idc.ASCSTR_UNICODE, idaapi.ASCSTR_ULEN2, idaapi.ASCSTR_ULEN4)
+        char_size = 2 if is_unicode else 1
+
+        # Length prefixed strings
+        if strtype == idaapi.ASCSTR_PASCAL:
+            (length,) = struct.unpack_from("<B", data)
+            body = data[1:1 + length]
+        elif strtype in (idaapi.ASCSTR_LEN2, idaapi.ASCSTR_ULEN2):
+            (length,) = struct.unpack_from("<H", data)
+            body = data[2:2 + length * char_size]
+        elif strtype in (idaapi.ASCSTR_LEN4, idaapi.ASCSTR_ULEN4):
+            (length,) = struct.unpack_from("<I", data)
+            body = data[4:4 + length * char_size]
+
+        # Zero terminated strings
+        else:
+            terminator = "\x00" * char_size
+            end = 0
+            while end < len(data) and end < MAX_STRING_LEN * char_size:
+                if data[end:end + char_size] == terminator:
+                    break
+                end += char_size
+
+            # String was not terminated within the captured memory
+            if end >= len(data):
+                return None
+
+            body = data[:end]
+
+        if is_unicode:
+            body = body.decode("utf-16-le", "replace").encode("ascii", "replace")
+
+        return body
+
+    except (struct.error, UnicodeError):
+        return None
+
+
+###############################################################################################
+# Captured memory is set per thread (see IDAConnector.set_captured_memory), so parser workers can safely
+# run side by side.
+
+def get_string(ea, strtype=idc.ASCSTR_C):
+    """
+    Get a string from the debuggee memory (or from captured memory if set for the current thread)
+    @param ea: String address
+    @param strtype: IDA string type (ASCSTR_XXX)
+    @return: The string value, or None if not found
+    """
+    captured_memory = get_captured_memory()
+    if captured_memory is not None:
+        return captured_memory.get_string(ea, strtype)
+
+    if ea is None or not idc.isEnabled(ea):
+        return None
+
+    # Read the longest possible string (unicode chars + length prefix) through the page cache
+    data = read_dbg_memory(ea, MAX_STRING_LEN * 2 + 4, allow_partial=True)
+    if data is None:
+        return None
+
+    return decode_string(data, strtype)
+
+def get_event_pid():
+    """
+    Get the debugged process id (from captured memory if set for the current thread)
+    """
+    captured_memory = get_captured_memory()
+    if captured_memory is not None:
+        return captured_memory.pid
+
+    return idc.GetEventPid()
+
+def capture_memory(ea, size):
+    """
+    Read a memory window for later use. If the window crosses into unreadable memory, it is truncated at
+    the end of the last readable page.
+    @param ea: Window start address
+    @param size: Window size
+    @return: The window data, or None if no memory could be read at ea.
+    """
+    if ea is None or size is None or size <= 0:
+        return None
+
+    captured_memory = get_captured_memory()
+    if captured_memory is not None:
+        return captured_memory.read(ea, size)
+
+    if not idc.isEnabled(ea):
+        return None
+
+    return read_dbg_memory(ea, size, allow_partial=True)
+
+def capture_debuggee_state(stack_size, max_pages):
+    """
+    Capture the current debuggee state: register values, the stack window and the memory pages
+    referenced by register and stack values.
+    @param stack_size: Size of the captured stack window (in bytes)
+    @param max_pages: Maximal number of referenced memory pages to capture
+    @return: A CapturedMemory object
+    """
+    captured_memory = CapturedMemory(get_event_pid())
+
+    # Registers
+    for reg_name in get_register_names():
+        captured_memory.registers[reg_name.upper()] = idc.GetRegValue(reg_name)
+
+    # Stack window
+    sp = get_sp()
+    stack_data = capture_memory(sp, stack_size)
+    captured_memory.add_block(sp, stack_data)
+
+    # Values that might point to relevant data
+    ref_values = captured_memory.registers.values()
+    if stack_data is not None:
+        element_size = get_stack_element_size()
+        for offset in xrange(0, len(stack_data) - element_size + 1, element_size):
+            ref_values.append(unpack_native(stack_data, offset))
+
+    # Referenced memory pages
+    captured_pages = []
+    for value in ref_values:
+        if len(captured_pages) >= max_pages:
+            break
+
+        if value is None or not idc.isEnabled(value):
+            continue
+
+        page_ea = value - (value % PAGE_SIZE)
+        if page_ea in captured_pages:
+            continue
+
+        page_data = get_adrs_mem_block(page_ea, PAGE_SIZE)
+        if page_data is not None:
+            captured_memory.add_block(page_ea, page_data)
+            captured_pages.append(page_ea)
+
+    return captured_memory
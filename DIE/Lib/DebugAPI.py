@@ -17,10 +17,19 @@ from idc import *
 ### DIE Imports###
 import DIE.Lib.DieConfig
 import DIE.Lib.DataParser
+import DIE.Lib.ParserPool
+from DIE.Lib.TraceFile import TraceWriter, CALL_RECORD, RET_RECORD
+from DIE.Lib.DbgMemory import capture_debuggee_state
+from DIE.Lib.SamplingPolicy import SamplingPolicy
+from DIE.Lib.PhaseTimers import get_phase_timers, timer, PHASE_BP_DISPATCH, PHASE_STEP_INTO
 from DIE.Lib.DIE_Exceptions import FuncCallExceedMax, NewCodeSectionException
 from DIE.Lib.CallStack import *
 from DIE.Lib.DbgImports import *
-from DIE.Lib.IDAConnector import get_cur_ea, is_call, is_ida_debugger_present, analyze_area
+from DIE.Lib.IDAConnector import get_cur_ea, is_call, is_ida_debugger_present, analyze_area, get_sp, \
+    get_stack_ret_adr, get_stack_element_size, resolve_call_target, check_new_code_area, invalidate_page_cache, \
+    invalidate_register_names, invalidate_insn_cache
+from DIE.Lib.AnalysisSnapshot import get_analysis_snapshot, hook_analysis_changes
+from DIE.Lib.CallSiteIndex import get_call_site_index
 import DIE.Lib.DIEDb
 
 ##########################
@@ -43,6 +52,15 @@ class DebugHooker(DBG_Hooks):
         data_parser.set_plugin_path(plugin_path)
         data_parser.loadPlugins()
 
+        # Value parsing workers
+        self.parser_pool = DIE.Lib.ParserPool.get_parser_pool()
+
+        # Per-phase timers
+        self.phase_timers = get_phase_timers()
+
+        # Static analysis cache
+        self.analysis_snapshot = get_analysis_snapshot()
+
         # Breakpoint Exceptions
         self.bp_handler = DIE.Lib.BpHandler.get_bp_handler()
         self.bp_handler.load_exceptions(DIE.Lib.DIEDb.get_db())
@@ -60,6 +78,12 @@ class DebugHooker(DBG_Hooks):
         self.prev_bp_ea = None                          # Address of previously hit breakpoint
         self.end_bp = None                              # If set framework will stop once this bp was reached
 
+        self.trace_writer = None                        # Raw trace writer (set only in record-only mode)
+        self.last_recorded_func = None                  # (ea, name) of the last recorded function call
+
+        self.pending_contexts = 0                       # Number of completed function contexts not yet flushed
+        self.last_flush_time = None                     # Time of the last call-tree flush into the DIE DB
+
         self.start_time = None                          # Debugging start time
         self.end_time = None                            # Debugging end time
 
@@ -67,6 +91,11 @@ class DebugHooker(DBG_Hooks):
         self.is_debug = is_dbg                         # Debug flag
         self.is_dyn_breakpoints = is_dyn_bp             # Should breakpoint be set dynamically or statically
         self.update_imports = True                      # IAT updating flag (when set runtime_imports will be updated)
+        self.is_ret_bp_engine = False                   # Capture returns using return address breakpoints
+        self.is_resolve_call_target = False             # Capture call context at the call-site (no step-into)
+        self.is_sampling = False                        # Sample hot functions instead of excluding them
+        self.is_api_trace = False                       # Break on selected imported functions only (API trace)
+        self.api_init_bp = None                         # Breakpoint on which API breakpoints are set (API trace)
 
         ### Debugging
         self.pr = None                                  # Profiling object (for debug only)
@@ -86,6 +115,7 @@ class DebugHooker(DBG_Hooks):
 
             self.logger.info("Hooking to debugger.")
             self.hook()
+            hook_analysis_changes()
             self.isHooked = True
 
         except Exception as ex:
@@ -122,6 +152,8 @@ class DebugHooker(DBG_Hooks):
          this callback gets called once a breakpoint has been reached -
          this means we can either be in a CALL or a RET instruction.
         """
+        start_time = timer()
+        invalidate_page_cache()  # Debuggee memory might have changed since the last stop
         try:
 
             # If final breakpoint has been reached. skip all further breakpoints.
@@ -139,14 +171,55 @@ class DebugHooker(DBG_Hooks):
             # Set current call-stack
             if not tid in self.callStack:
                 print "Creating new callstack for thread %d" % tid
-                self.callStack[tid] = CallStack()
+                self.callStack[tid] = self.new_callstack()
 
             self.current_callstack = self.callStack[tid]
 
+            # API trace mode: imports are resolved by now, set the API breakpoints.
+            if self.api_init_bp is not None and ea == self.api_init_bp:
+                self.bp_handler.removeBP(ea)
+                self.api_init_bp = None
+                self.set_api_bps()
+
+                request_continue_process()
+                run_requests()
+                return 0
+
+            # Is this a return address breakpoint?
+            if self.bp_handler.is_ret_bp(ea):
+                is_captured = self.bp_handler.pop_ret_bp(ea, tid, get_sp())
+                if is_captured is not None:
+                    # Returns of skipped function calls are not captured (see skip_function)
+                    if is_captured:
+                        self.capture_ret(tid)  # Save Return Context
+
+                    # The calling function might have been disarmed meanwhile (breakpoint budget)
+                    self.bp_handler.arm_function(ea)
+
+                # Unless another breakpoint was set at this address, resume execution.
+                if not self.bp_handler.is_armed_bp(ea):
+                    request_continue_process()
+                    run_requests()
+                    return 0
+
+            # Is this an imported function entry? (API trace mode)
+            if self.bp_handler.is_api_bp(ea):
+                self.prev_bp_ea = ea  # Set prev ea
+                if not self.is_debug:
+                    return self.handle_call(ea)
+
+                return 0
+
             # Is this a CALL instruction?
             if is_call(ea):
                 self.prev_bp_ea = ea  # Set prev ea
                 if not self.is_debug:
+                    # If the call target can be resolved, capture the call right here and save a step.
+                    if self.is_resolve_call_target:
+                        callee_ea = resolve_call_target(ea)
+                        if callee_ea is not None:
+                            return self.handle_call(callee_ea, call_site_ea=ea)
+
                     request_step_into()  # Great, step into the called function
                     run_requests()  # Execute dbg_step_into callback.
 
@@ -156,6 +229,9 @@ class DebugHooker(DBG_Hooks):
             self.logger.exception("Failed while handling breakpoint at %s:", ea, ex)
             return 1
 
+        finally:
+            self.phase_timers.add(PHASE_BP_DISPATCH, start_time)
+
     def dbg_step_into(self):
         """
         Step into gets called whenever we step into a CALL instruction.
@@ -163,47 +239,75 @@ class DebugHooker(DBG_Hooks):
         no BPs should be set inside it, so we need to skip to the next RET instruction), or we have
         stepped into a native function (in which case we just need to gather data and continue to next BP).
         """
+        start_time = timer()
+        invalidate_page_cache()  # Debuggee memory might have changed since the last stop
         try:
             refresh_debugger_memory()
-            ea = get_cur_ea()
+            return self.handle_call(get_cur_ea())
+
+        finally:
+            self.phase_timers.add(PHASE_STEP_INTO, start_time)
 
+    def handle_call(self, ea, call_site_ea=None):
+        """
+        Handle a function call - save the call context and resume execution until the function returns.
+        @param ea: The called function address
+        @param call_site_ea: If the call is handled at the call-site (before the CALL instruction was executed),
+                             the address of the CALL instruction. None if handled upon function entry.
+        """
+        try:
             iatEA = None
             library_name = None
 
             # Is this a library function or a native one?
             if self.runtime_imports.is_func_imported(ea):
                 iatEA, library_name = self.runtime_imports.find_func_iat_adrs(ea)
-
-            # If stepped into an excepted function, remove calling bp and skip over.
-            if self.bp_handler.is_exception_func(ea, iatEA):
-                self.logger.debug("Removing breakpoint from %s", hex(self.prev_bp_ea))
-                self.bp_handler.removeBP(self.prev_bp_ea)
-                request_step_until_ret()
-                run_requests()
+            else:
+                # Library functions not called through the IAT (GetProcAddress, delay-loading, jump thunks..)
+                library_name = self.runtime_imports.find_func_module(ea)
+
+            # If stepped into an excepted function, remove calling bp (or filter out this call target) and skip over.
+            if self.bp_handler.is_exception_func(ea, iatEA, library_name):
+                if not self.bp_handler.exclude_call_target(self.prev_bp_ea, ea):
+                    self.logger.debug("Removing breakpoint from %s", hex(self.prev_bp_ea))
+                    self.bp_handler.removeBP(self.prev_bp_ea)
+                self.skip_function(call_site_ea)
                 return 0
 
             # If this is a native function and dynamic break-pointing is set, add breakpoints to current function
-            if iatEA is None and self.is_dyn_breakpoints:
+            if library_name is None and self.is_dyn_breakpoints:
                 self.bp_handler.walk_function(ea)
 
+            # If a breakpoint budget is set, arm the call sites of the entered function
+            if library_name is None:
+                self.bp_handler.arm_function(ea)
+
+            # If sampling is set, count the call and skip over if it is not sampled
+            if self.is_sampling and not self.current_callstack.sample_call(self.analysis_snapshot.get_function_name(ea)):
+                self.skip_function(call_site_ea)
+                return 0
+
             # Save CALL context
-            func_call_num = self.current_callstack.push(ea, iatEA, library_name=library_name)
+            if self.trace_writer is not None:
+                func_call_num = self.record_call(ea, iatEA, library_name=library_name, call_site_ea=call_site_ea,
+                                                 is_counted=self.is_sampling)
+            else:
+                func_call_num = self.current_callstack.push(ea, iatEA, library_name=library_name,
+                                                            calling_ea=call_site_ea, is_counted=self.is_sampling)
 
             # Check if total number of function calls exceeded the max configured value
-            if func_call_num > self.config.max_func_call:
+            if func_call_num > self.config.max_func_call and not self.is_sampling:
                 raise FuncCallExceedMax()
 
             # Continue Debugging
-            request_step_until_ret()
-            run_requests()
+            self.continue_to_ret(call_site_ea)
             return 0
 
         except FuncCallExceedMax as ex:
             self.make_exception_last_func()
 
             # Continue Debugging
-            request_step_until_ret()
-            run_requests()
+            self.continue_to_ret(call_site_ea)
             return 0
 
         except NewCodeSectionException as ex:
@@ -221,12 +325,11 @@ class DebugHooker(DBG_Hooks):
             analyze_area(ex.section_start, ex.section_end)
 
             # Continue Debugging
-            request_step_until_ret()
-            run_requests()
+            self.skip_function(call_site_ea)
             return 0
 
         except Exception as ex:
-            self.logger.exception("Failed while stepping into breakpoint: %s", ex)
+            self.logger.exception("Failed while handling function call: %s", ex)
             exit(1)
 
     def dbg_step_until_ret(self):
@@ -235,9 +338,13 @@ class DebugHooker(DBG_Hooks):
         the debugger will stop at the next instruction after the RET.
         Context info needs to be collected here and execution should be resumed.
         """
+        invalidate_page_cache()  # Debuggee memory might have changed since the last stop
         try:
             # Save Return Context
-            self.current_callstack.pop()
+            self.capture_ret(GetCurrentThreadId())
+
+            # The calling function might have been disarmed meanwhile (breakpoint budget)
+            self.bp_handler.arm_function(get_cur_ea())
 
             if not self.is_debug:
                 request_continue_process()
@@ -254,7 +361,10 @@ class DebugHooker(DBG_Hooks):
         try:
             # If no call-stack exist for this thread, create one.
             if not tid in self.callStack:
-                self.callStack[tid] = CallStack()
+                self.callStack[tid] = self.new_callstack()
+
+            # Thread routines are not called through a call site, arm them here (breakpoint budget)
+            self.bp_handler.arm_function(ea)
 
             if not self.is_debug:
                 request_continue_process()
@@ -274,42 +384,265 @@ class DebugHooker(DBG_Hooks):
 
         self.bp_handler.unsetBPs()
 
+        # Wait for all pending values to be parsed
+        self.parser_pool.stop()
+
         die_db = DIE.Lib.DIEDb.get_db()
 
-        die_db.add_run_info(self.callStack,
-                            self.start_time,
-                            self.end_time,
-                            idaapi.get_input_file_path(),
-                            idautils.GetInputFileMD5())
+        # In record-only mode the run is added to the DB once the trace is replayed
+        if self.trace_writer is not None:
+            # Call counts include calls that were not recorded (sampling), so they are kept in the trace
+            for thread_id in self.callStack:
+                self.trace_writer.write_counts(thread_id, self.callStack[thread_id].function_counter)
+
+            self.trace_writer.close()
+            self.trace_writer = None
+        else:
+            self.flush_call_trees()
+            die_db.end_run(self.end_time)
 
         self.bp_handler.save_exceptions(die_db)
 
+    def dbg_library_unload(self, pid, tid, ea, info):
+        """
+        Library unload callback - remove the library address range
+        """
+        self.runtime_imports.module_ranges.remove_module(info)
+        return 0
+
     def dbg_process_start(self, pid, tid, ea, name, base, size):
         """
         TODO: debugging, should be implemented fully.
         @return:
         """
+        invalidate_register_names()  # A new process might have a different register set
+        invalidate_insn_cache()      # Code might have been unpacked or rebased since the previous session
         return True
 
     def dbg_continue_process(self):
+        invalidate_page_cache()  # Cached memory is valid only while the debuggee is suspended
         return True
 
+    def dbg_library_load(self, pid, tid, ea, name, base, size):
+        """
+        Library load callback - refresh the IAT slots of the loaded library only
+        (late bound imports are resolved, and patched IAT slots are updated).
+        """
+        invalidate_page_cache()
+
+        # The entire IAT was not read yet, nothing to refresh
+        if self.update_imports:
+            return 0
+
+        try:
+            self.runtime_imports.module_ranges.add_module(name, base, size)
+
+            removed_adrs, added_entries = self.runtime_imports.refresh_library(name)
+
+            # API trace mode: move the API breakpoints to the refreshed entry points
+            if self.is_api_trace and self.api_init_bp is None:
+                for func_ea in removed_adrs:
+                    if self.bp_handler.is_api_bp(func_ea):
+                        self.bp_handler.removeBP(func_ea)
+
+                if len(added_entries) > 0:
+                    self.bp_handler.set_api_bps(added_entries, self.config.api_trace_filter)
+
+        except Exception as ex:
+            self.logger.error("Failed to refresh imports of library %s: %s", name, ex)
+
+        return 0
+
 ###############################################
 # Convenience Function
 
+    def continue_to_ret(self, call_site_ea=None):
+        """
+        Resume execution until the current function returns.
+        Depending on the configured engine, the debugger will either step until return, or a temporary breakpoint
+        will be set on the return address and execution will continue at full speed.
+        Return context is saved once the return is reached.
+        @param call_site_ea: If stopped at the call-site, the address of the CALL instruction (a return address
+                             breakpoint is always used in this case).
+        """
+        if call_site_ea is not None:
+            # The CALL was not executed yet, so the return address is not on the stack.
+            ret_adr = call_site_ea + idc.ItemSize(call_site_ea)
+            entry_sp = get_sp() - get_stack_element_size()
+            self.bp_handler.add_ret_bp(ret_adr, GetCurrentThreadId(), entry_sp)
+            request_continue_process()
+
+        elif self.is_ret_bp_engine:
+            self.bp_handler.add_ret_bp(get_stack_ret_adr(), GetCurrentThreadId(), get_sp())
+            request_continue_process()
+
+        else:
+            request_step_until_ret()
+
+        run_requests()
+
+    def set_api_bps(self):
+        """
+        API trace mode: set breakpoints on the runtime entry points of the selected imported functions
+        """
+        if self.update_imports:
+            self.update_iat()
+
+        self.bp_handler.set_api_bps(self.runtime_imports.rt_import_table, self.config.api_trace_filter)
+
+    def skip_function(self, call_site_ea=None):
+        """
+        Resume execution without capturing the return context of the current function.
+        @param call_site_ea: If stopped at the call-site, the address of the CALL instruction.
+        """
+        if call_site_ea is None and not self.is_ret_bp_engine:
+            # Stepping until return would capture the return (popping the caller context from the call-stack),
+            # so wait for the return with an uncaptured return breakpoint (re-arms the calling function).
+            self.bp_handler.add_ret_bp(get_stack_ret_adr(), GetCurrentThreadId(), get_sp(), is_captured=False)
+
+        request_continue_process()
+        run_requests()
+
+    def record_call(self, ea, iatEA, library_name=None, call_site_ea=None, is_counted=False):
+        """
+        Record-only mode: write the raw call context to the trace file instead of building a function context.
+        @param ea: The called function address
+        @param iatEA: If the function is imported, the address of the function IAT entry.
+        @param library_name: Name of containing library (for library functions)
+        @param call_site_ea: If recorded at the call-site, the CALL instruction address.
+        @param is_counted: Was this call already counted (by sample_call)
+        @return: Total number of times this function was called
+        """
+        # Check if ea is in new code section.
+        if iatEA is None and library_name is None:
+            new_area_t = check_new_code_area(ea)
+            if new_area_t is not None:
+                (area_start, area_end) = new_area_t  # New code section scope
+                raise NewCodeSectionException(section_start=area_start, section_end=area_end)
+
+        func_name = self.analysis_snapshot.get_function_name(ea)
+        if not is_counted:
+            self.current_callstack.count_function(func_name)
+        self.current_callstack.count_capture(func_name)
+        self.last_recorded_func = (ea, func_name)
+
+        self.trace_writer.write_record(CALL_RECORD,
+                                       GetCurrentThreadId(),
+                                       capture_debuggee_state(self.config.trace_stack_window,
+                                                              self.config.trace_max_pages),
+                                       ea=ea,
+                                       iat_ea=iatEA,
+                                       calling_ea=call_site_ea,
+                                       library_name=library_name)
+
+        return self.current_callstack.function_counter[func_name]
+
+    def capture_ret(self, tid):
+        """
+        Save the return context of the top-most function in the current call-stack
+        (in record-only mode, write the raw return context to the trace file).
+        @param tid: Thread id
+        """
+        if self.trace_writer is not None:
+            self.trace_writer.write_record(RET_RECORD,
+                                           tid,
+                                           capture_debuggee_state(self.config.trace_stack_window,
+                                                                  self.config.trace_max_pages))
+        else:
+            self.current_callstack.pop()
+
+            self.pending_contexts += 1
+            if self.is_flush_required():
+                self.flush_call_trees()
+
+    def is_flush_required(self):
+        """
+        Check if completed function contexts should be flushed into the DIE DB
+        @return: True if either the configured number of pending contexts or the configured flush interval
+                 was reached, otherwise False
+        """
+        if self.pending_contexts == 0:
+            return False
+
+        if self.config.flush_contexts > 0 and self.pending_contexts >= self.config.flush_contexts:
+            return True
+
+        if self.config.flush_interval > 0 and time.time() - self.last_flush_time >= self.config.flush_interval:
+            return True
+
+        return False
+
+    def flush_call_trees(self):
+        """
+        Move the completed function contexts of all threads into the DIE DB and release them from the call trees.
+        Memory usage is bounded only when the SQLite DB store is used (records are committed to disk on every flush),
+        otherwise the flushed records are kept by the in-memory DIE DB.
+        """
+        try:
+            # Values are converted to DB records, so all pending values must be parsed first
+            self.parser_pool.join()
+
+            die_db = DIE.Lib.DIEDb.get_db()
+
+            for thread_id in self.callStack:
+                call_tree = self.callStack[thread_id].callTree
+                if len(call_tree) > 0:
+                    die_db.flush_thread_data(thread_id, call_tree)
+                    del call_tree[:]
+
+            self.update_function_counts()
+
+            self.pending_contexts = 0
+            self.last_flush_time = time.time()
+
+        except Exception as ex:
+            self.logger.exception("Failed while flushing call trees to DieDB: %s", ex)
+
+    def update_function_counts(self):
+        """
+        Update the DIE DB with the total (all threads) call and capture counts of every function
+        """
+        call_counts = {}
+        capture_counts = {}
+
+        for call_stack in self.callStack.itervalues():
+            for (func_name, count) in call_stack.function_counter.iteritems():
+                call_counts[func_name] = call_counts.get(func_name, 0) + count
+
+            for (func_name, count) in call_stack.capture_counter.iteritems():
+                capture_counts[func_name] = capture_counts.get(func_name, 0) + count
+
+        DIE.Lib.DIEDb.get_db().update_function_counts(call_counts, capture_counts)
+
+    def new_callstack(self):
+        """
+        Create a new thread call-stack
+        @return: A new CallStack object, with a sampling policy if sampling is set
+        """
+        if not self.is_sampling:
+            return CallStack()
+
+        return CallStack(SamplingPolicy(self.config.max_func_call,
+                                        self.config.sample_interval,
+                                        self.config.sample_decay))
+
     def make_exception_last_func(self):
         """
         Adds the last called function to exceptions
         @return: True if succeeded, otherwise False
         """
         try:
-            (except_ea, except_name) = self.current_callstack.get_top_func_data()
+            if self.trace_writer is not None:
+                (except_ea, except_name) = self.last_recorded_func
+            else:
+                (except_ea, except_name) = self.current_callstack.get_top_func_data()
 
             self.logger.debug("Function %s was called more then %d times.",
                               except_name, self.config.max_func_call)
 
-            self.logger.debug("Removing breakpoint from %s", hex(self.prev_bp_ea))
-            self.bp_handler.removeBP(self.prev_bp_ea)
+            if not self.bp_handler.exclude_call_target(self.prev_bp_ea, except_ea):
+                self.logger.debug("Removing breakpoint from %s", hex(self.prev_bp_ea))
+                self.bp_handler.removeBP(self.prev_bp_ea)
 
             # Add function to exceptions, and reload breakpoints
             self.logger.debug("Adding address %s to exception list", except_ea)
@@ -336,6 +669,32 @@ class DebugHooker(DBG_Hooks):
         """
         self.Hook()
 
+        self.is_api_trace = self.config.is_api_trace
+        self.is_resolve_call_target = self.config.is_resolve_call_target
+        self.is_sampling = self.config.is_sampling
+
+        # Register names are resolved on the first debugger stop of the session
+        invalidate_register_names()
+        invalidate_insn_cache()
+
+        # API trace breakpoints are hit upon function entry, returns are always caught with return breakpoints
+        self.is_ret_bp_engine = self.config.is_ret_bp_engine or self.is_api_trace
+        self.bp_handler.set_bp_budget(self.config.bp_budget)
+        self.bp_handler.set_bp_filters(max_hits=self.config.bp_max_hits)
+
+        # Functions missing from the current analysis are reported as new functions
+        self.analysis_snapshot.start_session()
+
+        # Record-only mode: write a raw trace file, the DIE DB is built later by replaying it
+        if self.config.is_record_trace:
+            trace_file_name = idaapi.get_input_file_path() + ".dtr"
+            self.trace_writer = TraceWriter(trace_file_name, idautils.GetInputFileMD5())
+            self.logger.info("Recording raw trace to %s", trace_file_name)
+
+        # Start value parsing workers (if not configured, values are parsed while the debuggee is suspended)
+        if self.config.parser_workers > 0:
+            self.parser_pool.start(self.config.parser_workers)
+
         if start_func_ea is not None:
             self.is_dyn_breakpoints = True
 
@@ -347,12 +706,32 @@ class DebugHooker(DBG_Hooks):
             # Walk current function
             self.bp_handler.walk_function(start_func_ea)
 
+        elif self.is_api_trace:
+            # Runtime import addresses are only known once the loader has resolved them (process entry point)
+            if idaapi.is_debugger_on():
+                self.set_api_bps()
+            else:
+                self.api_init_bp = idc.BeginEA()
+                self.bp_handler.addBP(self.api_init_bp, "API_TRACE_INIT")
+
         else:
             self.bp_handler.setBPs()
 
+        # Keep the call-site index in the IDB, so it is not rebuilt next time
+        get_call_site_index().save()
+
         # Set start time
         if self.start_time is None:
             self.start_time = time.time()
+            self.last_flush_time = self.start_time
+
+            # Function contexts are flushed into the run while debugging (in record-only mode, once replayed)
+            if self.trace_writer is None:
+                die_db = DIE.Lib.DIEDb.get_db()
+                if self.config.is_sqlite_db and die_db.store is None:
+                    die_db.open_store()
+
+                die_db.start_run(self.start_time, idaapi.get_input_file_path(), idautils.GetInputFileMD5())
 
         # start the process automatically
         if auto_start:
@@ -1,4 +1,4 @@
-from DIE.Lib import DieConfig, DataParser
+from DIE.Lib import DieConfig, DataParser, ParserPool
 
 __author__ = 'yanivb'
 
@@ -6,12 +6,90 @@ __author__ = 'yanivb'
 import idaapi
 from idc import *
 from DIE.Lib.IDATypeWrapers import Array, Struct
-from DIE.Lib.IDAConnector import get_adrs_mem
+from DIE.Lib.IDAConnector import get_adrs_mem, get_adrs_mem_block, get_reg_value
 import logging
+import struct
 
 MEM_VAL = 0x01       # Memory based value
 REG_VAL = 0x02       # Register based value
 
+# struct format characters of primitive array elements (Key: element size)
+SIGNED_FORMATS = {1: "b", 2: "h", 4: "i", 8: "q"}
+UNSIGNED_FORMATS = {1: "B", 2: "H", 4: "I", 8: "Q"}
+FLOAT_FORMATS = {4: "f", 8: "d"}
+
+
+class ArraySummary():
+    """
+    A compact representation of a primitive typed array.
+    Array elements are kept as a raw typed buffer (read in a single debugger read) along with summary statistics,
+    instead of a DebugValue object per element.
+    """
+
+    def __init__(self, element_type_name, element_num, element_size, fmt, data):
+        """
+        Ctor
+        @param element_type_name: Array element type name
+        @param element_num: Number of array elements
+        @param element_size: Array element size (in bytes)
+        @param fmt: struct format of a single element (including byte order)
+        @param data: Raw array data
+        """
+        self.element_type_name = element_type_name
+        self.element_num = element_num
+        self.element_size = element_size
+        self.fmt = fmt
+        self.data = data
+
+        values = self.values()
+
+        self.min = min(values)
+        self.max = max(values)
+        self.mean = float(sum(values)) / len(values)
+        self.zero_count = values.count(0)
+
+    def values(self):
+        """
+        Decode the array elements
+        @return: A tuple of the array element values
+        """
+        return struct.unpack(self.fmt[0] + "%d%s" % (self.element_num, self.fmt[1:]), self.data)
+
+
+def get_array_summary(array, base_ea):
+    """
+    Read a primitive typed array in bulk and summarize it
+    @param array: Array object
+    @param base_ea: Array base address
+    @return: An ArraySummary object, or None if the array elements are not of a primitive type or could not be read.
+    """
+    element_type = array.element_type
+    if element_type is None or array.element_num <= 0:
+        return None
+
+    if element_type.is_floating():
+        formats = FLOAT_FORMATS
+    elif element_type.is_integral():
+        formats = SIGNED_FORMATS if element_type.is_signed() else UNSIGNED_FORMATS
+    else:
+        return None
+
+    if not array.element_size in formats:
+        return None
+
+    data = get_adrs_mem_block(base_ea, array.element_num * array.element_size)
+    if data is None:
+        return None
+
+    # Respect the target byte order
+    byte_order = ">" if idaapi.get_inf_structure().mf else "<"
+
+    return ArraySummary(idaapi.print_tinfo('', 0, 0, idaapi.PRTYPE_1LINE, element_type, '', ''),
+                        array.element_num,
+                        array.element_size,
+                        byte_order + formats[array.element_size],
+                        data)
+
 class DebugValue():
     """
     DebugValue class is responsible for reading the argument value.
@@ -34,9 +112,11 @@ class DebugValue():
                  name="",
                  referringValue = None,
                  deref_depth=None,
-                 custom_parser=None):
+                 custom_parser=None,
+                 stack_snapshot=None):
         """
         Ctor
+        @param stack_snapshot: A StackSnapshot object to decode the raw value from (for stack based values)
         """
         self.logger = logging.getLogger(__name__)
         self.config = DieConfig.get_config()
@@ -49,11 +129,15 @@ class DebugValue():
 
         self.parsedValues = []              # Possible value data list
         self.nestedValues = []              # Nested DebugValue(s) (if struct/union etc.)
+        self.array_summary = None           # Compact array elements summary (for large primitive arrays)
 
         # Custom parser plugin for this value - if this value is set, no other parser will be attempted to parse
         # this value.
         self.custom_parser = custom_parser
 
+        # Stack snapshot used to read the raw value without a debugger read (only kept while collecting values)
+        self.stack_snapshot = stack_snapshot
+
         self.reference_flink = None             # For reference values, a pointer to the referred value.
         self.reference_blink = referringValue   # For reference values, a pointer to the referring value.
 
@@ -67,6 +151,8 @@ class DebugValue():
         self.dataParser = DataParser.getParser()
         self.getRunetimeValues()
 
+        self.stack_snapshot = None  # Release the snapshot, it is no longer required.
+
 
 
     def getRunetimeValues(self):
@@ -93,7 +179,13 @@ class DebugValue():
                     self.rawValue = self.getRawValue()
 
                 if self.config.is_parse:
-                    self.parsedValues = self.parseValue()
+                    parser_pool = ParserPool.get_parser_pool()
+
+                    # If parser workers are running, defer parsing until the debuggee is resumed.
+                    if parser_pool.is_running():
+                        parser_pool.submit(self)
+                    else:
+                        self.parsedValues = self.parseValue()
 
                 return True
 
@@ -148,8 +240,11 @@ class DebugValue():
             array_base_adrs = self.loc
 
             if self.loc is not None:
+                # Only the leading elements are collected as full debug values
+                full_element_num = min(array.element_num, self.config.array_full_elements)
+
                 prev_element = self
-                for element_index in xrange(0, array.element_num):  # TODO: maybe element_num -1 ?!
+                for element_index in xrange(0, full_element_num):  # TODO: maybe element_num -1 ?!
                     element_val = DebugValue(MEM_VAL,
                                              array_base_adrs + (element_index*array.element_size),
                                              array.element_type,
@@ -158,6 +253,10 @@ class DebugValue():
                     prev_element.reference_flink = element_val
                     prev_element = element_val
 
+                # The entire array is kept as a compact typed buffer
+                if array.element_num > full_element_num:
+                    self.array_summary = get_array_summary(array, array_base_adrs)
+
             return True
 
         except Exception as ex:
@@ -200,6 +299,12 @@ class DebugValue():
         try:
             # If memory value read native size bytes from ea
             if self.storetype == MEM_VAL:
+                # Stack based values are decoded from the frame snapshot if available
+                if self.stack_snapshot is not None:
+                    raw_value = self.stack_snapshot.get_native_value(self.loc)
+                    if raw_value is not None:
+                        return raw_value
+
                 return get_adrs_mem(self.loc)
 
                 # native_size = self.instParser.get_native_size()
@@ -213,7 +318,7 @@ class DebugValue():
 
             # If register value, read register`s value
             if self.storetype == REG_VAL:
-                return GetRegValue(self.loc)
+                return get_reg_value(self.loc)
 
             self.logger.error("Internal Error - storetype %d not supported.", self.storetype)
             return False
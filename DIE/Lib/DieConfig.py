@@ -75,12 +75,34 @@ class DIE_Config():
         self.config_parser.set("DebugValues", "is_parse", self.config["DebugValues"]["is_parse"])
         self.config_parser.set("DebugValues", "is_array", self.config["DebugValues"]["is_array"])
         self.config_parser.set("DebugValues", "is_container", self.config["DebugValues"]["is_container"])
+        self.config_parser.set("DebugValues", "parser_workers", self.config["DebugValues"].get("parser_workers", "0"))
+        self.config_parser.set("DebugValues", "parse_window_size",
+                               self.config["DebugValues"].get("parse_window_size", "256"))
+        self.config_parser.set("DebugValues", "array_full_elements",
+                               self.config["DebugValues"].get("array_full_elements", "16"))
 
         self.config_parser.set("FunctionContext", "get_func_args", self.config["FunctionContext"]["get_func_args"])
 
         self.config_parser.set("Debugging", "max_func_call", self.config["Debugging"]["max_func_call"])
         self.config_parser.set("Debugging", "max_deref_depth", self.config["Debugging"]["max_deref_depth"])
         self.config_parser.set("Debugging", "code_discovery", self.config["Debugging"]["code_discovery"])
+        self.config_parser.set("Debugging", "ret_bp_engine", self.config["Debugging"].get("ret_bp_engine", "0"))
+        self.config_parser.set("Debugging", "resolve_call_target",
+                               self.config["Debugging"].get("resolve_call_target", "0"))
+        self.config_parser.set("Debugging", "record_trace", self.config["Debugging"].get("record_trace", "0"))
+        self.config_parser.set("Debugging", "trace_stack_window",
+                               self.config["Debugging"].get("trace_stack_window", "256"))
+        self.config_parser.set("Debugging", "trace_max_pages", self.config["Debugging"].get("trace_max_pages", "8"))
+        self.config_parser.set("Debugging", "flush_contexts", self.config["Debugging"].get("flush_contexts", "200"))
+        self.config_parser.set("Debugging", "flush_interval", self.config["Debugging"].get("flush_interval", "60"))
+        self.config_parser.set("Debugging", "sampling", self.config["Debugging"].get("sampling", "0"))
+        self.config_parser.set("Debugging", "sample_interval", self.config["Debugging"].get("sample_interval", "10"))
+        self.config_parser.set("Debugging", "sample_decay", self.config["Debugging"].get("sample_decay", "1.0"))
+        self.config_parser.set("Debugging", "bp_budget", self.config["Debugging"].get("bp_budget", "0"))
+        self.config_parser.set("Debugging", "bp_max_hits", self.config["Debugging"].get("bp_max_hits", "0"))
+        self.config_parser.set("Debugging", "api_trace", self.config["Debugging"].get("api_trace", "0"))
+        self.config_parser.set("Debugging", "api_trace_filter", self.config["Debugging"].get("api_trace_filter", ""))
+        self.config_parser.set("Debugging", "sqlite_db", self.config["Debugging"].get("sqlite_db", "0"))
 
         with open(config_file_name, 'wb') as config_file:
             self.config_parser.write(config_file)
@@ -103,6 +125,21 @@ class DIE_Config():
             config_parser.set("Debugging", "max_func_call", '20')
             config_parser.set("Debugging", "max_deref_depth", '3')
             config_parser.set("Debugging", "code_discovery", "0")
+            config_parser.set("Debugging", "ret_bp_engine", "0")
+            config_parser.set("Debugging", "resolve_call_target", "0")
+            config_parser.set("Debugging", "record_trace", "0")
+            config_parser.set("Debugging", "trace_stack_window", "256")
+            config_parser.set("Debugging", "trace_max_pages", "8")
+            config_parser.set("Debugging", "flush_contexts", "200")
+            config_parser.set("Debugging", "flush_interval", "60")
+            config_parser.set("Debugging", "sampling", "0")
+            config_parser.set("Debugging", "sample_interval", "10")
+            config_parser.set("Debugging", "sample_decay", "1.0")
+            config_parser.set("Debugging", "bp_budget", "0")
+            config_parser.set("Debugging", "bp_max_hits", "0")
+            config_parser.set("Debugging", "api_trace", "0")
+            config_parser.set("Debugging", "api_trace_filter", "")
+            config_parser.set("Debugging", "sqlite_db", "0")
 
             config_parser.set("FunctionContext", "get_func_args", "1")
 
@@ -111,6 +148,9 @@ class DIE_Config():
             config_parser.set("DebugValues", "is_array", "1")
             config_parser.set("DebugValues", "is_container", "1")
             config_parser.set("DebugValues", "is_deref", "1")
+            config_parser.set("DebugValues", "parser_workers", "0")
+            config_parser.set("DebugValues", "parse_window_size", "256")
+            config_parser.set("DebugValues", "array_full_elements", "16")
 
             with open(config_file_name, 'wb') as config_file:
                 config_parser.write(config_file)
@@ -256,6 +296,61 @@ class DIE_Config():
             self.logger.error("Failed to set is_raw value: %s", ex)
             self.config["DebugValues"]["is_raw"] = "1"
 
+    @property
+    def parser_workers(self):
+        """
+        Number of background value parsing workers (0 - values are parsed while the debuggee is suspended)
+        """
+        try:
+            return int(self.config["DebugValues"]["parser_workers"])
+        except:
+            return 0
+
+    def set_parser_workers(self, value):
+        try:
+            self.config["DebugValues"]["parser_workers"] = value
+
+        except Exception as ex:
+            self.logger.error("Failed to set parser_workers value: %s", ex)
+            self.config["DebugValues"]["parser_workers"] = 0
+
+    @property
+    def parse_window_size(self):
+        """
+        Size of the memory window captured for each value parsed by the background parsing workers
+        """
+        try:
+            return int(self.config["DebugValues"]["parse_window_size"])
+        except:
+            return 256
+
+    def set_parse_window_size(self, value):
+        try:
+            self.config["DebugValues"]["parse_window_size"] = value
+
+        except Exception as ex:
+            self.logger.error("Failed to set parse_window_size value: %s", ex)
+            self.config["DebugValues"]["parse_window_size"] = 256
+
+    @property
+    def array_full_elements(self):
+        """
+        Number of leading array elements collected as full debug values
+        (remaining primitive elements are only kept as a compact array summary)
+        """
+        try:
+            return int(self.config["DebugValues"]["array_full_elements"])
+        except:
+            return 16
+
+    def set_array_full_elements(self, value):
+        try:
+            self.config["DebugValues"]["array_full_elements"] = value
+
+        except Exception as ex:
+            self.logger.error("Failed to set array_full_elements value: %s", ex)
+            self.config["DebugValues"]["array_full_elements"] = 16
+
 #############################################################################
 #                           FunctionContext Properties
 #############################################################################
@@ -336,6 +431,322 @@ class DIE_Config():
             self.logger.error("Failed to set code discovery value: %s", ex)
             self.config["Debugging"]["code_discovery"] = 0
 
+    @property
+    def is_ret_bp_engine(self):
+        """
+        Capture return context using a breakpoint on the return address (instead of stepping until return)
+        """
+        try:
+            value = self.config["Debugging"]["ret_bp_engine"]
+            if value == "1":
+                return True
+            return False
+        except:
+            return False
+
+    def set_ret_bp_engine(self, value):
+        try:
+            if value:
+                self.config["Debugging"]["ret_bp_engine"] = "1"
+            else:
+                self.config["Debugging"]["ret_bp_engine"] = "0"
+
+        except Exception as ex:
+            self.logger.error("Failed to set ret_bp_engine value: %s", ex)
+            self.config["Debugging"]["ret_bp_engine"] = "0"
+
+    @property
+    def is_resolve_call_target(self):
+        """
+        Resolve call targets and capture call context at the call-site (instead of stepping into the call)
+        """
+        try:
+            value = self.config["Debugging"]["resolve_call_target"]
+            if value == "1":
+                return True
+            return False
+        except:
+            return False
+
+    def set_resolve_call_target(self, value):
+        try:
+            if value:
+                self.config["Debugging"]["resolve_call_target"] = "1"
+            else:
+                self.config["Debugging"]["resolve_call_target"] = "0"
+
+        except Exception as ex:
+            self.logger.error("Failed to set resolve_call_target value: %s", ex)
+            self.config["Debugging"]["resolve_call_target"] = "0"
+
+    @property
+    def is_record_trace(self):
+        """
+        Record-only mode: write raw call\return records to a trace file instead of building the DIE DB live
+        """
+        try:
+            value = self.config["Debugging"]["record_trace"]
+            if value == "1":
+                return True
+            return False
+        except:
+            return False
+
+    def set_record_trace(self, value):
+        try:
+            if value:
+                self.config["Debugging"]["record_trace"] = "1"
+            else:
+                self.config["Debugging"]["record_trace"] = "0"
+
+        except Exception as ex:
+            self.logger.error("Failed to set record_trace value: %s", ex)
+            self.config["Debugging"]["record_trace"] = "0"
+
+    @property
+    def trace_stack_window(self):
+        """
+        Size of the stack window recorded with each trace record
+        """
+        try:
+            return int(self.config["Debugging"]["trace_stack_window"])
+        except:
+            return 256
+
+    def set_trace_stack_window(self, value):
+        try:
+            self.config["Debugging"]["trace_stack_window"] = value
+
+        except Exception as ex:
+            self.logger.error("Failed to set trace_stack_window value: %s", ex)
+            self.config["Debugging"]["trace_stack_window"] = 256
+
+    @property
+    def trace_max_pages(self):
+        """
+        Maximal number of referenced memory pages recorded with each trace record
+        """
+        try:
+            return int(self.config["Debugging"]["trace_max_pages"])
+        except:
+            return 8
+
+    def set_trace_max_pages(self, value):
+        try:
+            self.config["Debugging"]["trace_max_pages"] = value
+
+        except Exception as ex:
+            self.logger.error("Failed to set trace_max_pages value: %s", ex)
+            self.config["Debugging"]["trace_max_pages"] = 8
+
+    @property
+    def flush_contexts(self):
+        """
+        Number of completed function contexts after which the call trees are flushed into the DIE DB
+        (0 - flush only when the process exits).
+        Note: flushing releases the call trees, but memory usage is bounded only with the SQLite DB store (sqlite_db).
+        Otherwise the flushed records are still held by the in-memory DIE DB, which grows with the trace length.
+        """
+        try:
+            return int(self.config["Debugging"]["flush_contexts"])
+        except:
+            return 200
+
+    def set_flush_contexts(self, value):
+        try:
+            self.config["Debugging"]["flush_contexts"] = value
+
+        except Exception as ex:
+            self.logger.error("Failed to set flush_contexts value: %s", ex)
+            self.config["Debugging"]["flush_contexts"] = 200
+
+    @property
+    def flush_interval(self):
+        """
+        Maximal time (in seconds) completed function contexts are held before being flushed into the DIE DB
+        (0 - no time limit)
+        """
+        try:
+            return int(self.config["Debugging"]["flush_interval"])
+        except:
+            return 60
+
+    def set_flush_interval(self, value):
+        try:
+            self.config["Debugging"]["flush_interval"] = value
+
+        except Exception as ex:
+            self.logger.error("Failed to set flush_interval value: %s", ex)
+            self.config["Debugging"]["flush_interval"] = 60
+
+    @property
+    def is_sampling(self):
+        """
+        Sample calls of functions called more than max_func_call times (instead of excluding them)
+        """
+        try:
+            value = self.config["Debugging"]["sampling"]
+            if value == "1":
+                return True
+            return False
+        except:
+            return False
+
+    def set_sampling(self, value):
+        try:
+            if value:
+                self.config["Debugging"]["sampling"] = "1"
+            else:
+                self.config["Debugging"]["sampling"] = "0"
+
+        except Exception as ex:
+            self.logger.error("Failed to set sampling value: %s", ex)
+            self.config["Debugging"]["sampling"] = "0"
+
+    @property
+    def sample_interval(self):
+        """
+        Initial sampling interval (capture every sample_interval`th call of a hot function)
+        """
+        try:
+            return int(self.config["Debugging"]["sample_interval"])
+        except:
+            return 10
+
+    def set_sample_interval(self, value):
+        try:
+            self.config["Debugging"]["sample_interval"] = value
+
+        except Exception as ex:
+            self.logger.error("Failed to set sample_interval value: %s", ex)
+            self.config["Debugging"]["sample_interval"] = 10
+
+    @property
+    def sample_decay(self):
+        """
+        Sampling interval growth factor, applied after every sampled call (1.0 - fixed interval)
+        """
+        try:
+            return float(self.config["Debugging"]["sample_decay"])
+        except:
+            return 1.0
+
+    def set_sample_decay(self, value):
+        try:
+            self.config["Debugging"]["sample_decay"] = value
+
+        except Exception as ex:
+            self.logger.error("Failed to set sample_decay value: %s", ex)
+            self.config["Debugging"]["sample_decay"] = 1.0
+
+    @property
+    def bp_budget(self):
+        """
+        Maximal number of simultaneously armed call-site breakpoints. Call sites are armed once their function is
+        entered, least recently entered functions are disarmed first (0 - no limit, all call sites are armed).
+        Note: functions are only known to be entered through an armed call site, an entry point or a thread start.
+        Code reached in other ways (e.g callbacks called by library code, SEH\VEH handlers, APCs) is not traced
+        until it calls into a traced function.
+        """
+        try:
+            return int(self.config["Debugging"]["bp_budget"])
+        except:
+            return 0
+
+    def set_bp_budget(self, value):
+        try:
+            self.config["Debugging"]["bp_budget"] = value
+
+        except Exception as ex:
+            self.logger.error("Failed to set bp_budget value: %s", ex)
+            self.config["Debugging"]["bp_budget"] = 0
+
+    @property
+    def bp_max_hits(self):
+        """
+        Maximal number of stops per call-site breakpoint, further hits are filtered out by the debugger
+        (0 - no limit)
+        """
+        try:
+            return int(self.config["Debugging"]["bp_max_hits"])
+        except:
+            return 0
+
+    def set_bp_max_hits(self, value):
+        try:
+            self.config["Debugging"]["bp_max_hits"] = value
+
+        except Exception as ex:
+            self.logger.error("Failed to set bp_max_hits value: %s", ex)
+            self.config["Debugging"]["bp_max_hits"] = 0
+
+    @property
+    def is_api_trace(self):
+        """
+        API trace mode - break on the entry points of the selected imported functions instead of on CALL instructions
+        """
+        try:
+            value = self.config["Debugging"]["api_trace"]
+            if value == "1":
+                return True
+            return False
+        except:
+            return False
+
+    def set_api_trace(self, value):
+        try:
+            if value:
+                self.config["Debugging"]["api_trace"] = "1"
+            else:
+                self.config["Debugging"]["api_trace"] = "0"
+
+        except Exception as ex:
+            self.logger.error("Failed to set api_trace value: %s", ex)
+            self.config["Debugging"]["api_trace"] = "0"
+
+    @property
+    def api_trace_filter(self):
+        """
+        Imported functions traced in API trace mode. a comma separated list of module names ("kernel32") and
+        module!function names ("kernel32!createfilew", "*!send"). Empty - all imported functions.
+        """
+        try:
+            return self.config["Debugging"]["api_trace_filter"]
+        except:
+            return ""
+
+    def set_api_trace_filter(self, value):
+        try:
+            self.config["Debugging"]["api_trace_filter"] = value
+
+        except Exception as ex:
+            self.logger.error("Failed to set api_trace_filter value: %s", ex)
+            self.config["Debugging"]["api_trace_filter"] = ""
+
+    @property
+    def is_sqlite_db(self):
+        """
+        Store run data in an indexed SQLite DB file while debugging, instead of holding the entire DB in memory
+        """
+        try:
+            value = self.config["Debugging"]["sqlite_db"]
+            if value == "1":
+                return True
+            return False
+        except:
+            return False
+
+    def set_sqlite_db(self, value):
+        try:
+            if value:
+                self.config["Debugging"]["sqlite_db"] = "1"
+            else:
+                self.config["Debugging"]["sqlite_db"] = "0"
+
+        except Exception as ex:
+            self.logger.error("Failed to set sqlite_db value: %s", ex)
+            self.config["Debugging"]["sqlite_db"] = "0"
+
 #############################################################################
 # DIE Directories
 
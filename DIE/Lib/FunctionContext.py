@@ -5,9 +5,12 @@ import time
 from idc import *
 from idaapi import *
 #from DIE.Lib.Function import *
-from DIE.Lib.IDATypeWrapers import Function
+from DIE.Lib.IDATypeWrapers import get_function
 from DIE.Lib.DebugValue import *
-from DIE.Lib.IDAConnector import get_function_name, get_ret_adr, is_indirect
+from DIE.Lib.IDAConnector import get_ret_adr, is_indirect, get_sp, get_stack_element_size
+from DIE.Lib.AnalysisSnapshot import get_analysis_snapshot
+from DIE.Lib.DbgMemory import StackSnapshot
+from DIE.Lib.PhaseTimers import get_phase_timers, timer, PHASE_ARG_CALL, PHASE_ARG_RET
 import DIE.Lib.FunctionParsers
 
 from DIE.Lib.FunctionParsers.GenFuncParser import GenericFunctionParser
@@ -27,13 +30,15 @@ class FunctionContext():
      4. "how much time did it take to process this function"
     """
 
-    def __init__(self, ea, iatEA=None, is_new_func=False, library_name=None):
+    def __init__(self, ea, iatEA=None, is_new_func=False, library_name=None, calling_ea=None):
         """
         Ctor
         @param ea: Effective address of the function
         @param iatEA: Effective address of IAT element (For library functions)
         @param is_indirect: Was this function called indirectly?
         @param is_new_func: Is this function missing from initial function analysis?
+        @param calling_ea: Effective address of the CALL instruction, if the context is taken at the call-site
+                           (i.e before the CALL instruction was executed). None if taken upon function entry.
         """
         self.logger = logging.getLogger(__name__)
         self.config = DieConfig.get_config()
@@ -51,11 +56,18 @@ class FunctionContext():
         self.retRegState = None     # Register state at function return
         self.total_proc_time = 0    # Total processing time in seconds.
 
+        # Stack
+        self.stack_base = None      # Stack pointer value at function call
+        self.is_call_site = calling_ea is not None  # Is the call context taken before the CALL was executed
+
         try:
             ### Function Data
-            self.function = Function(ea, iatEA, library_name=library_name)  # This (The Callee) function
-            self.callingEA = get_ret_adr()  # The ea of the CALL instruction
-            self.calling_function_name = get_function_name(self.callingEA)  # Calling function name
+            self.function = get_function(ea, iatEA, library_name=library_name)  # This (The Callee) function
+            if calling_ea is not None:
+                self.callingEA = calling_ea  # The ea of the CALL instruction
+            else:
+                self.callingEA = get_ret_adr()  # The ea of the CALL instruction
+            self.calling_function_name = get_analysis_snapshot().get_caller_name(self.callingEA)  # Calling function name
 
             ### Flags
             self.empty = True  # empty flag is dropped when first call context is retrieved.
@@ -90,6 +102,7 @@ class FunctionContext():
         """
 
         start_time = time.time()  # Start timer
+        phase_start = timer()
         self.empty = False  # drop the empty flag
 
         # If no function arg retrieval is disabled in configuration - quit:
@@ -97,7 +110,18 @@ class FunctionContext():
             return True
 
         self.callRegState = self.getRegisters()  # Get registers state
+
+        # Read the entire argument area of the stack frame at once
+        self.stack_base = get_sp()
+
+        # At the call-site the return address was not pushed yet, the frame starts one stack element lower.
+        if self.is_call_site:
+            self.stack_base -= get_stack_element_size()
+        self.function_parser.stack_base = self.stack_base
+        self.function_parser.stack_snapshot = self.get_stack_snapshot()
+
         self.callValues = self.function_parser.parse_function_args_call()  # Get function Arguments
+        self.function_parser.stack_snapshot = None  # Release the snapshot
 
         if self.callValues is None:
             self.logger("Failed parsing function arguments")
@@ -107,6 +131,7 @@ class FunctionContext():
         elapsed_time = time.time() - start_time  # Get elapsed time
         self.total_proc_time += elapsed_time  # Add to total elapsed time
 
+        get_phase_timers().add(PHASE_ARG_CALL, phase_start)
         return True
 
     def get_arg_values_ret(self):
@@ -124,16 +149,43 @@ class FunctionContext():
             return True
 
         start_time = time.time()  # Start timer
+        phase_start = timer()
 
         self.retRegState = self.getRegisters()  # Get register state
+
+        # Stack arguments are re-read from the same (call time) frame area
+        self.function_parser.stack_base = self.stack_base
+        self.function_parser.stack_snapshot = self.get_stack_snapshot()
+
         # Get function arguments
         (self.retValues, self.retArgValue) = self.function_parser.parse_function_args_ret(self.callValues)
 
+        self.function_parser.stack_snapshot = None  # Release the snapshot
+
         elapsed_time = time.time() - start_time  # Get elapsed time
         self.total_proc_time += elapsed_time  # Add to total elapsed time
 
+        get_phase_timers().add(PHASE_ARG_RET, phase_start)
         return True
 
+    def get_stack_snapshot(self):
+        """
+        Read the stack frame argument area (return address + all stack arguments) in a single debugger read.
+        @return: A StackSnapshot object, or None if the frame could not be read.
+        """
+        if self.stack_base is None:
+            return None
+
+        frame_size = get_stack_element_size() + self.function.stack_args_size
+        snapshot = StackSnapshot(self.stack_base, frame_size)
+
+        if snapshot.data is None:
+            self.logger.debug("Could not read stack frame of function %s, falling back to per value reads",
+                              self.function.funcName)
+            return None
+
+        return snapshot
+
     def getRegisters(self):
         """
         Get a list of registers\value tuples.
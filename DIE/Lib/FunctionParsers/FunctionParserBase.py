@@ -42,6 +42,11 @@ class FunctionParserBase(object):
 
         self.function = function    # The function to be parsed
 
+        self.stack_snapshot = None  # Snapshot of the function stack frame (type: StackSnapshot).
+                                    # If set, stack arguments are decoded from it rather than read one by one.
+        self.stack_base = None      # Stack frame base at function call (adjusted for call-site capture).
+                                    # Used for stack argument addresses when no snapshot exists.
+
     def parse_function_args_call(self):
         """
         Parse all function arguments upon function call
@@ -192,7 +197,15 @@ class FunctionParserBase(object):
         if arg.isStack():
             store_type = MEM_VAL
             return_adr_size = get_stack_element_size()       # stack return address size
-            loc = get_sp() + return_adr_size + arg.offset()  # Absolute stack argument address
+
+            if self.stack_snapshot is not None:
+                stack_base = self.stack_snapshot.base_ea
+            elif self.stack_base is not None:
+                stack_base = self.stack_base
+            else:
+                stack_base = get_sp()
+
+            loc = stack_base + return_adr_size + arg.offset()  # Absolute stack argument address
 
         if store_type is None:
             raise RuntimeError("Unhandled or malformed argument passing type")
@@ -208,7 +221,8 @@ class FunctionParserBase(object):
                           loc,
                           arg_type,
                           arg.name(),
-                          custom_parser=parser)
+                          custom_parser=parser,
+                          stack_snapshot=self.stack_snapshot)
 
     def __get_return_arg_value(self, arg_index, store_type, loc, type, name):
         """
@@ -232,7 +246,8 @@ class FunctionParserBase(object):
                           loc,
                           type,
                           name,
-                          custom_parser=parser)
+                          custom_parser=parser,
+                          stack_snapshot=self.stack_snapshot)
 
 
 
@@ -5,7 +5,8 @@ from idc import *
 import idc
 import idaapi
 import idautils
-import re
+import struct
+import threading
 
 ################################################################
 #
@@ -18,6 +19,80 @@ import re
 #TODO: 1. Gather all main IDA interaction functions to this file
 #TODO: 2. Create an abstract base class for the required functions, this might enable quick portability to other platforms.
 
+# Debuggee memory and registers may be served from a previously captured state (e.g when parsing values after the
+# debuggee was resumed, or when replaying a recorded trace). The captured state is set per thread.
+_thread_data = threading.local()
+
+def set_captured_memory(captured_memory):
+    """
+    Set the captured debuggee state used by the current thread
+    @param captured_memory: A captured state object (see DbgMemory.CapturedMemory), or None to use the live debuggee.
+    """
+    _thread_data.captured_memory = captured_memory
+
+def get_captured_memory():
+    """
+    Get the captured debuggee state used by the current thread
+    @return: A captured state object, or None if the live debuggee is used.
+    """
+    return getattr(_thread_data, "captured_memory", None)
+
+# Live debuggee memory is read through a page cache, which is valid only while the debuggee is suspended.
+# The first read touching a page fetches the entire page, later reads within the same stop are served from the cache.
+PAGE_SIZE = 0x1000
+
+_page_cache = {}    # Key: page start address, Value: page data (None if the page could not be read)
+
+def invalidate_page_cache():
+    """
+    Invalidate the debuggee memory page cache (must be called whenever the debuggee is resumed)
+    """
+    _page_cache.clear()
+
+def get_page(page_ea):
+    """
+    Get a debuggee memory page through the page cache
+    @param page_ea: Page start address
+    @return: The page data, or None if the page could not be read.
+    """
+    if page_ea in _page_cache:
+        return _page_cache[page_ea]
+
+    data = idaapi.dbg_read_memory(page_ea, PAGE_SIZE)
+    if data is not None and len(data) != PAGE_SIZE:
+        data = None
+
+    _page_cache[page_ea] = data
+    return data
+
+def read_dbg_memory(ea, size, allow_partial=False):
+    """
+    Read debuggee memory through the page cache
+    @param ea: Start address
+    @param size: Number of bytes to read
+    @param allow_partial: If set, the data up to the first unreadable page is returned
+    @return: The data read, or None if the memory could not be read.
+    """
+    chunks = []
+    cur_ea = ea
+    end_ea = ea + size
+
+    while cur_ea < end_ea:
+        page_ea = cur_ea - (cur_ea % PAGE_SIZE)
+        page = get_page(page_ea)
+        if page is None:
+            break
+
+        offset = cur_ea - page_ea
+        chunk_size = min(PAGE_SIZE - offset, end_ea - cur_ea)
+        chunks.append(page[offset:offset + chunk_size])
+        cur_ea += chunk_size
+
+    if cur_ea < end_ea and (not allow_partial or cur_ea == ea):
+        return None
+
+    return "".join(chunks)
+
 def get_function_name(ea):
         """
         Get the real function name
@@ -118,21 +193,73 @@ def get_proc_type():
         raise RuntimeError("Could not retrieve processor type: %s" %ex)
 
 # TODO: Change this to be architecture independent
+# Instruction classification cache (Key: instruction ea, Value: instruction class)
+_insn_class_cache = {}
+
+INSN_OTHER = 0
+INSN_CALL = 1
+INSN_RET = 2
+
+# Operand types of a call target. Instructions flagged as calls without one (e.g x86 INT, INTO, INT3) are not calls.
+CALL_TARGET_OPTYPES = (idc.o_near, idc.o_far, idc.o_mem, idc.o_reg, idc.o_phrase, idc.o_displ)
+
+def invalidate_insn_cache():
+    """
+    Invalidate the instruction classification cache (code was reanalyzed, or a new debugging session started)
+    """
+    _insn_class_cache.clear()
+
+def invalidate_insn_range(start_ea, end_ea):
+    """
+    Drop the cached instruction classes of an address range (e.g when a function was changed)
+    @param start_ea: Range start address
+    @param end_ea: Range end address (exclusive)
+    """
+    for ea in [ea for ea in _insn_class_cache if start_ea <= ea < end_ea]:
+        del _insn_class_cache[ea]
+
+def get_insn_class(ea):
+    """
+    Classify an instruction using the processor module instruction features, so any processor supported by IDA
+    (x86, ARM, MIPS..) is handled.
+    @param ea: Instruction address
+    @return: INSN_CALL, INSN_RET or INSN_OTHER
+    """
+    if ea in _insn_class_cache:
+        return _insn_class_cache[ea]
+
+    if idaapi.decode_insn(ea) == 0:
+        return INSN_OTHER   # Not code (yet), not cached
+
+    feature = idaapi.cmd.get_canon_feature()
+
+    insn_class = INSN_OTHER
+    if feature & idaapi.CF_CALL:
+        if idc.GetOpType(ea, 0) in CALL_TARGET_OPTYPES or list(idautils.CodeRefsFrom(ea, 0)):
+            insn_class = INSN_CALL
+
+    # A RET stops the execution flow, is not an (indirect) jump and has no code references of its own.
+    elif feature & idaapi.CF_STOP and not feature & idaapi.CF_JUMP:
+        if hasattr(idaapi, "is_ret_insn"):
+            if idaapi.is_ret_insn(ea):
+                insn_class = INSN_RET
+        elif not list(idautils.CodeRefsFrom(ea, 0)):
+            insn_class = INSN_RET
+
+    _insn_class_cache[ea] = insn_class
+    return insn_class
+
 def is_call(ea):
     """
     Check if the current instruction a CALL instruction
     """
-    mnem = GetMnem(ea)
-    if re.match('call\s+far prt', mnem):  return None
-    return re.match('call', mnem)
+    return get_insn_class(ea) == INSN_CALL
 
-# TODO: Change this to be architecture independent
 def is_ret(ea):
     """
     Check if the current instruction a RET instruction
     """
-    mnem = GetMnem(ea)
-    return re.match('ret', mnem)
+    return get_insn_class(ea) == INSN_RET
 
 # TODO: Change this to be architecture independent
 def get_cur_ea():
@@ -142,29 +269,37 @@ def get_cur_ea():
     nativeSize = get_native_size()
 
     if nativeSize is 16:
-        return GetRegValue('IP')
+        return get_reg_value('IP')
 
     if nativeSize is 32:
-        return GetRegValue('EIP')
+        return get_reg_value('EIP')
 
     if nativeSize is 64:
-        return GetRegValue('RIP')
+        return get_reg_value('RIP')
 
 # TODO: Change this to be architecture independent
-def get_ret_adr():
+def get_stack_ret_adr():
     """
-    Get the return address for the current function
+    Get the return address stored on top of the stack (valid upon function entry)
+    @return: Address of the instruction following the CALL
     """
     nativeSize = get_native_size()
 
     if nativeSize is 16:
-        nextInst = DbgWord(GetRegValue('SP'))  # Address of instruction following the CALL
+        return get_adrs_mem(get_reg_value('SP'))
 
     if nativeSize is 32:
-        nextInst = DbgDword(GetRegValue('ESP'))  # Address of instruction following the CALL
+        return get_adrs_mem(get_reg_value('ESP'))
 
     if nativeSize is 64:
-        nextInst = DbgQword(GetRegValue('RSP'))  # Address of instruction following the CALL
+        return get_adrs_mem(get_reg_value('RSP'))
+
+# TODO: Change this to be architecture independent
+def get_ret_adr():
+    """
+    Get the return address for the current function
+    """
+    nextInst = get_stack_ret_adr()  # Address of instruction following the CALL
 
     prev_addr, farref = idaapi.decode_preceding_insn(nextInst)  # Get previous instruction
 
@@ -175,26 +310,118 @@ def get_sp():
     """
     Get the current stack pointer address
     """
-    return GetRegValue('ESP')
+    return get_reg_value('ESP')
+
+def get_reg_value(reg_name):
+    """
+    Get a register value
+    @param reg_name: Register name
+    @return: The register value
+    """
+    captured_memory = get_captured_memory()
+    if captured_memory is not None:
+        return captured_memory.get_reg_value(reg_name)
+
+    return GetRegValue(reg_name)
+
+# The register set does not change during a debugging session, so register names are resolved once per session.
+_register_names = []
+
+def invalidate_register_names():
+    """
+    Invalidate the cached register names (must be called whenever a new debugging session is started)
+    """
+    del _register_names[:]
+
+def get_register_names():
+    """
+    Get the names of the debugger integer registers
+    @return: A list of register names
+    """
+    if _register_names:
+        return _register_names
+
+    reg_names = []
+
+    dbg_registers = idaapi.dbg_get_registers()
+    if dbg_registers is None:
+        return reg_names
+
+    for reg_info in dbg_registers:
+        reg_name = reg_info[0]
+        try:
+            if isinstance(GetRegValue(reg_name), (int, long)):
+                reg_names.append(reg_name)
+        except Exception:
+            continue
+
+    _register_names.extend(reg_names)
+    return _register_names
 
 def get_adrs_mem(ea):
     """
     Get the memory at address according to native size (16, 32 or 64 bit)
     """
+    captured_memory = get_captured_memory()
+    if captured_memory is not None:
+        return captured_memory.read_native(ea)
+
     # Verify EA
     if not idc.isEnabled(ea):
         return None
 
+    data = read_dbg_memory(ea, get_native_size() / 8)
+    if data is None:
+        return None
+
+    return unpack_native(data)
+
+def get_adrs_mem_block(ea, size):
+    """
+    Read a contiguous block of debuggee memory using a single debugger read
+    @param ea: Block start address
+    @param size: Block size (in bytes)
+    @return: A string holding the block data, or None if the block could not be read.
+    """
+    if ea is None or size is None or size <= 0:
+        return None
+
+    captured_memory = get_captured_memory()
+    if captured_memory is not None:
+        return captured_memory.read(ea, size)
+
+    # Verify EA
+    if not idc.isEnabled(ea):
+        return None
+
+    return read_dbg_memory(ea, size)
+
+def unpack_native(buf, offset=0):
+    """
+    Decode a native size (16, 32 or 64 bit) value from a memory buffer
+    @param buf: Memory buffer (as returned by get_adrs_mem_block)
+    @param offset: Offset of the value within the buffer
+    @return: The decoded value, or None if the buffer is too short.
+    """
     nativeSize = get_native_size()
 
     if nativeSize is 16:
-        return DbgWord(ea)
+        fmt = "H"
+    elif nativeSize is 32:
+        fmt = "I"
+    else:
+        fmt = "Q"
 
-    if nativeSize is 32:
-        return DbgDword(ea)
+    if offset < 0 or offset + (nativeSize / 8) > len(buf):
+        return None
 
-    if nativeSize is 64:
-        return DbgQword(ea)
+    # Respect the target byte order
+    if idaapi.get_inf_structure().mf:
+        fmt = ">" + fmt
+    else:
+        fmt = "<" + fmt
+
+    return struct.unpack_from(fmt, buf, offset)[0]
 
 # Ask hex-rays how can this be done a bit more gracefully..
 def regOffsetToName(offset):
@@ -224,6 +451,30 @@ def get_stack_element_size():
     """
     return get_native_size()/8
 
+def resolve_call_target(ea):
+    """
+    Resolve the destination of a CALL instruction while the debugger is stopped on it.
+    Handles direct calls, memory indirect calls (e.g "call [IAT entry]") and register calls (e.g "call eax").
+    @param ea: Effective address of the call instruction.
+    @return: The call destination address, or None if the destination cannot be resolved.
+    """
+    op_type = idc.GetOpType(ea, 0)
+
+    # Direct call
+    if op_type == idc.o_near or op_type == idc.o_far:
+        return idc.GetOperandValue(ea, 0)
+
+    # Memory indirect call
+    if op_type == idc.o_mem:
+        return get_adrs_mem(idc.GetOperandValue(ea, 0))
+
+    # Register call
+    if op_type == idc.o_reg:
+        return get_reg_value(idc.GetOpnd(ea, 0))
+
+    # [Base + Index (+ Displacement)] calls are not resolved.
+    return None
+
 def is_indirect(ea):
     """
     Check if a call instruction is direct or indirect.
@@ -265,6 +516,8 @@ def analyze_area(start_ea, end_ea):
     """
     #TODO: Check with hex-rays why is it necessary to refresh memory.
     refresh_debugger_memory()
+    invalidate_page_cache()
+    invalidate_insn_cache()
 
     if idc.AnalyzeArea(start_ea, end_ea) !=1:
         return False
@@ -2,8 +2,9 @@ __author__ = 'yanivb'
 
 import idaapi
 import logging
-from DIE.Lib.IDAConnector import get_native_size, regOffsetToName,\
-    get_function_name, get_func_start_adr, get_function_end_adr
+from DIE.Lib.IDAConnector import get_native_size, regOffsetToName
+from DIE.Lib.AnalysisSnapshot import get_analysis_snapshot
+from DIE.Lib.PhaseTimers import get_phase_timers, timer, PHASE_FUNC_PROTO
 
 #
 # This file contains several wrappers for common IDA data type such as Functions, Function Argument,
@@ -117,6 +118,21 @@ class FuncArg():
         native_size = get_native_size()/8
         return "Arg_%s" % hex(self.argNum * native_size)
 
+    def size(self):
+        """
+        Argument size (in bytes). Unknown sized arguments are assumed to be native size.
+        """
+        native_size = get_native_size()/8
+
+        if self.argtype is None:
+            return native_size
+
+        arg_size = self.argtype.get_size()
+        if arg_size == idaapi.BADSIZE or arg_size < native_size:
+            return native_size
+
+        return arg_size
+
     def getRegOffset(self):
         """
         Get register offset (into ph.regnames)
@@ -208,23 +224,26 @@ class Function():
         self.ea = ea        # Effective Address of the function
         self.iatEA = iatEA  # If imported function, the address in the IAT
 
-        self.funcName = get_function_name(self.ea)     # Function name
-        self.func_start = get_func_start_adr(self.ea)  # Function start address
-        self.func_end = get_function_end_adr(self.ea)  # Function end address
+        analysis_snapshot = get_analysis_snapshot()
+        self.funcName = analysis_snapshot.get_function_name(self.ea)     # Function name
+        self.func_start = analysis_snapshot.get_func_start_adr(self.ea)  # Function start address
+        self.func_end = analysis_snapshot.get_function_end_adr(self.ea)  # Function end address
 
         self.proto_ea = self.getFuncProtoAdr()      # Address of function prototype
         self.typeInfo = idaapi.tinfo_t()            # Function type info
         self.funcInfo = idaapi.func_type_data_t()   # Function info
         self.argNum = 0                             # Number of input arguments
+        self.stack_args_size = 0                    # Total size of the stack passed arguments (in bytes)
 
         self.args = []      # Function argument list
         self.retArg = None  # Return argument
 
         self.library_name = library_name  # If library function, name of containing library
         self.isLibFunc = False
-        if self.iatEA:
+        if self.iatEA or self.library_name:
             self.isLibFunc = True  # Is this a library function
 
+        start_time = timer()
         try:
             self.getArguments()
 
@@ -232,6 +251,9 @@ class Function():
             self.logger.error("Function: Failed to get function arguments for function %s: %s", self.funcName, ex)
             return None
 
+        finally:
+            get_phase_timers().add(PHASE_FUNC_PROTO, start_time)
+
     def getFuncProtoAdr(self):
         """
         Get the effective address of the function prototype definition.
@@ -281,6 +303,10 @@ class Function():
             curArg = FuncArg(argType, argLoc, argIndex, argName, isGuessed)
             self.args.append(curArg)
 
+            # Keep track of the stack argument area size
+            if curArg.isStack():
+                self.stack_args_size = max(self.stack_args_size, curArg.offset() + curArg.size())
+
         # Set return argument
         if not self.funcInfo.rettype.empty():
             self.retArg = FuncArg(self.funcInfo.rettype,
@@ -296,6 +322,24 @@ class Function():
         for arg in self.args:
             print arg.getArgStr()
 
+
+def get_function(ea, iatEA=None, library_name=None):
+    """
+    Get a Function object, resolved prototypes are cached and shared between calls of the same function.
+    Cached Function objects must not be modified.
+    @param ea: Effective Address of the function
+    @param iatEA: If imported function, the address in the IAT
+    @param library_name: If library function, name of containing library
+    @return: A Function object
+    """
+    function_cache = get_analysis_snapshot().function_cache
+
+    key = (ea, iatEA)
+    if not key in function_cache:
+        function_cache[key] = Function(ea, iatEA, library_name=library_name)
+
+    return function_cache[key]
+
 #######################################################################################################################
 #
 #  IDA Struct Element class wrapper
@@ -0,0 +1,193 @@
+__author__ = 'yanivb'
+
+import logging
+import threading
+import Queue
+
+import idaapi
+import idc
+
+from DIE.Lib import DieConfig, DataParser
+from DIE.Lib.DbgMemory import CapturedMemory, capture_memory, set_captured_memory, get_event_pid
+
+
+class RawCapture():
+    """
+    Raw value data captured while the debuggee is suspended.
+    Holds plain data only (no IDA objects), so the value can be parsed later on by a parser worker.
+    """
+
+    def __init__(self, debug_value, resolved_plugins, captured_memory, parsed_values):
+        """
+        Ctor
+        @param debug_value: The DebugValue object to be parsed
+        @param resolved_plugins: The (parser plugin, parse mode, type parameters) tuples to run on the worker
+        @param captured_memory: Debuggee memory captured at the value location (type: CapturedMemory)
+        @param parsed_values: Values already parsed by the plugins which were run inline
+        """
+        self.debug_value = debug_value
+        self.raw_value = debug_value.rawValue
+        self.resolved_plugins = resolved_plugins
+        self.captured_memory = captured_memory
+        self.parsed_values = parsed_values
+
+
+class ParserPool():
+    """
+    A pool of worker threads running the data parser plugins.
+    Debugger callbacks only record raw values (and the memory they point to) into the pool queue, so the time the
+    debuggee is suspended does not depend on the number of installed parser plugins.
+
+    Everything that requires IDA is done on the main thread: the value type is matched against the plugins when the
+    value is submitted, and plugins which are not thread-safe (e.g. the handle parser, which queries the live debuggee
+    process) are run inline. Workers only get the raw value, the resolved parse modes and the captured memory.
+
+    Note: only a single window (parse_window_size bytes) at the value itself is captured. Worker plugins can not
+    follow nested pointers - any read outside the captured window returns None.
+    """
+
+    def __init__(self):
+
+        self.logger = logging.getLogger(__name__)
+        self.config = DieConfig.get_config()
+        self.dataParser = DataParser.getParser()
+
+        self.queue = Queue.Queue()      # Raw capture queue
+        self.workers = []               # Worker threads
+
+    def start(self, worker_num):
+        """
+        Start the parser workers
+        @param worker_num: Number of worker threads to start
+        @return: True if workers were started, otherwise False
+        """
+        if self.is_running():
+            return True
+
+        try:
+            for worker_index in xrange(0, worker_num):
+                worker = threading.Thread(target=self._worker, name="DIE-Parser-%d" % worker_index)
+                worker.daemon = True
+                worker.start()
+                self.workers.append(worker)
+
+            self.logger.info("Started %d parser workers", worker_num)
+            return True
+
+        except Exception as ex:
+            self.logger.error("Failed to start parser workers: %s", ex)
+            return False
+
+    def stop(self):
+        """
+        Wait for all queued values to be parsed and stop the parser workers.
+        """
+        if not self.is_running():
+            return
+
+        self.join()
+
+        for worker in self.workers:
+            self.queue.put(None)  # Worker stop signal
+
+        for worker in self.workers:
+            worker.join()
+
+        del self.workers[:]
+
+    def join(self):
+        """
+        Block until all queued values were parsed
+        """
+        self.queue.join()
+
+    def is_running(self):
+        """
+        Check if parser workers are running
+        @return: True if parser workers are running, otherwise False
+        """
+        return len(self.workers) > 0
+
+    def submit(self, debug_value):
+        """
+        Resolve the parser plugins for a value and capture the raw data they require, then queue it for parsing.
+        Plugins which are not thread-safe are run immediately.
+        Must be called from the main thread while the debuggee is suspended.
+        @param debug_value: The DebugValue object to be parsed
+        """
+        if debug_value.rawValue is None:
+            return
+
+        type_name = None
+        if debug_value.type is not None:
+            type_name = idaapi.print_tinfo('', 0, 0, idaapi.PRTYPE_1LINE, debug_value.type, '', '')
+
+        resolved_plugins = self.dataParser.resolve_plugins(debug_value.type, debug_value.custom_parser, type_name)
+
+        inline_plugins = [resolved for resolved in resolved_plugins if not resolved[0].is_thread_safe]
+        worker_plugins = [resolved for resolved in resolved_plugins if resolved[0].is_thread_safe]
+
+        parsed_values = self.dataParser.run_resolved_plugins(debug_value.rawValue, inline_plugins)
+
+        if not worker_plugins:
+            debug_value.parsedValues = parsed_values
+            return
+
+        # Workers must never read the live debuggee, so captured memory is always set (even if empty).
+        captured_memory = CapturedMemory(get_event_pid())
+
+        # Capture the memory pointed by pointer values (and by unknown values that might be pointers)
+        if self.is_pointer_value(debug_value):
+            captured_memory.add_block(debug_value.rawValue,
+                                      capture_memory(debug_value.rawValue, self.config.parse_window_size))
+
+        self.queue.put(RawCapture(debug_value, worker_plugins, captured_memory, parsed_values))
+
+    def is_pointer_value(self, debug_value):
+        """
+        Check if a value should be treated as a pointer when capturing memory for its parsers
+        @param debug_value: The DebugValue object
+        @return: True if the value is pointer typed, or if its type is unknown and it points to valid memory
+        """
+        if debug_value.type is not None:
+            return debug_value.type.is_ptr()
+
+        return idc.isEnabled(debug_value.rawValue)
+
+    def _worker(self):
+        """
+        Parser worker thread routine
+        """
+        while True:
+            raw_capture = self.queue.get()
+
+            try:
+                if raw_capture is None:
+                    return
+
+                set_captured_memory(raw_capture.captured_memory)
+
+                parsed_values = self.dataParser.run_resolved_plugins(raw_capture.raw_value,
+                                                                     raw_capture.resolved_plugins)
+
+                raw_capture.debug_value.parsedValues = raw_capture.parsed_values + parsed_values
+
+            except Exception as ex:
+                self.logger.error("Parser worker failed while parsing value: %s", ex)
+
+            finally:
+                set_captured_memory(None)
+                self.queue.task_done()
+
+
+#############################################################################
+# Singleton
+#############################################################################
+
+_parser_pool = ParserPool()
+
+def get_parser_pool():
+    """
+    Get the global parser pool instance
+    """
+    return _parser_pool
@@ -0,0 +1,144 @@
+__author__ = 'yanivb'
+
+import math
+import threading
+from timeit import default_timer
+
+################################################################
+#
+# Low overhead per-phase timers.
+# Every timed phase is aggregated into a log-scale histogram,
+# so per-call latency can be inspected (count, p50, p95, max)
+# without keeping the individual samples.
+#
+################################################################
+
+# Timed phases
+PHASE_BP_DISPATCH = "bp_dispatch"       # Breakpoint dispatch (dbg_bpt)
+PHASE_STEP_INTO = "step_into"           # Step-into handling (dbg_step_into)
+PHASE_FUNC_PROTO = "func_proto"         # Function prototype resolution
+PHASE_ARG_CALL = "arg_capture_call"     # Argument capture upon function call
+PHASE_ARG_RET = "arg_capture_ret"       # Argument capture upon function return
+PHASE_PARSER = "parser.%s"              # A single parser plugin (formatted with the plugin name)
+PHASE_DB_INSERT = "db_insert"           # DB insertion
+
+BUCKETS_PER_OCTAVE = 4      # Histogram resolution (buckets per doubling of the elapsed time)
+MIN_TIME = 1e-7             # Elapsed times lower than this are counted in the first bucket
+
+
+def timer():
+    """
+    Get the current timer value (used to time a phase with PhaseTimers.add)
+    """
+    return default_timer()
+
+
+class PhaseHistogram():
+    """
+    Log-scale histogram of phase elapsed times
+    """
+
+    def __init__(self):
+
+        self.count = 0          # Number of timed samples
+        self.total = 0.0        # Total elapsed time (in seconds)
+        self.max = 0.0          # Maximal elapsed time (in seconds)
+        self.buckets = {}       # Sample counters (Key: bucket index, Value: number of samples)
+
+    def add(self, elapsed):
+        """
+        Add a sample
+        @param elapsed: Elapsed time (in seconds)
+        """
+        self.count += 1
+        self.total += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+
+        bucket = 0
+        if elapsed > MIN_TIME:
+            bucket = int(math.log(elapsed / MIN_TIME, 2) * BUCKETS_PER_OCTAVE)
+
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def percentile(self, percent):
+        """
+        Get an elapsed time percentile
+        @param percent: Percentile (0 - 100)
+        @return: The upper bound of the bucket containing the percentile (in seconds, capped by the maximal time)
+        """
+        if self.count == 0:
+            return 0.0
+
+        rank = self.count * percent / 100.0
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(MIN_TIME * 2 ** (float(bucket + 1) / BUCKETS_PER_OCTAVE), self.max)
+
+        return self.max
+
+    def summary(self):
+        """
+        Get the histogram summary
+        @return: A dictionary with count, total, p50, p95 and max values (times are in seconds)
+        """
+        return {"count": self.count,
+                "total": self.total,
+                "p50": self.percentile(50),
+                "p95": self.percentile(95),
+                "max": self.max}
+
+
+class PhaseTimers():
+    """
+    Per-phase elapsed time histograms of the current run
+    """
+
+    def __init__(self):
+
+        self.lock = threading.Lock()    # Phases may be timed by the parser workers as well
+        self.histograms = {}            # Phase histograms (Key: phase name, Value: PhaseHistogram)
+
+    def reset(self):
+        """
+        Clear all phase histograms
+        """
+        with self.lock:
+            self.histograms = {}
+
+    def add(self, phase, start_time):
+        """
+        Add a phase sample
+        @param phase: Phase name
+        @param start_time: The timer value at phase start (as returned by timer())
+        """
+        elapsed = default_timer() - start_time
+
+        with self.lock:
+            if not phase in self.histograms:
+                self.histograms[phase] = PhaseHistogram()
+
+            self.histograms[phase].add(elapsed)
+
+    def get_stats(self):
+        """
+        Get the phase statistics
+        @return: A dictionary of histogram summaries (Key: phase name, Value: summary dictionary)
+        """
+        with self.lock:
+            return dict((phase, histogram.summary()) for (phase, histogram) in self.histograms.iteritems())
+
+
+#############################################################################
+# Singleton
+#############################################################################
+
+_phase_timers = PhaseTimers()
+
+def get_phase_timers():
+    """
+    Get the global phase timers instance
+    """
+    return _phase_timers
@@ -0,0 +1,46 @@
+__author__ = 'yanivb'
+
+
+class SamplingPolicy():
+    """
+    Per-function call sampling policy.
+    The first calls of every function are fully captured. Once a function gets hot, only a sample of its calls
+    is captured: every k-th call, with the sampling interval growing by a decay factor after each sample.
+    Calls in between are still counted, so true call counts are kept.
+    """
+
+    def __init__(self, full_calls, interval, decay=1.0):
+        """
+        Ctor
+        @param full_calls: Number of calls captured fully before sampling starts
+        @param interval: Initial sampling interval (capture every interval`th call)
+        @param decay: Sampling interval growth factor (1.0 - fixed interval)
+        """
+        self.full_calls = full_calls
+        self.interval = max(1, interval)
+        self.decay = max(1.0, decay)
+
+        # Sampling schedule (Key: function name, Value: a tuple of (next sampled call number, current interval))
+        self.schedule = {}
+
+    def should_capture(self, func_name, call_num):
+        """
+        Check if a function call should be captured
+        @param func_name: Function name
+        @param call_num: Call number of this call (number of times the function was called, including this call)
+        @return: True if the call context should be captured, otherwise False
+        """
+        if call_num <= self.full_calls:
+            return True
+
+        if not func_name in self.schedule:
+            self.schedule[func_name] = (self.full_calls + self.interval, float(self.interval))
+
+        (next_sample, interval) = self.schedule[func_name]
+        if call_num < next_sample:
+            return False
+
+        interval *= self.decay
+        self.schedule[func_name] = (call_num + max(1, int(interval)), interval)
+
+        return True
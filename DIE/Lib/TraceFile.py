@@ -0,0 +1,279 @@
+__author__ = 'yanivb'
+
+import logging
+import struct
+import time
+
+from DIE.Lib.DbgMemory import CapturedMemory
+
+################################################################
+#
+# DIE raw trace file format.
+# A trace file is an append-only stream of call\return records,
+# each holding the raw debuggee state captured at that point.
+# Traces are replayed offline into the DIE DB (see TraceReplay).
+#
+#   Header:  magic, version, start time, input file MD5
+#   Record:  record type, thread id, timestamp, function ea,
+#            IAT ea, calling ea, library name, process id,
+#            registers, memory blocks
+#   Count record (version 2):
+#            record type, thread id, timestamp (other fields unused),
+#            total call count of each function in the thread
+#
+################################################################
+
+TRACE_MAGIC = "DIETRACE"
+TRACE_VERSION = 2
+
+# Record types
+CALL_RECORD = 0x1
+RET_RECORD = 0x2
+COUNT_RECORD = 0x3     # Thread function call counts, written once the process exits
+
+_HEADER = struct.Struct("<8sHd32s")
+_RECORD = struct.Struct("<BIdQQQI")
+_LENGTH = struct.Struct("<H")
+_REGISTER = struct.Struct("<Q")
+_BLOCK = struct.Struct("<QI")
+_COUNT_LENGTH = struct.Struct("<I")
+_COUNT = struct.Struct("<Q")
+
+
+class TraceRecord():
+    """
+    A single trace record
+    """
+
+    def __init__(self, record_type, thread_id, timestamp, ea, iat_ea, calling_ea, library_name, captured_memory,
+                 call_counts=None):
+        """
+        Ctor
+        @param record_type: CALL_RECORD, RET_RECORD or COUNT_RECORD
+        @param thread_id: Thread id
+        @param timestamp: Record time
+        @param ea: Called function address (CALL_RECORD only)
+        @param iat_ea: Called function IAT address, for library functions (CALL_RECORD only)
+        @param calling_ea: CALL instruction address, if recorded at the call-site (CALL_RECORD only)
+        @param library_name: Containing library name, for library functions (CALL_RECORD only)
+        @param captured_memory: Captured debuggee state (type: CapturedMemory)
+        @param call_counts: Total call count of each function (Key: function name, Value: number of calls).
+                            COUNT_RECORD only.
+        """
+        self.record_type = record_type
+        self.thread_id = thread_id
+        self.timestamp = timestamp
+        self.ea = ea
+        self.iat_ea = iat_ea
+        self.calling_ea = calling_ea
+        self.library_name = library_name
+        self.captured_memory = captured_memory
+        self.call_counts = call_counts
+
+
+class TraceWriter():
+    """
+    Writes raw trace records to a trace file
+    """
+
+    def __init__(self, file_name, md5):
+        """
+        Ctor
+        @param file_name: Trace file name
+        @param md5: Traced input file MD5
+        """
+        self.logger = logging.getLogger(__name__)
+
+        self.file_name = file_name
+        self.record_count = 0
+
+        self.out_file = open(file_name, 'wb')
+        self.out_file.write(_HEADER.pack(TRACE_MAGIC, TRACE_VERSION, time.time(), md5))
+
+    def write_record(self, record_type, thread_id, captured_memory, ea=None, iat_ea=None, calling_ea=None,
+                     library_name=None):
+        """
+        Append a record to the trace file
+        @param record_type: CALL_RECORD or RET_RECORD
+        @param thread_id: Thread id
+        @param captured_memory: Captured debuggee state (type: CapturedMemory)
+        @param ea: Called function address
+        @param iat_ea: Called function IAT address (for library functions)
+        @param calling_ea: CALL instruction address (if recorded at the call-site)
+        @param library_name: Containing library name (for library functions)
+        """
+        pid = captured_memory.pid
+        if pid is None:
+            pid = 0
+
+        chunks = [_RECORD.pack(record_type,
+                               thread_id,
+                               time.time(),
+                               ea or 0,
+                               iat_ea or 0,
+                               calling_ea or 0,
+                               pid)]
+
+        chunks.append(self._pack_str(library_name))
+
+        # Registers
+        chunks.append(_LENGTH.pack(len(captured_memory.registers)))
+        for reg_name, reg_value in captured_memory.registers.iteritems():
+            chunks.append(self._pack_str(reg_name))
+            chunks.append(_REGISTER.pack(reg_value & 0xFFFFFFFFFFFFFFFF))
+
+        # Memory blocks
+        chunks.append(_LENGTH.pack(len(captured_memory.blocks)))
+        for block_ea, block_data in captured_memory.blocks:
+            chunks.append(_BLOCK.pack(block_ea, len(block_data)))
+            chunks.append(block_data)
+
+        self.out_file.write("".join(chunks))
+        self.record_count += 1
+
+    def write_counts(self, thread_id, call_counts):
+        """
+        Append a count record to the trace file.
+        Call counts include calls that were not recorded (e.g calls skipped by sampling).
+        @param thread_id: Thread id
+        @param call_counts: Total call count of each function (Key: function name, Value: number of calls)
+        """
+        chunks = [_RECORD.pack(COUNT_RECORD, thread_id, time.time(), 0, 0, 0, 0)]
+
+        chunks.append(_COUNT_LENGTH.pack(len(call_counts)))
+        for func_name, count in call_counts.iteritems():
+            chunks.append(self._pack_str(func_name))
+            chunks.append(_COUNT.pack(count))
+
+        self.out_file.write("".join(chunks))
+        self.record_count += 1
+
+    def close(self):
+        """
+        Close the trace file
+        """
+        if self.out_file is not None:
+            self.out_file.close()
+            self.out_file = None
+
+        self.logger.info("Trace file %s closed, %d records written.", self.file_name, self.record_count)
+
+    def _pack_str(self, value):
+        """
+        Pack a length prefixed string
+        """
+        if value is None:
+            value = ""
+
+        return _LENGTH.pack(len(value)) + value
+
+
+class TraceReader():
+    """
+    Reads raw trace records from a trace file
+    """
+
+    def __init__(self, file_name):
+        """
+        Ctor
+        @param file_name: Trace file name
+        """
+        self.logger = logging.getLogger(__name__)
+
+        self.in_file = open(file_name, 'rb')
+
+        header = self.in_file.read(_HEADER.size)
+        if len(header) != _HEADER.size:
+            raise ValueError("Invalid trace file: %s" % file_name)
+
+        (magic, version, self.start_time, self.md5) = _HEADER.unpack(header)
+        if magic != TRACE_MAGIC:
+            raise ValueError("Invalid trace file: %s" % file_name)
+
+        if version not in (1, TRACE_VERSION):
+            raise ValueError("Unsupported trace file version: %d" % version)
+
+        self.end_time = self.start_time  # Updated as records are read
+
+    def records(self):
+        """
+        Iterate the trace records.
+        A truncated last record (e.g if the debugger crashed while writing it) ends the iteration.
+        @return: A generator of TraceRecord objects
+        """
+        try:
+            while True:
+                record_data = self.in_file.read(_RECORD.size)
+                if len(record_data) != _RECORD.size:
+                    return
+
+                (record_type, thread_id, timestamp, ea, iat_ea, calling_ea, pid) = _RECORD.unpack(record_data)
+
+                if record_type == COUNT_RECORD:
+                    call_counts = {}
+                    (count_num,) = _COUNT_LENGTH.unpack(self._read(_COUNT_LENGTH.size))
+                    for count_index in xrange(0, count_num):
+                        func_name = self._read_str()
+                        (call_counts[func_name],) = _COUNT.unpack(self._read(_COUNT.size))
+
+                    self.end_time = timestamp
+
+                    yield TraceRecord(record_type, thread_id, timestamp, None, None, None, None, None,
+                                      call_counts=call_counts)
+                    continue
+
+                captured_memory = CapturedMemory(pid)
+                library_name = self._read_str()
+
+                for reg_index in xrange(0, self._read_length()):
+                    reg_name = self._read_str()
+                    (reg_value,) = _REGISTER.unpack(self._read(_REGISTER.size))
+                    captured_memory.registers[reg_name] = reg_value
+
+                for block_index in xrange(0, self._read_length()):
+                    (block_ea, block_size) = _BLOCK.unpack(self._read(_BLOCK.size))
+                    captured_memory.add_block(block_ea, self._read(block_size))
+
+                self.end_time = timestamp
+
+                yield TraceRecord(record_type,
+                                  thread_id,
+                                  timestamp,
+                                  ea or None,
+                                  iat_ea or None,
+                                  calling_ea or None,
+                                  library_name or None,
+                                  captured_memory)
+
+        except EOFError:
+            self.logger.error("Trace file is truncated, last record was skipped.")
+            return
+
+    def close(self):
+        """
+        Close the trace file
+        """
+        self.in_file.close()
+
+    def _read(self, size):
+        """
+        Read exactly size bytes from the trace file
+        """
+        data = self.in_file.read(size)
+        if len(data) != size:
+            raise EOFError()
+
+        return data
+
+    def _read_length(self):
+        """
+        Read a length field
+        """
+        (length,) = _LENGTH.unpack(self._read(_LENGTH.size))
+        return length
+
+    def _read_str(self):
+        """
+        Read a length prefixed string
+        """
+        return self._read(self._read_length())
@@ -0,0 +1,131 @@
+__author__ = 'yanivb'
+
+import logging
+
+import idaapi
+import idautils
+
+import DIE.Lib.DIEDb
+import DIE.Lib.DieConfig
+from DIE.Lib.CallStack import CallStack
+from DIE.Lib.TraceFile import TraceReader, CALL_RECORD, RET_RECORD, COUNT_RECORD
+from DIE.Lib.IDAConnector import set_captured_memory
+from DIE.Lib.DIE_Exceptions import DbFileMismatch, NewCodeSectionException
+
+
+class TraceReplayer():
+    """
+    Replays a raw trace file (recorded by DebugHooker in record-only mode) into the DIE DB.
+    Function contexts and debug values are rebuilt from the recorded debuggee state, so no live debugger is required
+    and the current data parser plugins are used for parsing.
+    """
+
+    def __init__(self):
+
+        self.logger = logging.getLogger(__name__)
+        self.config = DIE.Lib.DieConfig.get_config()
+
+        self.callStack = {}     # Function call-stack dictionary (Key: ThreadId, Value: Thread specific Call-Stack)
+
+    def replay(self, file_name):
+        """
+        Replay a trace file into the DIE DB
+        @param file_name: Trace file name
+        @return: True if the trace was replayed successfully, otherwise False
+        """
+        trace_reader = TraceReader(file_name)
+
+        try:
+            if trace_reader.md5 != idautils.GetInputFileMD5():
+                raise DbFileMismatch("Trace file was not recorded for the currently analyzed file")
+
+            self.callStack.clear()
+
+            die_db = DIE.Lib.DIEDb.get_db()
+            if self.config.is_sqlite_db and die_db.store is None:
+                die_db.open_store()
+
+            die_db.start_run(trace_reader.start_time, idaapi.get_input_file_path(), trace_reader.md5)
+
+            pending_contexts = 0
+
+            for record in trace_reader.records():
+                if not record.thread_id in self.callStack:
+                    self.callStack[record.thread_id] = CallStack()
+
+                current_callstack = self.callStack[record.thread_id]
+
+                # Values are read from the recorded state rather than from a live debuggee
+                set_captured_memory(record.captured_memory)
+                try:
+                    if record.record_type == CALL_RECORD:
+                        current_callstack.push(record.ea,
+                                               record.iat_ea,
+                                               library_name=record.library_name,
+                                               calling_ea=record.calling_ea)
+
+                    elif record.record_type == RET_RECORD:
+                        current_callstack.pop()
+                        pending_contexts += 1
+
+                    elif record.record_type == COUNT_RECORD:
+                        # Recorded call counts include calls that were not recorded (sampling)
+                        current_callstack.function_counter.update(record.call_counts)
+
+                    else:
+                        self.logger.error("Unknown trace record type %d", record.record_type)
+
+                except NewCodeSectionException:
+                    self.logger.error("Recorded call to %s is not part of the analyzed code", hex(record.ea))
+
+                finally:
+                    set_captured_memory(None)
+
+                # Flush completed function contexts (memory is bounded only when using the SQLite DB store)
+                if self.config.flush_contexts > 0 and pending_contexts >= self.config.flush_contexts:
+                    self.flush_call_trees()
+                    pending_contexts = 0
+
+            self.flush_call_trees()
+            self.update_function_counts()
+            die_db.end_run(trace_reader.end_time)
+
+            return True
+
+        except DbFileMismatch:
+            raise
+
+        except Exception as ex:
+            self.logger.exception("Failed while replaying trace file %s: %s", file_name, ex)
+            return False
+
+        finally:
+            trace_reader.close()
+
+    def flush_call_trees(self):
+        """
+        Move the completed function contexts of all threads into the DIE DB and release them from the call trees
+        """
+        die_db = DIE.Lib.DIEDb.get_db()
+
+        for thread_id in self.callStack:
+            call_tree = self.callStack[thread_id].callTree
+            if len(call_tree) > 0:
+                die_db.flush_thread_data(thread_id, call_tree)
+                del call_tree[:]
+
+    def update_function_counts(self):
+        """
+        Update the DIE DB with the total (all threads) call and capture counts of every function
+        """
+        call_counts = {}
+        capture_counts = {}
+
+        for call_stack in self.callStack.itervalues():
+            for (func_name, count) in call_stack.function_counter.iteritems():
+                call_counts[func_name] = call_counts.get(func_name, 0) + count
+
+            for (func_name, count) in call_stack.capture_counter.iteritems():
+                capture_counts[func_name] = capture_counts.get(func_name, 0) + count
+
+        DIE.Lib.DIEDb.get_db().update_function_counts(call_counts, capture_counts)
@@ -1,9 +1,20 @@
 __author__ = 'yanivb'
 
-class dbFuncArg():
+################################################################
+#
+# DIE DB records.
+# Records are held in dense DB tables and referenced by their
+# table index (record id). Record classes use __slots__ to keep
+# the per-record memory overhead low.
+#
+################################################################
+
+class dbFuncArg(object):
     """
     Function Argument
     """
+    __slots__ = ("name", "type", "arg_index", "is_stack", "is_register")
+
     def __init__(self, arg_name, arg_type, arg_index, is_stack):
 
         self.name = arg_name
@@ -13,10 +24,13 @@ class dbFuncArg():
         self.is_stack = is_stack
         self.is_register = not is_stack
 
-class dbFunction():
+class dbFunction(object):
     """
     Static Function Data
     """
+    __slots__ = ("function_name", "function_start", "function_end", "proto_ea", "arg_num", "is_lib_func", "lib_name",
+                 "args", "ret_arg", "function_contexts", "call_count", "capture_count", "db_id")
+
     def __init__(self, function_name, function_start, function_end, proto_ea, arg_num, is_lib_func, lib_name):
 
         self.function_name = function_name
@@ -33,6 +47,11 @@ class dbFunction():
 
         self.function_contexts = []
 
+        self.call_count = 0      # Total number of runtime calls (including calls that were not sampled)
+        self.capture_count = 0   # Number of runtime calls with a captured function context
+
+        self.db_id = None        # Row id (SQLite store records only)
+
     def __getkey__(self):
         arg_num = self.arg_num
         if self.arg_num is None:
@@ -58,10 +77,14 @@ class dbFunction():
     def __ne__(self, other):
         return not __eq__(self, other)
 
-class dbFunction_Context():
+class dbFunction_Context(object):
     """
     Function Runtime Context
     """
+    __slots__ = ("function", "call_values", "ret_values", "ret_arg_value", "call_reg_state", "ret_reg_state",
+                 "calling_ea", "calling_func_name", "is_indirect", "is_new_func", "thread_id", "total_process_time",
+                 "db_id")
+
     def __init__(self, call_reg_state, ret_reg_state, calling_ea, is_indirect, is_new_func, calling_func_name, total_proccess_time, thread_id):
 
         self.function = None
@@ -83,11 +106,15 @@ class dbFunction_Context():
 
         self.total_process_time = total_proccess_time
 
+        self.db_id = None
 
-class dbDebug_Values():
+
+class dbDebug_Values(object):
     """
     Dynamically Acquired Values
     """
+    __slots__ = ("raw_value", "type", "name", "parsed_values", "nested_values", "reference_flink", "reference_blink",
+                 "function_context", "derref_depth", "best_val_id", "is_definitely_parsed", "array_summary", "db_id")
 
     def __init__(self, raw_value, type_name, name, is_definitely_parsed, deref_depth):
 
@@ -108,11 +135,37 @@ class dbDebug_Values():
         self.best_val_id = None  # Parsed_val_id of the most definite (lowest scoring) parsed value.
         self.is_definitely_parsed = is_definitely_parsed
 
+        self.array_summary = None  # Compact array elements summary (type: dbArray_Summary)
+
+        self.db_id = None
+
 
-class dbParsed_Value():
+class dbArray_Summary(object):
+    """
+    Compact Array Elements Summary
+    """
+    __slots__ = ("element_type", "element_num", "element_size", "fmt", "data", "min", "max", "mean", "zero_count")
+
+    def __init__(self, element_type, element_num, element_size, fmt, data, min_val, max_val, mean, zero_count):
+
+        self.element_type = element_type
+        self.element_num = element_num
+        self.element_size = element_size
+
+        self.fmt = fmt      # struct format of a single element (including byte order)
+        self.data = data    # Raw array data
+
+        self.min = min_val
+        self.max = max_val
+        self.mean = mean
+        self.zero_count = zero_count
+
+
+class dbParsed_Value(object):
     """
     Dynamically Parsed Value
     """
+    __slots__ = ("data", "description", "raw", "type", "score", "dbgValues", "db_id")
 
     def __init__(self, data, description, raw_val, score, type):
 
@@ -125,6 +178,8 @@ class dbParsed_Value():
 
         self.dbgValues = []
 
+        self.db_id = None
+
     def __getkey__(self):
         if self.data is not None:
             data = self.data
@@ -152,20 +207,24 @@ class dbParsed_Value():
     def __ne__(self, other):
         return not __eq__(self, other)
 
-class dbThread():
+class dbThread(object):
     """
     Runtime Thread
     """
+    __slots__ = ("thread_num", "cfg", "db_id")
 
     def __init__(self, thread_num):
 
         self.thread_num = thread_num
         self.cfg = []
 
-class dbRun_Info():
+        self.db_id = None
+
+class dbRun_Info(object):
     """
     Runtime Info
     """
+    __slots__ = ("start_time", "end_time", "file", "md5", "threads", "phase_stats")
 
     def __init__(self, start_time, end_time, filename, md5):
 
@@ -176,6 +235,8 @@ class dbRun_Info():
 
         self.threads = []      # TODO: LINK TO dbThreads
 
+        self.phase_stats = {}  # Per-phase timing histograms (Key: phase name, Value: count\total\p50\p95\max dict)
+
 
 
 
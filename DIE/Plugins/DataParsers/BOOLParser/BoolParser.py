@@ -8,6 +8,7 @@ class BoolParser(DataPluginBase):
     """
     A parser for boolean values
     """
+    is_thread_safe = True
 
     def __init__(self):
         super(BoolParser, self).__init__()
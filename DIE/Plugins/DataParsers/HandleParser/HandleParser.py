@@ -54,7 +54,7 @@ class HandleParser(DataPluginBase):
                 return None
 
             handle = rawValue
-            processId = idc.GetEventPid()
+            processId = self.get_pid()
 
             #TODO: create "custom" init
 
@@ -12,6 +12,7 @@ class StringParser(DataPluginBase):
     """
     A generic string value parser
     """
+    is_thread_safe = True   # Strings are read from captured memory
 
     def __init__(self):
         super(StringParser, self).__init__()
@@ -37,37 +38,37 @@ class StringParser(DataPluginBase):
         """
         minLength = 5  # The minimal string length
 
-        value = idc.GetString(rawValue, strtype=idc.ASCSTR_C)
+        value = self.get_string(rawValue, strtype=idc.ASCSTR_C)
         if value is not None and len(value) >= minLength:
             value, raw_value = self.normalize_raw_value(value)
             self.addParsedvalue(value, 1, "ASCII C-String", raw_value)
 
-        value = idc.GetString(rawValue, strtype=idc.ASCSTR_UNICODE)
+        value = self.get_string(rawValue, strtype=idc.ASCSTR_UNICODE)
         if value is not None and len(value) >= minLength:
             value, raw_value = self.normalize_raw_value(value)
             self.addParsedvalue(value, 1, "Ascii Unicode String", raw_value)
 
-        value = idc.GetString(rawValue, strtype=idaapi.ASCSTR_PASCAL)
+        value = self.get_string(rawValue, strtype=idaapi.ASCSTR_PASCAL)
         if value is not None and len(value) >= minLength:
             value, raw_value = self.normalize_raw_value(value)
             self.addParsedvalue(value, 1, "Ascii Pascal string", raw_value)
 
-        value = idc.GetString(rawValue, strtype=idaapi.ASCSTR_LEN2)
+        value = self.get_string(rawValue, strtype=idaapi.ASCSTR_LEN2)
         if value is not None and len(value) >= minLength:
             value, raw_value = self.normalize_raw_value(value)
             self.addParsedvalue(value, 1, "Ascii String (Len2)", raw_value)
 
-        value = idc.GetString(rawValue, strtype=idaapi.ASCSTR_LEN4)
+        value = self.get_string(rawValue, strtype=idaapi.ASCSTR_LEN4)
         if value is not None and len(value) >= minLength:
             value, raw_value = self.normalize_raw_value(value)
             self.addParsedvalue(value, 1, "Ascii String (Len4)", raw_value)
 
-        value = idc.GetString(rawValue, strtype=idaapi.ASCSTR_ULEN2)
+        value = self.get_string(rawValue, strtype=idaapi.ASCSTR_ULEN2)
         if value is not None and len(value) >= minLength:
             value, raw_value = self.normalize_raw_value(value)
             self.addParsedvalue(value, 1, "Ascii String (ULen2)", raw_value)
 
-        value = idc.GetString(rawValue, strtype=idaapi.ASCSTR_ULEN4)
+        value = self.get_string(rawValue, strtype=idaapi.ASCSTR_ULEN4)
         if value is not None and len(value) >= minLength:
             value, raw_value = self.normalize_raw_value(value)
             self.addParsedvalue(value, 1, "Ascii String (ULen4)", raw_value)
@@ -86,11 +87,11 @@ class StringParser(DataPluginBase):
         @return:
         """
         if self.type_params == ASCII_STR:
-            value = idc.GetString(rawValue, strtype=idc.ASCSTR_C)
+            value = self.get_string(rawValue, strtype=idc.ASCSTR_C)
             description = "ASCII C-String"
 
         if self.type_params == UNICODE_STR:
-            value = idc.GetString(rawValue, strtype=idc.ASCSTR_UNICODE)
+            value = self.get_string(rawValue, strtype=idc.ASCSTR_UNICODE)
             description = "Unicode String"
 
         if value is not None:
@@ -14,6 +14,17 @@ Form Setup View
 Debbuging:
 <##Maximal function calls:   {iMaxFuncCall}>
 <##Maximal dereference depth:{iDerefDepth}>
+<Return breakpoints:{rRetBp}>
+<Resolve call targets:{rResolveCall}>
+<Record trace only:{rRecordTrace}>
+<Sample hot functions:{rSampling}>
+<Trace APIs only:{rApiTrace}>
+<SQLite DB store:{rSqliteDb}>{cDebugging}>
+<##Traced APIs:              {sApiFilter}>
+<##Parser workers:           {iParserWorkers}>
+<##Flush contexts every:     {iFlushContexts}>
+<##Full array elements:      {iArrayElements}>
+<##Armed breakpoints budget: {iBpBudget}>
 
 
 Debug Values:
@@ -26,8 +37,15 @@ Debug Values:
 
 """, {
             'cDebugValues': Form.ChkGroupControl(("rRaw", "rParse", "rArray", "rContainer", "rDeref", "rArgs")),
+            'cDebugging': Form.ChkGroupControl(("rRetBp", "rResolveCall", "rRecordTrace", "rSampling", "rApiTrace",
+                                                    "rSqliteDb")),
+            'sApiFilter': Form.StringInput(),
             'iMaxFuncCall': Form.NumericInput(tp=Form.FT_DEC),
             'iDerefDepth': Form.NumericInput(tp=Form.FT_DEC),
+            'iParserWorkers': Form.NumericInput(tp=Form.FT_DEC),
+            'iFlushContexts': Form.NumericInput(tp=Form.FT_DEC),
+            'iArrayElements': Form.NumericInput(tp=Form.FT_DEC),
+            'iBpBudget': Form.NumericInput(tp=Form.FT_DEC),
         })
 
     def OnButtonNop(self, code=0):
@@ -46,6 +64,10 @@ def Show(config_filename):
 
     settings.iMaxFuncCall.value = die_config.max_func_call
     settings.iDerefDepth.value = die_config.max_deref_depth
+    settings.iParserWorkers.value = die_config.parser_workers
+    settings.iFlushContexts.value = die_config.flush_contexts
+    settings.iArrayElements.value = die_config.array_full_elements
+    settings.iBpBudget.value = die_config.bp_budget
 
     settings.rDeref.checked = die_config.is_deref
     settings.rRaw.checked = die_config.is_raw
@@ -53,6 +75,13 @@ def Show(config_filename):
     settings.rArray.checked = die_config.is_array
     settings.rContainer.checked = die_config.is_container
     settings.rArgs.checked = die_config.get_func_args
+    settings.rRetBp.checked = die_config.is_ret_bp_engine
+    settings.rResolveCall.checked = die_config.is_resolve_call_target
+    settings.rRecordTrace.checked = die_config.is_record_trace
+    settings.rSampling.checked = die_config.is_sampling
+    settings.rApiTrace.checked = die_config.is_api_trace
+    settings.rSqliteDb.checked = die_config.is_sqlite_db
+    settings.sApiFilter.value = die_config.api_trace_filter
 
 
     ok = settings.Execute()
@@ -64,9 +93,20 @@ def Show(config_filename):
         die_config.set_array(settings.rArray.checked)
         die_config.set_container(settings.rContainer.checked)
         die_config.set_func_args(settings.rArgs.checked)
+        die_config.set_ret_bp_engine(settings.rRetBp.checked)
+        die_config.set_resolve_call_target(settings.rResolveCall.checked)
+        die_config.set_record_trace(settings.rRecordTrace.checked)
+        die_config.set_sampling(settings.rSampling.checked)
+        die_config.set_api_trace(settings.rApiTrace.checked)
+        die_config.set_sqlite_db(settings.rSqliteDb.checked)
+        die_config.set_api_trace_filter(settings.sApiFilter.value)
 
         die_config.set_max_deref_depth(settings.iDerefDepth.value)
         die_config.set_max_func_call(settings.iMaxFuncCall.value)
+        die_config.set_parser_workers(settings.iParserWorkers.value)
+        die_config.set_flush_contexts(settings.iFlushContexts.value)
+        die_config.set_array_full_elements(settings.iArrayElements.value)
+        die_config.set_bp_budget(settings.iBpBudget.value)
 
 
         print settings.iMaxFuncCall.value
@@ -0,0 +1,147 @@
+__author__ = 'yanivb'
+
+################################################################
+#
+# StaticImports lookup benchmark.
+# Builds a synthetic import table with thousands of imports and
+# times the indexed lookups against a linear scan of the import
+# lists (the way lookups were made before they were indexed).
+#
+# Run from within IDA (File -> Script file..), or in batch mode:
+#   idaq -A -S"benchmarks\bench_static_imports.py" <any idb>
+# The loaded IDB is not used, imports are generated.
+#
+################################################################
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from DIE.Lib.DbgImports import StaticImports
+
+MODULE_NUM = 30             # Number of imported modules
+IMPORTS_PER_MODULE = 200    # Number of imports per module
+IAT_BASE = 0x10000000       # Address of the first synthetic IAT entry
+LOOKUP_NUM = 10000          # Number of timed lookups
+
+
+class SyntheticImports(StaticImports):
+    """
+    StaticImports filled with a synthetic import table (built through the regular import callback)
+    """
+
+    def get_iat_data(self):
+        ea = IAT_BASE
+        for module_index in xrange(0, MODULE_NUM):
+            name = "module%d" % module_index
+
+            self.iat[name] = []
+            self.module_names[name] = set()
+            self.current_module = self.iat[name]
+            self.current_module_name = name
+
+            for import_index in xrange(0, IMPORTS_PER_MODULE):
+                self.imp_cb(ea, "Func%d_%d" % (module_index, import_index), import_index)
+                ea += 4
+
+
+def scan_funcname_in_module(imports, func_name, module_name):
+    """
+    Linear scan baseline of is_funcname_in_module
+    """
+    for (ea, name, ord) in imports.iat.get(module_name.lower(), []):
+        if name == func_name.lower():
+            return True
+    return False
+
+def scan_funcea_in_module(imports, func_ea, module_name):
+    """
+    Linear scan baseline of is_funcea_in_module
+    """
+    for (ea, name, ord) in imports.iat.get(module_name.lower(), []):
+        if ea == func_ea:
+            return True
+    return False
+
+def scan_func_module(imports, func_ea):
+    """
+    Linear scan baseline of get_func_module
+    """
+    for module_name in imports.iat:
+        for (ea, name, ord) in imports.iat[module_name]:
+            if ea == func_ea:
+                return module_name
+    return None
+
+def verify(imports):
+    """
+    Check the indexed lookup results against the synthetic import table
+    @return: Number of failed checks
+    """
+    failed = 0
+    ea = IAT_BASE
+    for module_index in xrange(0, MODULE_NUM):
+        module_name = "MODULE%d" % module_index
+        for import_index in xrange(0, IMPORTS_PER_MODULE):
+            func_name = "Func%d_%d" % (module_index, import_index)
+
+            if not imports.is_funcname_in_module(func_name, module_name):
+                failed += 1
+            if not imports.is_funcea_in_module(ea, module_name):
+                failed += 1
+            if imports.get_func_module(ea) != module_name.lower():
+                failed += 1
+
+            ea += 4
+
+    # Negative lookups
+    other_module = "module%d" % (MODULE_NUM + 1)
+    if imports.is_funcname_in_module("Func0_0", other_module) or imports.is_funcea_in_module(IAT_BASE, other_module):
+        failed += 1
+    if imports.is_funcname_in_module("Func0_0", "module1") or imports.is_funcea_in_module(IAT_BASE, "module1"):
+        failed += 1
+    if imports.get_func_module(IAT_BASE - 4) is not None or imports.get_func_module(IAT_BASE + 2) is not None:
+        failed += 1
+
+    return failed
+
+def bench(name, indexed_func, scan_func):
+    """
+    Time an indexed lookup and its linear scan baseline
+    """
+    indexed_time = min(timeit.repeat(indexed_func, number=LOOKUP_NUM, repeat=3)) / LOOKUP_NUM
+    scan_time = min(timeit.repeat(scan_func, number=LOOKUP_NUM, repeat=3)) / LOOKUP_NUM
+
+    print "%-24s scan: %8.2fus  indexed: %6.2fus  (x%.1f)" % \
+          (name, scan_time * 1e6, indexed_time * 1e6, scan_time / indexed_time)
+
+def main():
+    imports = SyntheticImports()
+
+    failed = verify(imports)
+    print "%d imports in %d modules, %d failed checks" % (MODULE_NUM * IMPORTS_PER_MODULE, MODULE_NUM, failed)
+
+    # Look up the last import of the last module (worst case for a scan)
+    module_name = "MODULE%d" % (MODULE_NUM - 1)
+    func_name = "Func%d_%d" % (MODULE_NUM - 1, IMPORTS_PER_MODULE - 1)
+    func_ea = IAT_BASE + (MODULE_NUM * IMPORTS_PER_MODULE - 1) * 4
+
+    bench("is_funcname_in_module",
+          lambda: imports.is_funcname_in_module(func_name, module_name),
+          lambda: scan_funcname_in_module(imports, func_name, module_name))
+
+    bench("is_funcea_in_module",
+          lambda: imports.is_funcea_in_module(func_ea, module_name),
+          lambda: scan_funcea_in_module(imports, func_ea, module_name))
+
+    bench("get_func_module",
+          lambda: imports.get_func_module(func_ea),
+          lambda: scan_func_module(imports, func_ea))
+
+    return failed == 0
+
+
+if __name__ == "__main__":
+    main()